@@ -0,0 +1,43 @@
+"""add streak submission counters
+
+Adds the denormalized 'last_submission_date' and 'submission_count' columns to 'art_streaks' and backfills them from
+'art_streak_submissions'.
+
+Revision ID: 538cce03a3c6
+Revises: 
+Create Date: 2026-10-18 03:18:07.017723
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '538cce03a3c6'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('art_streaks') as batch_op:
+        batch_op.add_column(sa.Column('last_submission_date', sa.Date(), nullable=True))
+        batch_op.add_column(sa.Column('submission_count', sa.Integer(), server_default='0', nullable=False))
+    # Backfill both counters from the existing submissions.
+    op.execute(
+        "UPDATE art_streaks SET "
+        "submission_count = (SELECT count(*) FROM art_streak_submissions "
+        "WHERE art_streak_submissions.art_streak_id = art_streaks.id), "
+        "last_submission_date = (SELECT max(creation_date) FROM art_streak_submissions "
+        "WHERE art_streak_submissions.art_streak_id = art_streaks.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('art_streaks') as batch_op:
+        batch_op.drop_column('submission_count')
+        batch_op.drop_column('last_submission_date')
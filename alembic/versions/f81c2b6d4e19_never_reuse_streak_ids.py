@@ -0,0 +1,42 @@
+"""never reuse streak ids
+
+Revision ID: f81c2b6d4e19
+Revises: e3b7d5a91f04
+Create Date: 2026-10-18 09:12:44.207315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f81c2b6d4e19'
+down_revision: Union[str, Sequence[str], None] = 'e3b7d5a91f04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# hot tables and the archive tables their rows are moved to with their ids
+TABLES = (('art_streaks', 'archived_streaks'), ('art_streak_submissions', 'archived_submissions'))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Archived streaks and submissions keep the id they had in the hot tables. Without AUTOINCREMENT sqlite hands out
+    # the highest id again once its row has been archived, and the next archival of that id fails. sqlite can only add
+    # AUTOINCREMENT by rebuilding the table.
+    for table, archive in TABLES:
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+        # continue after the highest id in use, archived ones included
+        op.execute(f"DELETE FROM sqlite_sequence WHERE name = '{table}'")
+        op.execute(f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', "
+                   f"MAX(COALESCE((SELECT MAX(id) FROM {table}), 0), COALESCE((SELECT MAX(id) FROM {archive}), 0))")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, archive in TABLES:
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
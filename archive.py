@@ -0,0 +1,113 @@
+# Archival of ended art streaks. Streaks that ended more than ARCHIVE_RETENTION_DAYS ago are only ever read again by
+# 'streakstats', so the daily 'archive_streaks' job moves them out of the hot tables: every streak becomes one summary
+# row in 'archived_streaks' and its submissions move to 'archived_submissions'. 'queries.user_streak_stats' reads both,
+# so the stats don't change when a streak is archived.
+#
+# The streaks are moved in small batches, each one a write of its own through the group commit writer in 'writer.py', so
+# the job never holds sqlite's write lock for longer than one group commit and the commands' writes are interleaved with
+# it. The pages freed by the moves are handed back to the file system with sqlite's incremental vacuum, again a bounded
+# number of pages per write, instead of a full VACUUM that would lock the database while it rewrites the whole file.
+# Incremental vacuum needs the database to be in 'auto_vacuum = INCREMENTAL' mode, which the migration that added the
+# archive tables switches it to.
+#
+# Configuration (all optional, read from the environment or the .env file):
+#
+#  - ARCHIVE_RETENTION_DAYS: days an ended streak stays in the hot tables. Defaults to 90.
+#  - ARCHIVE_BATCH: streaks moved per write. Defaults to 100.
+#  - ARCHIVE_VACUUM_PAGES: pages freed per write. Defaults to 256, one MiB with sqlite's default page size.
+#  - ARCHIVE_HOUR: hour of the day (UTC) the job runs at. Defaults to 9.
+import datetime
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import select, insert, delete, false
+from sqlalchemy.orm import Session
+
+from models import ArtStreak, ArtStreakSubmission, ArchivedStreak, ArchivedSubmission
+from sharding import ShardSet
+
+load_dotenv()
+
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "100"))
+ARCHIVE_VACUUM_PAGES = int(os.getenv("ARCHIVE_VACUUM_PAGES", "256"))
+ARCHIVE_HOUR = int(os.getenv("ARCHIVE_HOUR", "9"))
+
+# value of 'PRAGMA auto_vacuum' in incremental mode
+_INCREMENTAL = 2
+
+
+"""
+# Moves one batch of ended streaks that are past the retention window, together with their submissions, into the archive
+# tables. The oldest streaks are moved first. The caller is responsible for committing the session.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# cutoff; Expected Type: datetime.date - streaks that ended before this date are archived
+# shards; Expected Type: sharding.ShardSet - only archive the streaks of guilds on these shards
+# limit; Expected Type: int - most streaks moved, has to stay below sqlite's limit on bound parameters
+# @Returns:
+# tuple of the number of streaks and the number of submissions moved. Fewer streaks than 'limit' means there's nothing
+# left to archive.
+"""
+def archive_streaks(session: Session, cutoff: datetime.date, shards: ShardSet,
+                    limit: int = ARCHIVE_BATCH) -> tuple[int, int]:
+    streakIds = list(session.scalars(
+        select(ArtStreak.id)
+        .where(ArtStreak.active == false(), ArtStreak.end_date < cutoff, shards.clause(ArtStreak.guild_id))
+        .order_by(ArtStreak.end_date)
+        .limit(limit)))
+    if not streakIds:
+        return 0, 0
+    # links to the first and the last submission, picked straight from the submissions' (streak, date) index
+    firstLink = select(ArtStreakSubmission.message_link)\
+        .where(ArtStreakSubmission.art_streak_id == ArtStreak.id)\
+        .order_by(ArtStreakSubmission.creation_date, ArtStreakSubmission.id).limit(1).scalar_subquery()
+    lastLink = select(ArtStreakSubmission.message_link)\
+        .where(ArtStreakSubmission.art_streak_id == ArtStreak.id)\
+        .order_by(ArtStreakSubmission.creation_date.desc(), ArtStreakSubmission.id.desc()).limit(1).scalar_subquery()
+    session.execute(insert(ArchivedStreak).from_select(
+        ["id", "guild_id", "user_id", "creation_date", "end_date", "duration", "submission_count",
+         "first_message_link", "last_message_link"],
+        select(ArtStreak.id, ArtStreak.guild_id, ArtStreak.user_id, ArtStreak.creation_date, ArtStreak.end_date,
+               ArtStreak.get_duration(), ArtStreak.submission_count, firstLink, lastLink)
+        .where(ArtStreak.id.in_(streakIds))))
+    submissions = session.execute(insert(ArchivedSubmission).from_select(
+        ["id", "art_streak_id", "creation_date", "message_link"],
+        select(ArtStreakSubmission.id, ArtStreakSubmission.art_streak_id, ArtStreakSubmission.creation_date,
+               ArtStreakSubmission.message_link)
+        .where(ArtStreakSubmission.art_streak_id.in_(streakIds)))).rowcount
+    session.execute(delete(ArtStreakSubmission).where(ArtStreakSubmission.art_streak_id.in_(streakIds))
+                    .execution_options(synchronize_session=False))
+    session.execute(delete(ArtStreak).where(ArtStreak.id.in_(streakIds)).execution_options(synchronize_session=False))
+    return len(streakIds), submissions
+
+
+"""
+# Returns whether the database is in incremental auto vacuum mode. Databases created before the archive tables were
+# added stay in the default mode until the migration that added them has been run.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the pragma is read on
+"""
+def vacuum_enabled(session: Session) -> bool:
+    return session.connection().exec_driver_sql("PRAGMA auto_vacuum").scalar() == _INCREMENTAL
+
+
+"""
+# Hands up to 'pages' free pages of the database file back to the file system. The caller is responsible for
+# committing the session.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# pages; Expected Type: int - most pages freed
+# @Returns:
+# tuple of the number of pages freed and the number of free pages left
+"""
+def incremental_vacuum(session: Session, pages: int = ARCHIVE_VACUUM_PAGES) -> tuple[int, int]:
+    connection = session.connection()
+    free = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+    # sqlite frees one page every time the pragma's statement is stepped, but python's sqlite3 module only steps
+    # statements that don't return columns once, so 'incremental_vacuum(n)' would free a single page. Asking for one
+    # page at a time frees exactly as many as requested.
+    for _ in range(min(pages, free)):
+        connection.exec_driver_sql("PRAGMA incremental_vacuum(1)")
+    remaining = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+    return free - remaining, remaining
@@ -0,0 +1,3 @@
+# Standalone benchmark scripts. Run them from the repository root, e.g. 'python -m benchmarks.check_streaks'. The
+# 'suite' package benchmarks every command and scheduled job at once, see 'python -m benchmarks.suite --help', and the
+# 'replay' package load tests the bot with captured gateway traffic, see 'python -m benchmarks.replay --help'.
@@ -0,0 +1,103 @@
+# Memory benchmark for relaying 'submitart' attachments. A local aiohttp server stands in for both the discord CDN (it
+# streams out files of the requested size) and the discord upload endpoint (it reads multipart uploads and throws them
+# away). A batch of files is then relayed concurrently twice: once the way 'submitart' used to do it, with a new client
+# session per file, 'resp.read()' and a BytesIO wrapper, and once through 'media.fetch_attachment' and the shared client.
+# The peak of traced python memory and the wall time of each run are printed.
+#
+# Run it from the repository root with 'python -m benchmarks.attachment_memory'.
+import argparse
+import asyncio
+import io
+import time
+import tracemalloc
+
+import aiohttp
+from aiohttp import web
+
+import media
+
+BLOCK = b"\0" * media.CHUNK_SIZE
+
+
+async def serve_file(request: web.Request) -> web.StreamResponse:
+    size = int(request.match_info["size"])
+    resp = web.StreamResponse(headers={"Content-Length": str(size), "Content-Type": "audio/mpeg"})
+    await resp.prepare(request)
+    sent = 0
+    while sent < size:
+        chunk = BLOCK[:min(len(BLOCK), size - sent)]
+        await resp.write(chunk)
+        sent += len(chunk)
+    await resp.write_eof()
+    return resp
+
+
+async def sink_upload(request: web.Request) -> web.Response:
+    received = 0
+    async for chunk in request.content.iter_chunked(media.CHUNK_SIZE):
+        received += len(chunk)
+    return web.json_response({"received": received})
+
+
+"""
+# Relays one file the way 'submitart' used to: a fresh client session, the whole body read into memory and wrapped in a
+# BytesIO for the upload.
+"""
+async def relay_buffered(base: str, size: int):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{base}/file/{size}") as resp:
+            data = await resp.read()
+            with io.BytesIO(data) as file:
+                form = aiohttp.FormData()
+                form.add_field("files[0]", file, filename="art.mp3")
+                async with session.post(f"{base}/upload", data=form) as upload:
+                    await upload.read()
+
+
+"""
+# Relays one file through the shared client, streaming it into a spooled temporary file before uploading it.
+"""
+async def relay_streamed(base: str, size: int):
+    with await media.fetch_attachment(f"{base}/file/{size}") as file:
+        form = aiohttp.FormData()
+        form.add_field("files[0]", file, filename="art.mp3")
+        async with media.get_session().post(f"{base}/upload", data=form) as upload:
+            await upload.read()
+
+
+async def run(relay, base: str, files: int, size: int) -> (float, float):
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*[relay(base, size) for _ in range(files)])
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+async def main(files: int, size: int):
+    app = web.Application(client_max_size=size * 2)
+    app.router.add_get("/file/{size}", serve_file)
+    app.router.add_post("/upload", sink_upload)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for label, relay in (("buffered (old)", relay_buffered), ("streamed (shared client)", relay_streamed)):
+            peak, elapsed = await run(relay, base, files, size)
+            print(f"{label:>26}: peak traced memory {peak / 1024 / 1024:8.1f} MiB, {elapsed:6.2f} s "
+                  f"for {files} x {size / 1000 / 1000:.0f} MB")
+    finally:
+        await media.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure memory use of relaying attachments.")
+    parser.add_argument("--files", type=int, default=8, help="number of files relayed concurrently")
+    parser.add_argument("--size", type=int, default=25 * 1000 * 1000, help="size of every file in bytes")
+    args = parser.parse_args()
+    asyncio.run(main(args.files, args.size))
@@ -0,0 +1,86 @@
+# Benchmark for the nightly streak check. Builds a throwaway sqlite database with a configurable number of active streaks
+# and submissions, then times a single run of 'streaks.evaluate_streaks' against it. With '--missed-days' it times
+# 'streaks.catch_up_streaks' catching up on that many missed checks instead.
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+import models
+import streaks
+
+
+"""
+# Fills the database with one guild per 1000 streaks, the requested number of active streaks and the requested number
+# of submissions per streak. About one streak in ten has no recent submission so both the freeze and the termination
+# paths get exercised.
+# @Params:
+# engine; Expected Type: sqlalchemy.Engine - engine pointing at the benchmark database
+# num_streaks; Expected Type: int - number of active streaks to create
+# submissions_per_streak; Expected Type: int - number of submissions to create for every streak
+# today; Expected Type: datetime.date - the date the check will be run for
+"""
+def populate(engine, num_streaks: int, submissions_per_streak: int, today: datetime.date):
+    rng = random.Random(0)
+    numGuilds = max(1, num_streaks // 1000)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Guild), [{"id": i, "art_channel_id": i} for i in range(numGuilds)])
+        # The most recent submission of every streak is either today, yesterday, or old enough to count as missed.
+        newest = [rng.choices([0, 1, 3], weights=[45, 45, 10])[0] for _ in range(num_streaks)]
+        conn.execute(insert(models.ArtStreak), [
+            {"id": i, "guild_id": i % numGuilds, "user_id": i, "active": True, "freezes": rng.randint(0, 2),
+             "creation_date": today - datetime.timedelta(submissions_per_streak + 2),
+             "last_submission_date": today - datetime.timedelta(newest[i]),
+             "submission_count": submissions_per_streak}
+            for i in range(num_streaks)
+        ])
+        batch = []
+        for streakId in range(num_streaks):
+            for day in range(submissions_per_streak):
+                batch.append({"art_streak_id": streakId, "user_id": streakId, "message_link": "",
+                              "creation_date": today - datetime.timedelta(newest[streakId] + day)})
+            if len(batch) >= 200_000:
+                conn.execute(insert(models.ArtStreakSubmission), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(models.ArtStreakSubmission), batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the nightly streak check.")
+    parser.add_argument("--streaks", type=int, default=100_000)
+    parser.add_argument("--submissions", type=int, default=20, help="submissions per streak")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="date the check is run for, in ISO format")
+    parser.add_argument("--missed-days", type=int, default=1,
+                        help="number of missed checks to catch up on, 1 runs the regular nightly check")
+    args = parser.parse_args()
+
+    today = args.date
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        models.Base.metadata.create_all(engine)
+        print(f"Populating {args.streaks} streaks with {args.streaks * args.submissions} submissions...")
+        populate(engine, args.streaks, args.submissions, today)
+        with Session(engine) as session:
+            start = time.perf_counter()
+            if args.missed_days > 1:
+                outcomes = streaks.catch_up_streaks(session, today - datetime.timedelta(args.missed_days), today)
+                frozen = [outcome for outcome in outcomes if outcome.end_date is None]
+                terminated = [outcome for outcome in outcomes if outcome.end_date is not None]
+            else:
+                frozen, terminated = streaks.evaluate_streaks(session, today)
+            session.commit()
+            elapsed = time.perf_counter() - start
+        print(f"Streak check over {args.missed_days} day(s) took {elapsed * 1000:.1f} ms "
+              f"({len(frozen)} frozen, {len(terminated)} terminated)")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
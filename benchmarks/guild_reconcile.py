@@ -0,0 +1,145 @@
+# Benchmark of the guild reconciliation 'on_ready' runs at startup. Builds a throwaway sqlite database with a configurable
+# number of registered guilds, each with a few art streaks, submissions and vc notif subscribers, and a gateway guild
+# list that differs from it by a few percent in both directions, like after the bot was down for a while. Both ways of
+# reconciling them are timed on a copy of the database:
+#
+#  - before: every registered guild looked up in the gateway list with 'discord.utils.get', one query per gateway guild
+#    to see if it's registered, and the differences added and deleted row by row.
+#  - set difference: 'writes.reconcile_guilds', one query for the registered ids and bulk inserts and deletes.
+#
+# Afterwards it checks that the set difference left exactly the gateway guilds registered and no streaks, submissions or
+# subscriptions of removed guilds behind, and exits with a non-zero status if not.
+#
+# Run it from the repository root with 'python -m benchmarks.guild_reconcile'.
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import discord
+from sqlalchemy import create_engine, insert, select, delete, text
+from sqlalchemy.orm import Session
+
+import models
+import sharding
+import writes
+
+TODAY = datetime.date(2024, 11, 16)
+
+
+"""
+# Stand in for a 'discord.Guild' from the gateway cache.
+"""
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = str(guild_id)
+
+
+"""
+# Fills the database with the registered guilds, two streaks with three submissions each and two subscribers per guild.
+# @Params:
+# engine; Expected Type: sqlalchemy.Engine - engine pointing at the benchmark database
+# guild_ids; Expected Type: [int] - ids of the registered guilds
+"""
+def populate(engine, guild_ids: list):
+    models.Base.metadata.create_all(engine)
+    streakRows = [{"id": len(guild_ids) * n + i + 1, "guild_id": guildId, "user_id": i, "creation_date": TODAY}
+                  for n in range(2) for i, guildId in enumerate(guild_ids)]
+    with engine.begin() as conn:
+        conn.execute(insert(models.Guild), [{"id": guildId} for guildId in guild_ids])
+        conn.execute(insert(models.User), [{"id": i} for i in range(len(guild_ids) + 1)])
+        conn.execute(insert(models.subscriber_association_table), [
+            {"guild_id": guildId, "user_id": i + n} for n in range(2) for i, guildId in enumerate(guild_ids)])
+        conn.execute(insert(models.ArtStreak), streakRows)
+        conn.execute(insert(models.ArtStreakSubmission), [
+            {"art_streak_id": row["id"], "user_id": row["user_id"], "creation_date": TODAY, "message_link": ""}
+            for row in streakRows for _ in range(3)])
+
+
+"""
+# The reconciliation as 'on_ready' did it before, statement for statement.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session on the benchmark database
+# gateway; Expected Type: [FakeGuild] - the guilds the bot is connected to
+"""
+def reconcile_before(session: Session, gateway: list):
+    guilds = session.scalars(select(models.Guild)).all()
+    guildsToDelete = [guild for guild in guilds if discord.utils.get(gateway, id=guild.id) is None]
+    discordGuilds = [guild for guild in gateway
+                     if session.execute(select(models.Guild.id).filter(models.Guild.id.in_([guild.id]))).first() is None]
+    for guild in guildsToDelete:
+        session.execute(delete(models.Guild).filter(models.Guild.id == guild.id))
+    session.commit()
+    for guild in discordGuilds:
+        session.add(models.Guild(id=guild.id))
+    session.commit()
+
+
+def leftovers(engine) -> dict:
+    with engine.connect() as conn:
+        return {
+            "streaks": conn.scalar(text("SELECT count(*) FROM art_streaks WHERE guild_id NOT IN (SELECT id FROM guilds)")),
+            "submissions": conn.scalar(text("SELECT count(*) FROM art_streak_submissions "
+                                            "WHERE art_streak_id NOT IN (SELECT id FROM art_streaks)")),
+            "subscriptions": conn.scalar(text("SELECT count(*) FROM subscriber_association_table "
+                                              "WHERE guild_id NOT IN (SELECT id FROM guilds)")),
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the startup guild reconciliation.")
+    parser.add_argument("--guilds", type=int, default=10_000, help="registered guilds")
+    parser.add_argument("--churn", type=float, default=0.05,
+                        help="share of guilds left and joined while the bot was down")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    registered = rng.sample(range(1 << 40), args.guilds)
+    changed = int(args.guilds * args.churn)
+    left = set(registered[:changed])
+    gatewayIds = [guildId for guildId in registered if guildId not in left] + \
+                 [guildId + (1 << 41) for guildId in rng.sample(range(1 << 40), changed)]
+    gateway = [FakeGuild(guildId) for guildId in gatewayIds]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "before.db")
+        engine = create_engine(f"sqlite:///{path}")
+        populate(engine, registered)
+        engine.dispose()
+        shutil.copy(path, os.path.join(tmp, "after.db"))
+
+        engine = create_engine(f"sqlite:///{path}")
+        with Session(engine) as session:
+            start = time.perf_counter()
+            reconcile_before(session, gateway)
+            before = time.perf_counter() - start
+        beforeLeftovers = leftovers(engine)
+        engine.dispose()
+
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'after.db')}")
+        with Session(engine) as session:
+            start = time.perf_counter()
+            artChannels, added, removed = writes.reconcile_guilds(session, {guild.id for guild in gateway},
+                                                                  sharding.ShardSet())
+            session.commit()
+            after = time.perf_counter() - start
+        afterLeftovers = leftovers(engine)
+        with engine.connect() as conn:
+            stored = set(conn.scalars(text("SELECT id FROM guilds")))
+        engine.dispose()
+
+    print(f"{args.guilds} registered guilds, {changed} left and {changed} joined")
+    print(f"        before: {before * 1000:9.1f} ms, left behind {beforeLeftovers}")
+    print(f"set difference: {after * 1000:9.1f} ms, left behind {afterLeftovers}, {added} registered, {removed} removed")
+    consistent = stored == set(gatewayIds) and set(artChannels) == stored and not any(afterLeftovers.values())
+    print(f"registered guilds {'match' if consistent else 'DO NOT match'} the gateway")
+    return 0 if consistent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# Micro-benchmark of the logging overhead per command. A simulated command logs what a typical 'submitart' used to
+# produce: a couple of info lines, the SQL statements it runs and the gateway event that delivered it, with discord.py at
+# DEBUG level like in the old poke_bot.log files. It's run once with the old setup, where everything is formatted and
+# written synchronously by the calling thread, then through 'logconfig', where the calling thread only queues the
+# records, both with the same levels and with logconfig's default levels. The time the calling thread spends per command
+# is printed for every run, together with the time the listener thread needed to drain the queue afterwards.
+#
+# Run it from the repository root with 'python -m benchmarks.logging_overhead'.
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import logconfig
+
+STATEMENTS = [
+    "SELECT art_streaks.id, art_streaks.guild_id, art_streaks.user_id FROM art_streaks WHERE art_streaks.guild_id = ?",
+    "INSERT INTO art_streak_submissions (art_streak_id, creation_date, user_id, message_link) VALUES (?, ?, ?, ?)",
+    "UPDATE art_streaks SET submission_count=(art_streaks.submission_count + ?) WHERE art_streaks.id = ?",
+]
+
+
+"""
+# Builds a gateway event with a payload the size of a GUILD_CREATE for a mid sized guild.
+# @Params:
+# members; Expected Type: int - number of members in the payload
+"""
+def gateway_event(members: int) -> dict:
+    return {"t": "GUILD_CREATE", "s": 2, "op": 0, "d": {"members": [
+        {"user": {"username": f"user{i}", "id": str(10 ** 17 + i), "global_name": None, "bot": False},
+         "roles": [], "nick": None, "joined_at": "2024-09-22T19:43:07.887000+00:00", "flags": 0}
+        for i in range(members)]}}
+
+
+def command(event: dict):
+    app = logging.getLogger("pokebot.main")
+    gateway = logging.getLogger("discord.gateway")
+    sql = logging.getLogger("sqlalchemy.engine.Engine")
+    gateway.debug("For Shard ID %s: WebSocket Event: %s", None, event)
+    app.info("Registering %d new guild(s)...", 1)
+    for statement in STATEMENTS:
+        sql.info(statement)
+        sql.info("[cached since %.4gs ago] %r", 12.5, (1, 2, 3))
+    app.info("Guilds committed!")
+
+
+def reset():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    for name in ("discord", "discord.gateway", "sqlalchemy.engine", "sqlalchemy.engine.Engine", "pokebot"):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+
+
+"""
+# Times the commands with the old setup: a synchronous file handler at DEBUG level for discord.py and sqlalchemy's echo
+# writing every statement to stdout.
+"""
+def run_old(directory: str, event: dict, commands: int) -> (float, float):
+    reset()
+    formatter = logging.Formatter("[%(asctime)s] [%(levelname)-8s] %(name)s: %(message)s", "%Y-%m-%d %H:%M:%S")
+    fileHandler = logging.FileHandler(os.path.join(directory, "old.log"), encoding="utf-8")
+    fileHandler.setFormatter(formatter)
+    stdout = open(os.devnull, "w")
+    echoHandler = logging.StreamHandler(stdout)
+    echoHandler.setFormatter(formatter)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(fileHandler)
+    logging.getLogger("discord").setLevel(logging.DEBUG)
+    logging.getLogger("sqlalchemy.engine.Engine").addHandler(echoHandler)
+    start = time.perf_counter()
+    for _ in range(commands):
+        command(event)
+    elapsed = time.perf_counter() - start
+    logging.getLogger("sqlalchemy.engine.Engine").removeHandler(echoHandler)
+    stdout.close()
+    reset()
+    return elapsed / commands, 0.0
+
+
+"""
+# Times the commands through the queue based pipeline. By default discord.py is put at DEBUG level and sqlalchemy's
+# statement logging is turned on so the same records are produced as with the old setup.
+# @Params:
+# levels; Expected Type: str - per subsystem levels in the format of LOG_LEVELS
+"""
+def run_new(directory: str, event: dict, commands: int,
+            levels: str = "discord=DEBUG,sqlalchemy.engine=INFO") -> (float, float):
+    reset()
+    logconfig.LOG_LEVELS = levels
+    logconfig.LOG_CONSOLE_LEVEL = "CRITICAL"
+    logconfig.setup(os.path.join(directory, "new.log"))
+    start = time.perf_counter()
+    for _ in range(commands):
+        command(event)
+    elapsed = time.perf_counter() - start
+    drainStart = time.perf_counter()
+    dropped = logconfig.dropped()
+    logconfig.shutdown()
+    drained = time.perf_counter() - drainStart
+    reset()
+    if dropped:
+        print(f"  ({dropped} records dropped because the queue was full)")
+    return elapsed / commands, drained
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the logging overhead per command.")
+    parser.add_argument("--commands", type=int, default=1000, help="number of simulated commands")
+    parser.add_argument("--members", type=int, default=200, help="members in the simulated gateway payload")
+    args = parser.parse_args()
+    payload = gateway_event(args.members)
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = (
+            ("synchronous (old)", "old", lambda: run_old(tmp, payload, args.commands)),
+            ("queued, same levels", "new", lambda: run_new(tmp, payload, args.commands)),
+            ("queued, default levels", "new", lambda: run_new(tmp, payload, args.commands, "")),
+        )
+        for label, prefix, run in runs:
+            perCommand, drained = run()
+            size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp) if name.startswith(prefix))
+            print(f"{label:>22}: {perCommand * 1e6:8.1f} us per command on the calling thread, "
+                  f"{drained:.2f} s to drain afterwards, {size / 1024 / 1024:.1f} MiB written")
+            for name in os.listdir(tmp):
+                os.remove(os.path.join(tmp, name))
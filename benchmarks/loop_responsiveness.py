@@ -0,0 +1,109 @@
+# Shows that a long running query on the async data access layer doesn't stall the event loop. The same slow query is
+# run once through a plain synchronous session and once through the bot's own 'db.Session' while a ticker coroutine
+# measures how late the loop wakes it up. With 'db.Session' the worst delay should stay close to the tick interval; with
+# the synchronous session it grows to the full length of the query. The script exits with a non-zero status if the
+# worst delay seen with 'db.Session' is above the threshold.
+#
+# Run it from the repository root with 'python -m benchmarks.loop_responsiveness'.
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+# Recursive CTE that keeps sqlite busy for a while without needing any data.
+SLOW_QUERY = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :n) SELECT sum(x) FROM c")
+TICK = 0.01
+
+
+"""
+# Ticks every 'TICK' seconds until cancelled and records the worst delay between when a tick was due and when it ran.
+# @Params:
+# lags; Expected Type: [float] - list the worst observed delay is written into
+"""
+async def ticker(lags: [float]):
+    while True:
+        due = time.perf_counter() + TICK
+        await asyncio.sleep(TICK)
+        lags[0] = max(lags[0], time.perf_counter() - due)
+
+
+"""
+# Runs the given coroutine alongside the ticker and reports how long it took and the worst loop delay seen.
+# @Params:
+# label; Expected Type: str - name printed with the result
+# coro; Expected Type: coroutine - the work to measure
+# @Returns:
+# the worst loop delay in seconds
+"""
+async def measure(label: str, coro) -> float:
+    lags = [0.0]
+    tick = asyncio.create_task(ticker(lags))
+    await asyncio.sleep(TICK * 2)
+    start = time.perf_counter()
+    await coro
+    elapsed = time.perf_counter() - start
+    # Give the ticker a chance to wake up after the work so a fully blocked loop is recorded too.
+    await asyncio.sleep(TICK * 2)
+    tick.cancel()
+    print(f"{label}: query took {elapsed * 1000:.0f} ms, worst loop delay {lags[0] * 1000:.1f} ms")
+    return lags[0]
+
+
+"""
+# Measures the loop delay with the synchronous session and with 'db.Session'.
+# @Params:
+# db; Expected Type: module - the bot's data access layer, imported against the scratch database
+# sync_engine; Expected Type: sqlalchemy.Engine - synchronous engine on the same database
+# rows; Expected Type: int - rows generated by the slow query
+# @Returns:
+# the worst loop delay in seconds seen with 'db.Session'
+"""
+async def run(db, sync_engine, rows: int) -> float:
+    async def run_sync():
+        with Session(sync_engine) as session:
+            session.execute(SLOW_QUERY, {"n": rows}).scalar()
+
+    async def run_async():
+        async with db.Session() as session:
+            await session.scalar(SLOW_QUERY, {"n": rows})
+
+    try:
+        await measure("sync Session", run_sync())
+        return await measure("db.Session", run_async())
+    finally:
+        await db.engine.dispose()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure event loop responsiveness during a slow query.")
+    parser.add_argument("--rows", type=int, default=3_000_000, help="rows generated by the slow query")
+    parser.add_argument("--max-lag", type=float, default=50,
+                        help="worst loop delay in ms allowed while db.Session runs the query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        # 'db.py' reads its configuration when it's imported
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+        db = importlib.import_module("db")
+        syncEngine = create_engine(f"sqlite:///{path}")
+        try:
+            lag = asyncio.run(run(db, syncEngine, args.rows))
+        finally:
+            syncEngine.dispose()
+
+    if lag * 1000 > args.max_lag:
+        print(f"db.Session stalled the event loop for {lag * 1000:.1f} ms, more than {args.max_lag:g} ms")
+        return 1
+    print(f"db.Session kept the event loop responsive (threshold {args.max_lag:g} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
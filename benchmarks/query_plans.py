@@ -0,0 +1,186 @@
+# Query plan regression check for the hot queries. Every statement issued by 'submitart', 'streakstats', the
+# subscription commands, the vc notifications, 'check_streaks' (including its catch-up), 'push_reminder',
+# 'archive_streaks' and 'export_streaks' is captured while running against a scratch database built from 'models.py',
+# then run through sqlite's EXPLAIN QUERY PLAN. The script exits with a non-zero status if any of them falls back to a
+# full SCAN of one of the large tables.
+#
+# Run it from the repository root with 'python -m benchmarks.query_plans'.
+import datetime
+import os
+import re
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import Session
+
+import archive
+import models
+import queries
+import sharding
+import streaks
+import writes
+
+# Tables that grow with usage and must never be scanned in full by a hot query.
+LARGE_TABLES = {"art_streaks", "art_streak_submissions", "users", "subscriber_association_table", "job_leases",
+                "archived_streaks", "archived_submissions"}
+# Partial indexes that only cover active streaks. Walking one of these is the cheapest way to visit every active streak,
+# so a SCAN through them is accepted.
+PARTIAL_INDEXES = {"ix_art_streaks_active_timezone_last_submission_date", "ix_art_streaks_inactive_end_date"}
+
+# A saturday. The nightly check is run for it and for the following sunday so the terminations, the freeze decrements
+# and the sunday freeze renewal are all issued.
+CHECK_DATE = datetime.date(2024, 11, 16)
+# Just past midnight after CHECK_DATE in the default timezone, so its bucket is due.
+CHECK_TIME = datetime.datetime(2024, 11, 17, 7, 5, tzinfo=datetime.timezone.utc)
+# Message link of the submissions the 'submitart' case records
+MESSAGE_LINK = "https://discord.com/channels/1/1/1"
+# One shard of a bot running four of them.
+SHARD = sharding.ShardSet(4, [1])
+
+
+"""
+# Lists the query paths to check. Every entry pairs a label with a function that issues the same statements as the
+# corresponding command or job.
+"""
+def cases() -> list:
+    guildId = 1
+    userId = 1
+    newUserId = 5
+    return [
+        ("submitart", lambda session: (
+            session.scalar(queries.active_streak(guildId, userId)),
+            writes.record_submission(session, guildId, userId, models.DEFAULT_TIMEZONE, CHECK_DATE, MESSAGE_LINK),
+            # a user without a running streak has their timezone looked up and starts a new one
+            session.scalar(queries.active_streak(guildId, newUserId)),
+            # the art channel is read from the db while the guild config cache isn't loaded yet
+            session.get(models.Guild, guildId),
+            session.get(models.User, newUserId),
+            writes.record_submission(session, guildId, newUserId, models.DEFAULT_TIMEZONE, CHECK_DATE, MESSAGE_LINK),
+        )),
+        ("streakstats", lambda session: (
+            session.execute(queries.user_streak_stats(guildId, userId)).one(),
+        )),
+        ("subscriptions", lambda session: (
+            session.scalar(queries.subscription(guildId, userId)),
+            writes.set_subscription(session, userId, guildId, False),
+            writes.set_subscription(session, userId, guildId, True, True),
+        )),
+        ("vc notifications", lambda session: (
+            session.scalars(queries.guild_subscribers(guildId)).all(),
+        )),
+        ("check_streaks", lambda session: (
+            streaks.due_checks(session, CHECK_TIME),
+            streaks.evaluate_streaks(session, CHECK_DATE, models.DEFAULT_TIMEZONE),
+            streaks.evaluate_streaks(session, CHECK_DATE + datetime.timedelta(1), models.DEFAULT_TIMEZONE),
+            streaks.mark_checked(session, models.DEFAULT_TIMEZONE, CHECK_DATE + datetime.timedelta(1), None,
+                                 CHECK_DATE - datetime.timedelta(1)),
+            session.flush(),
+        )),
+        ("check_streaks catch-up", lambda session: (
+            streaks.catch_up_streaks(session, CHECK_DATE - datetime.timedelta(5), CHECK_DATE + datetime.timedelta(1),
+                                     models.DEFAULT_TIMEZONE),
+        )),
+        ("check_streaks sharded", lambda session: (
+            streaks.due_checks(session, CHECK_TIME, SHARD),
+            streaks.evaluate_streaks(session, CHECK_DATE, models.DEFAULT_TIMEZONE, SHARD),
+            sharding.acquire_lease(session, "check_streaks", 1, CHECK_TIME.replace(tzinfo=None)),
+            sharding.finish_lease(session, "check_streaks", 1, CHECK_TIME.replace(tzinfo=None)),
+        )),
+        ("push_reminder", lambda session: (
+            streaks.active_timezones(session),
+            streaks.find_unfulfilled(session, CHECK_DATE, models.DEFAULT_TIMEZONE),
+        )),
+        ("archive_streaks", lambda session: (
+            archive.archive_streaks(session, CHECK_DATE, sharding.ShardSet()),
+        )),
+        ("export_streaks", lambda session: [
+            session.execute(statement).all() for _, _, statement in queries.guild_export(guildId)
+        ]),
+    ]
+
+
+"""
+# Seeds the scratch database with a guild, a subscriber and a handful of streaks so every code path, including the bulk
+# updates of the nightly check, actually issues its statements.
+# @Params:
+# engine; Expected Type: sqlalchemy.Engine - engine pointing at the scratch database
+"""
+def seed(engine):
+    longAgo = CHECK_DATE - datetime.timedelta(10)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Guild), [{"id": 1, "art_channel_id": 1}])
+        conn.execute(insert(models.User), [{"id": 1}])
+        conn.execute(insert(models.subscriber_association_table), [{"user_id": 1, "guild_id": 1}])
+        conn.execute(insert(models.StreakCheckBucket), [{"timezone": models.DEFAULT_TIMEZONE,
+                                                         "last_check_date": CHECK_DATE - datetime.timedelta(1)}])
+        conn.execute(insert(models.ArtStreak), [
+            {"id": 1, "guild_id": 1, "user_id": 1, "creation_date": longAgo, "last_submission_date": longAgo,
+             "freezes": 0},
+            {"id": 2, "guild_id": 1, "user_id": 2, "creation_date": longAgo, "last_submission_date": longAgo,
+             "freezes": 1},
+            {"id": 3, "guild_id": 1, "user_id": 3, "creation_date": longAgo, "last_submission_date": CHECK_DATE,
+             "freezes": 2},
+        ])
+        # an ended streak past the archival job's cutoff
+        conn.execute(insert(models.ArtStreak), [
+            {"id": 4, "guild_id": 1, "user_id": 1, "creation_date": longAgo - datetime.timedelta(30),
+             "end_date": longAgo - datetime.timedelta(20), "active": False, "last_submission_date": longAgo,
+             "freezes": 0},
+        ])
+
+
+"""
+# Returns the plan lines that scan a large table in full.
+# @Params:
+# plan; Expected Type: [str] - detail column of EXPLAIN QUERY PLAN
+"""
+def full_scans(plan: [str]) -> [str]:
+    offending = []
+    for detail in plan:
+        match = re.match(r"SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?", detail)
+        if match is None or match.group(1) not in LARGE_TABLES:
+            continue
+        if match.group(2) not in PARTIAL_INDEXES:
+            offending.append(detail)
+    return offending
+
+
+def main() -> int:
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+        models.Base.metadata.create_all(engine)
+        seed(engine)
+        captured = []
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            # executemany batches share one plan, the first parameter set is enough to explain it
+            captured.append((statement, parameters[0] if executemany else parameters))
+
+        for label, issue in cases():
+            captured.clear()
+            with Session(engine) as session:
+                issue(session)
+                session.rollback()
+            statements = list(captured)
+            print(f"== {label}")
+            with engine.connect() as conn:
+                for statement, parameters in statements:
+                    plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                    offending = full_scans(plan)
+                    failures += len(offending)
+                    print(f"  [{'FAIL' if offending else 'ok'}] {' '.join(statement.split())[:100]}")
+                    for detail in plan:
+                        print(f"      {detail}")
+        engine.dispose()
+    if failures:
+        print(f"{failures} full table scan(s) on large tables found.")
+        return 1
+    print("No full table scans on large tables.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,13 @@
+# Replay load test. Feeds gateway traffic captured in the bot's 'poke_bot.log' files, or a synthetic capture in the same
+# format, through a local fake discord (see 'fakes.py') into the bot's real entry point: the bot logs in against a REST
+# stand-in, connects its shards to a fake gateway that hands it the captured guilds, and then receives the captured voice
+# chat, interaction and message events on their original schedule, sped up by '--speed'. '--fan-out N' serves N copies of
+# every guild and its events under fresh ids, for loads beyond what was captured. The report covers startup, how many
+# events were delivered and how late, the time discord would have waited for every interaction response, the REST
+# calls made and the event loop lag.
+#
+# Captures only contain gateway payloads if discord.py's DEBUG logging was on (LOG_LEVELS=discord.gateway=DEBUG), and
+# 'logconfig.py' samples and truncates those records; see 'capture.py'.
+#
+# Run it from the repository root with 'python -m benchmarks.replay [poke_bot.log.3 poke_bot.log.2 ...]', '--help' lists
+# the options.
@@ -0,0 +1,6 @@
+# Entry point of 'python -m benchmarks.replay', see 'runner.py'.
+import sys
+
+from benchmarks.replay import runner
+
+sys.exit(runner.main())
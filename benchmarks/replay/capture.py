@@ -0,0 +1,169 @@
+# Gateway captures for the replay load test. discord.py logs every gateway event it receives at DEBUG level as
+# 'For Shard ID <id>: WebSocket Event: <payload>' with the payload as a python dict repr. 'read' pulls those records out
+# of 'poke_bot.log' files, both the JSON lines 'logconfig.py' writes and the older plain text format, and 'Capture' sorts
+# them into what the fake gateway serves: a READY template, the latest GUILD_CREATE and member list of every guild and
+# the timed stream of every other dispatch.
+#
+# The bot only logs one in LOG_GATEWAY_SAMPLE gateway events and truncates messages longer than LOG_MAX_MESSAGE
+# characters (see 'logconfig.py'), so a production capture is a sample of the traffic and large payloads are cut off.
+# Payloads that can't be parsed are skipped and counted. Run the bot with LOG_GATEWAY_SAMPLE=1 and a raised
+# LOG_MAX_MESSAGE for a complete capture, or generate one with 'synthetic.py'.
+import ast
+import collections
+import datetime
+import json
+import re
+
+# What discord.py puts in front of the payload
+GATEWAY_MARKER = "WebSocket Event: "
+# Records of the plain text format the bot logged in before 'logconfig.py'
+_TEXT_RECORD = re.compile(r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] \[\w+\s*\] discord\.gateway: ")
+# Events the fake gateway sends while a shard connects instead of replaying them on their own
+HANDSHAKE_EVENTS = {"READY", "RESUMED", "GUILD_CREATE", "GUILD_MEMBERS_CHUNK"}
+# Bot user served when the capture has no READY in it
+DEFAULT_USER = {"id": "1", "username": "replay", "discriminator": "0", "global_name": None, "avatar": None,
+                "bot": True, "verified": True, "mfa_enabled": False, "flags": 0}
+
+
+"""
+# Splits a log line into the time of the record and the payload text if it's a gateway event record.
+# @Params:
+# line; Expected Type: str - one line of a log file
+# @Returns:
+# a (datetime.datetime, str) tuple, None for every other record
+"""
+def parse_line(line: str):
+    if GATEWAY_MARKER not in line:
+        return None
+    if line.startswith("{"):
+        record = json.loads(line)
+        if not record.get("logger", "").startswith("discord.gateway"):
+            return None
+        message = record.get("message", "")
+        at = datetime.datetime.fromisoformat(record["time"])
+    else:
+        match = _TEXT_RECORD.match(line)
+        if match is None:
+            return None
+        message = line[match.end():]
+        at = datetime.datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S").replace(tzinfo=datetime.timezone.utc)
+    index = message.find(GATEWAY_MARKER)
+    if index < 0:
+        return None
+    return at, message[index + len(GATEWAY_MARKER):].rstrip("\n")
+
+
+"""
+# Reads the gateway dispatches out of log files.
+# @Params:
+# paths; Expected Type: [str] - log files to read, e.g. 'poke_bot.log.3 poke_bot.log.2 poke_bot.log.1 poke_bot.log'
+# @Returns:
+# a list of (datetime.datetime, dict) tuples sorted by time, and the number of gateway records that couldn't be parsed
+"""
+def read(paths: list) -> tuple:
+    records = []
+    skipped = 0
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    parsed = parse_line(line)
+                    if parsed is None:
+                        continue
+                    at, text = parsed
+                    payload = ast.literal_eval(text)
+                except (ValueError, SyntaxError, KeyError, MemoryError, RecursionError):
+                    # truncated by the log's message limit or not a gateway payload after all
+                    skipped += 1
+                    continue
+                # only dispatches carry events, hellos and heartbeat acks are left to the fake gateway
+                if isinstance(payload, dict) and payload.get("op") == 0 and payload.get("t"):
+                    records.append((at, payload))
+    records.sort(key=lambda record: record[0])
+    return records, skipped
+
+
+"""
+# The gateway traffic of a capture, sorted into the handshake state and the stream of events replayed over time.
+# @Params:
+# records; Expected Type: [(datetime.datetime, dict)] - dispatches as returned by 'read'
+# skipped; Expected Type: int - gateway records that couldn't be parsed
+# max_gap; Expected Type: float - longest pause in seconds kept between two streamed events, None to keep every pause
+"""
+class Capture:
+    def __init__(self, records: list, skipped: int = 0, max_gap: float = None):
+        self.skipped = skipped
+        self.counts = collections.Counter(payload["t"] for _, payload in records)
+        self.ready = None
+        self.guilds = {}
+        self.members = collections.defaultdict(dict)
+        # (seconds since the first streamed event, event type, payload data)
+        self.stream = []
+        offset = 0.0
+        last = None
+        for at, payload in records:
+            eventType, data = payload["t"], payload.get("d") or {}
+            if eventType == "READY":
+                self.ready = data
+            elif eventType == "GUILD_CREATE":
+                if not data.get("unavailable"):
+                    self.guilds[data["id"]] = data
+                    self._add_members(data["id"], data.get("members", ()))
+            elif eventType == "GUILD_MEMBERS_CHUNK":
+                self._add_members(data["guild_id"], data.get("members", ()))
+            elif eventType not in HANDSHAKE_EVENTS:
+                if last is not None:
+                    gap = (at - last).total_seconds()
+                    offset += gap if max_gap is None else min(gap, max_gap)
+                last = at
+                self.stream.append((offset, eventType, data))
+
+    def _add_members(self, guild_id: str, members):
+        for member in members:
+            self.members[guild_id][member["user"]["id"]] = member
+
+    """
+    # Returns the bot user the capture was logged by.
+    """
+    def user(self) -> dict:
+        return self.ready["user"] if self.ready is not None else DEFAULT_USER
+
+    """
+    # Returns the id and flags of the bot's application.
+    """
+    def application(self) -> dict:
+        if self.ready is not None and self.ready.get("application"):
+            return self.ready["application"]
+        return {"id": self.user()["id"], "flags": 0}
+
+    """
+    # Returns the ids of every guild, channel, thread and role of the captured guilds. These are the ids that are moved
+    # to a fresh range for every copy of the guilds when the capture is fanned out.
+    """
+    def guild_scoped_ids(self) -> set:
+        ids = set()
+        for guildId, guild in self.guilds.items():
+            ids.add(guildId)
+            for key in ("channels", "threads", "roles"):
+                ids.update(item["id"] for item in guild.get(key, ()))
+        return ids
+
+    def duration(self) -> float:
+        return self.stream[-1][0] if self.stream else 0.0
+
+
+"""
+# Returns a copy of a payload with every id in 'ids' moved up by 'offset', wherever it appears as a value or a key.
+# @Params:
+# value; Expected Type: any - the payload or a part of it
+# ids; Expected Type: {str} - the ids to move, as the strings discord sends them as
+# offset; Expected Type: int - what's added to every one of them
+"""
+def remap(value, ids: set, offset: int):
+    if isinstance(value, dict):
+        return {(str(int(key) + offset) if key in ids else key): remap(item, ids, offset) for key, item in value.items()}
+    if isinstance(value, list):
+        return [remap(item, ids, offset) for item in value]
+    if isinstance(value, str) and value in ids:
+        return str(int(value) + offset)
+    return value
@@ -0,0 +1,336 @@
+# Local stand-in for discord the replay load test points the bot at: the REST API, the CDN the submitted attachments are
+# downloaded from and the gateway, all served by one aiohttp app. It runs on an event loop of its own in a background
+# thread, so serializing and sending the replayed events doesn't show up in the bot's event loop lag.
+#
+# The gateway speaks enough of discord's protocol for discord.py: it says hello, acknowledges heartbeats, answers an
+# IDENTIFY with a READY and a GUILD_CREATE for every guild on the connecting shard and answers member requests with
+# GUILD_MEMBERS_CHUNKs. Once 'play' is called it replays the capture's stream to the shard of every event's guild, on
+# the capture's own schedule sped up by the speed multiplier. The REST API answers the handful of routes the bot calls
+# with plausible payloads and counts every request by route.
+import asyncio
+import collections
+import itertools
+import json
+import threading
+import time
+
+from aiohttp import web
+
+from benchmarks.replay.capture import Capture, remap
+
+# Ids of the copies of a fanned out capture are this far apart. The upper part moves them well clear of every id of the
+# capture, the lower part spreads the copies of a guild over the shards.
+FANOUT_STRIDE = (1 << 42) + (1 << 22)
+# Members per GUILD_MEMBERS_CHUNK, like discord
+CHUNK_SIZE = 1000
+HEARTBEAT_INTERVAL = 41250
+
+
+def _json(data, status: int = 200) -> web.Response:
+    # discord.py only decodes bodies whose content type is exactly 'application/json'
+    return web.Response(body=json.dumps(data).encode(), status=status, headers={"Content-Type": "application/json"})
+
+
+def percentiles(samples: list) -> tuple:
+    if not samples:
+        return None, None
+    ordered = sorted(samples)
+    return ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+
+"""
+# One shard's gateway connection.
+"""
+class GatewayConnection:
+    def __init__(self, ws: web.WebSocketResponse, shard: int, shard_count: int):
+        self.ws = ws
+        self.shard = shard
+        self.shardCount = shard_count
+        self._sequence = 0
+
+    """
+    # Sends a dispatch whose data has already been serialized.
+    # @Params:
+    # event_type; Expected Type: str - name of the event
+    # data; Expected Type: str - the event's data as JSON
+    """
+    async def dispatch(self, event_type: str, data: str):
+        self._sequence += 1
+        await self.ws.send_str(f'{{"op":0,"s":{self._sequence},"t":"{event_type}","d":{data}}}')
+
+
+"""
+# The fake discord.
+# @Params:
+# capture; Expected Type: Capture - gateway traffic to serve
+# copies; Expected Type: int - number of copies of every captured guild and its events to serve
+"""
+class FakeDiscord:
+    def __init__(self, capture: Capture, copies: int = 1):
+        self.capture = capture
+        self.copies = copies
+        self.user = capture.user()
+        self.application = capture.application()
+        self.url = None
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self._connections = {}
+        self._messageIds = itertools.count(int(self.user["id"]) + 1)
+        # fanned out GUILD_CREATEs and member lists by guild id
+        self.guilds = {}
+        self.members = {}
+        # (offset in seconds, guild id, event type, data as JSON, interaction id, command name) of every replayed event
+        self._frames = []
+        # what was sent and requested, and how long the bot took to answer interactions
+        self.sent = collections.Counter()
+        self.undeliverable = 0
+        self.requests = collections.Counter()
+        self.unknownRoutes = collections.Counter()
+        self._interactions = {}
+        self._tokens = {}
+        self.responseLatency = collections.defaultdict(list)
+        self.followupLatency = collections.defaultdict(list)
+        self.scheduleLags = []
+
+    """
+    # Fans the capture out and serializes every event ahead of time, then starts serving in the background thread.
+    """
+    def start(self):
+        self._prepare()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-discord", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    @property
+    def api(self) -> str:
+        return f"{self.url}/api/v10"
+
+    @property
+    def gateway(self) -> str:
+        return f"{self.url.replace('http', 'ws', 1)}/gateway"
+
+    """
+    # Replays the stream from the bot's event loop and waits until every event has been sent.
+    # @Params:
+    # speed; Expected Type: float - how many times faster than captured the events are sent
+    """
+    async def play(self, speed: float):
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._play(speed), self._loop))
+
+    def schedule_lag(self) -> tuple:
+        p50, p99 = percentiles(self.scheduleLags)
+        return p50, p99, max(self.scheduleLags, default=None)
+
+    def _prepare(self):
+        ids = self.capture.guild_scoped_ids()
+        frames = []
+        for copy in range(self.copies):
+            # remapped even for the first copy, so the capture itself is never changed
+            offset = copy * FANOUT_STRIDE
+            for guildId, guild in self.capture.guilds.items():
+                guild = remap(guild, ids, offset)
+                self.guilds[int(guild["id"])] = guild
+                self.members[int(guild["id"])] = list(self.capture.members[guildId].values())
+            for at, eventType, data in self.capture.stream:
+                data = remap(data, ids, offset)
+                interactionId = None
+                if eventType == "INTERACTION_CREATE":
+                    data["id"] = str(int(data["id"]) + offset)
+                    data["token"] = f"{data['token']}.{copy}"
+                    interactionId = data["id"]
+                    self._relay_attachments(data)
+                elif eventType == "MESSAGE_CREATE":
+                    data["id"] = str(int(data["id"]) + offset)
+                guildId = data.get("guild_id")
+                frames.append((at, int(guildId) if guildId else None, eventType, json.dumps(data), interactionId,
+                               data.get("data", {}).get("name") if interactionId else None))
+        frames.sort(key=lambda frame: frame[0])
+        self._frames = frames
+
+    def _relay_attachments(self, data: dict):
+        # submitted attachments are downloaded from the stand-in instead of discord's CDN
+        attachments = data.get("data", {}).get("resolved", {}).get("attachments", {})
+        for attachment in attachments.values():
+            url = f"{{base}}/attachments/{attachment['id']}/{attachment.get('size', 0)}/{attachment['filename']}"
+            attachment["url"] = attachment["proxy_url"] = url
+
+    async def _serve(self):
+        app = web.Application(middlewares=[self._count], client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/gateway", self._gateway)
+        app.router.add_get("/api/v10/gateway", self._get_gateway)
+        app.router.add_get("/api/v10/gateway/bot", self._get_gateway)
+        app.router.add_get("/api/v10/users/@me", self._current_user)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self._application_info)
+        app.router.add_post("/api/v10/interactions/{id}/{token}/callback", self._interaction_callback)
+        app.router.add_post("/api/v10/webhooks/{application}/{token}", self._followup)
+        app.router.add_route("*", "/api/v10/webhooks/{application}/{token}/messages/{message}",
+                             self._original_response)
+        app.router.add_post("/api/v10/users/@me/channels", self._create_dm)
+        app.router.add_post("/api/v10/channels/{channel}/messages", self._send_message)
+        app.router.add_get("/attachments/{id}/{size}/{filename}", self._attachment)
+        app.router.add_route("*", "/{path:.*}", self._unknown_route)
+        # no access log, every request would end up in the bot's log
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        # the frames were serialized before the port was known
+        self._frames = [(at, guildId, eventType, data.replace("{base}", self.url), interactionId, name)
+                        for at, guildId, eventType, data, interactionId, name in self._frames]
+
+    async def _shutdown(self):
+        for connection in list(self._connections.values()):
+            await connection.ws.close()
+        await self._runner.cleanup()
+
+    @web.middleware
+    async def _count(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        self.requests[f"{request.method} {resource.canonical if resource is not None else request.path}"] += 1
+        return await handler(request)
+
+    async def _play(self, speed: float):
+        start = time.perf_counter()
+        for at, guildId, eventType, data, interactionId, name in self._frames:
+            due = start + at / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.scheduleLags.append(max(0.0, time.perf_counter() - due))
+            connection = self._connection_for(guildId)
+            if connection is None:
+                self.undeliverable += 1
+                continue
+            if interactionId is not None:
+                self._interactions[interactionId] = (name, time.perf_counter())
+            await connection.dispatch(eventType, data)
+            self.sent[eventType] += 1
+
+    def _connection_for(self, guild_id: int):
+        if not self._connections:
+            return None
+        if guild_id is None:
+            return next(iter(self._connections.values()))
+        shardCount = next(iter(self._connections.values())).shardCount
+        return self._connections.get((guild_id >> 22) % shardCount)
+
+    async def _gateway(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        await ws.send_str(json.dumps({"op": 10, "s": None, "t": None, "d": {"heartbeat_interval": HEARTBEAT_INTERVAL}}))
+        connection = None
+        async for message in ws:
+            payload = json.loads(message.data)
+            op = payload["op"]
+            if op == 1:
+                await ws.send_str(json.dumps({"op": 11, "s": None, "t": None, "d": None}))
+            elif op == 2:
+                shard, shardCount = payload["d"].get("shard") or (0, 1)
+                connection = GatewayConnection(ws, shard, shardCount)
+                self._connections[shard] = connection
+                await self._handshake(connection)
+            elif op == 6:
+                # there's no session to resume, have the shard identify again
+                await ws.send_str(json.dumps({"op": 9, "s": None, "t": None, "d": False}))
+            elif op == 8 and connection is not None:
+                await self._send_chunks(connection, payload["d"])
+        if connection is not None and self._connections.get(connection.shard) is connection:
+            del self._connections[connection.shard]
+        return ws
+
+    async def _handshake(self, connection: GatewayConnection):
+        guilds = [guild for guildId, guild in self.guilds.items()
+                  if (guildId >> 22) % connection.shardCount == connection.shard]
+        ready = dict(self.capture.ready or {})
+        ready.update({
+            "v": 10, "user": self.user, "session_id": f"replay-{connection.shard}", "resume_gateway_url": self.gateway,
+            "guilds": [{"id": guild["id"], "unavailable": True} for guild in guilds], "application": self.application,
+            "private_channels": [], "relationships": [], "presences": [], "user_settings": {},
+        })
+        if connection.shardCount > 1:
+            ready["shard"] = [connection.shard, connection.shardCount]
+        await connection.dispatch("READY", json.dumps(ready))
+        for guild in guilds:
+            await connection.dispatch("GUILD_CREATE", json.dumps(guild))
+
+    async def _send_chunks(self, connection: GatewayConnection, request: dict):
+        guildId = int(request["guild_id"])
+        members = self.members.get(guildId, [])
+        chunks = [members[i:i + CHUNK_SIZE] for i in range(0, len(members), CHUNK_SIZE)] or [[]]
+        for index, chunk in enumerate(chunks):
+            data = {"guild_id": str(guildId), "members": chunk, "chunk_index": index, "chunk_count": len(chunks)}
+            if request.get("nonce"):
+                data["nonce"] = request["nonce"]
+            await connection.dispatch("GUILD_MEMBERS_CHUNK", json.dumps(data))
+
+    async def _get_gateway(self, request: web.Request) -> web.Response:
+        return _json({"url": self.gateway, "shards": 1,
+                      "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0,
+                                              "max_concurrency": 1}})
+
+    async def _current_user(self, request: web.Request) -> web.Response:
+        return _json(self.user)
+
+    async def _application_info(self, request: web.Request) -> web.Response:
+        return _json({"id": self.application["id"], "name": self.user["username"], "description": "", "icon": None,
+                      "bot_public": False, "bot_require_code_grant": False, "owner": self.user, "verify_key": "",
+                      "flags": self.application.get("flags", 0)})
+
+    def _message(self, channel_id: str, content: str = "") -> dict:
+        return {"id": str(next(self._messageIds)), "channel_id": channel_id, "author": self.user, "content": content,
+                "timestamp": "2024-11-16T17:00:00+00:00", "edited_timestamp": None, "tts": False,
+                "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+                "pinned": False, "type": 0, "flags": 0}
+
+    async def _interaction_callback(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        sent = self._interactions.pop(request.match_info["id"], None)
+        if sent is not None:
+            name, sentAt = sent
+            self.responseLatency[name].append(time.perf_counter() - sentAt)
+            # a deferred response is followed up on later, the time until then is what the user waits for
+            if request.content_type == "application/json" and json.loads(body).get("type") == 5:
+                self._tokens[request.match_info["token"]] = sent
+        return web.Response(status=204)
+
+    async def _followup(self, request: web.Request) -> web.Response:
+        # read the whole upload, like discord would
+        await request.read()
+        sent = self._tokens.pop(request.match_info["token"], None)
+        if sent is not None:
+            name, sentAt = sent
+            self.followupLatency[name].append(time.perf_counter() - sentAt)
+        return _json(self._message("0"))
+
+    async def _original_response(self, request: web.Request) -> web.Response:
+        await request.read()
+        return _json(self._message("0"))
+
+    async def _create_dm(self, request: web.Request) -> web.Response:
+        recipient = (await request.json())["recipient_id"]
+        return _json({"id": str(next(self._messageIds)), "type": 1, "last_message_id": None,
+                      "recipients": [{"id": str(recipient), "username": "recipient", "discriminator": "0",
+                                      "global_name": None, "avatar": None}]})
+
+    async def _send_message(self, request: web.Request) -> web.Response:
+        await request.read()
+        return _json(self._message(request.match_info["channel"]))
+
+    async def _attachment(self, request: web.Request) -> web.Response:
+        size = int(request.match_info["size"])
+        return web.Response(body=b"\x89PNG" + bytes(max(0, size - 4)), content_type="image/png")
+
+    async def _unknown_route(self, request: web.Request) -> web.Response:
+        await request.read()
+        self.unknownRoutes[f"{request.method} {request.path}"] += 1
+        return _json({"message": "404: Not Found", "code": 0}, 404)
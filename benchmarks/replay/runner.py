@@ -0,0 +1,275 @@
+# Runs the replay load test: reads a capture, serves it from the fake discord in 'fakes.py' and runs the bot's real
+# entry point 'main.main()' against it with a throwaway database, then reports how the bot kept up. See '__init__.py'.
+import argparse
+import asyncio
+import collections
+import importlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+import discord
+import yarl
+from sqlalchemy import create_engine, insert
+
+import models
+from benchmarks.replay import capture, synthetic
+from benchmarks.replay.fakes import FakeDiscord, percentiles
+
+# Event handler tasks discord.py starts for the bot's listeners and app commands
+HANDLER_TASKS = ("discord.py: ", "CommandTree-invoker")
+
+
+"""
+# Creates the throwaway database with every served guild registered and its first text channel designated as the art
+# channel, so submissions are accepted from the start, and a share of every guild's members subscribed to vc notifs.
+# @Params:
+# path; Expected Type: str - file the database is written to
+# guilds; Expected Type: {int: dict} - GUILD_CREATE payloads of the served guilds by id
+# members; Expected Type: {int: [dict]} - member payloads of the served guilds by id
+# subscribed; Expected Type: float - share of the members subscribed to vc notifs
+"""
+def build_database(path: str, guilds: dict, members: dict, subscribed: float):
+    rng = random.Random(0)
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    guildRows = []
+    subscriptionRows = []
+    for guildId, guild in guilds.items():
+        textChannels = [int(channel["id"]) for channel in guild.get("channels", ()) if channel.get("type") == 0]
+        guildRows.append({"id": guildId, "art_channel_id": textChannels[0] if textChannels else None})
+        subscriptionRows.extend({"user_id": int(member["user"]["id"]), "guild_id": guildId}
+                                for member in members.get(guildId, ())
+                                if not member["user"].get("bot") and rng.random() < subscribed)
+    userIds = {row["user_id"] for row in subscriptionRows}
+    with engine.begin() as conn:
+        for table, rows in ((models.Guild, guildRows), (models.User, [{"id": userId} for userId in userIds]),
+                            (models.subscriber_association_table, subscriptionRows)):
+            if rows:
+                conn.execute(insert(table), rows)
+    engine.dispose()
+
+
+"""
+# Counts and times every event the bot parses by wrapping discord.py's parsers. Parsing and dispatching is the part of
+# handling an event that runs synchronously on the bot's event loop; the handlers it starts run as tasks of their own.
+# @Params:
+# bot; Expected Type: discord.Client - the bot
+"""
+class ParserProbe:
+    def __init__(self, bot: discord.Client):
+        self.received = collections.Counter()
+        self.parseTime = collections.Counter()
+        parsers = bot._connection.parsers
+        for eventType, parser in list(parsers.items()):
+            parsers[eventType] = self._wrap(eventType, parser)
+
+    def _wrap(self, event_type: str, parser):
+        def probe(data):
+            start = time.perf_counter()
+            try:
+                return parser(data)
+            finally:
+                self.parseTime[event_type] += time.perf_counter() - start
+                self.received[event_type] += 1
+        return probe
+
+
+"""
+# Waits until the bot has received every replayed event and finished handling it, including the submissions and DMs
+# handed off to the background workers.
+# @Params:
+# main; Expected Type: module - the imported 'main.py'
+# probe; Expected Type: ParserProbe - counts the events the bot received
+# expected; Expected Type: {str: int} - events of every type the bot should have received by now
+"""
+async def drain(main, probe: ParserProbe, expected: dict):
+    while any(probe.received[eventType] < count for eventType, count in expected.items()):
+        await asyncio.sleep(0.01)
+    while True:
+        handlers = [task for task in asyncio.all_tasks() if task.get_name().startswith(HANDLER_TASKS)]
+        if not handlers:
+            break
+        await asyncio.wait(handlers)
+    await main.pipeline.submission_pipeline.join()
+    await main.notifier.dm_dispatcher.join()
+
+
+"""
+# Starts the bot against the fake discord, waits for it to get ready and finish its startup work, replays the stream and
+# waits for the bot to work it off.
+# @Params:
+# main; Expected Type: module - the imported 'main.py'
+# fake; Expected Type: FakeDiscord - the running fake discord
+# speed; Expected Type: float - how many times faster than captured the events are sent
+# drain_timeout; Expected Type: float - seconds the bot gets to work off the stream after it has been sent
+# @Returns:
+# dict of the measurements
+"""
+async def replay(main, fake: FakeDiscord, speed: float, drain_timeout: float) -> dict:
+    bot = main.bot
+    probe = ParserProbe(bot)
+    ready = asyncio.Event()
+
+    async def on_replay_ready():
+        ready.set()
+
+    bot.add_listener(on_replay_ready, "on_ready")
+    results = {}
+    start = time.perf_counter()
+    botTask = asyncio.create_task(main.main())
+    try:
+        readyTask = asyncio.create_task(ready.wait())
+        await asyncio.wait([botTask, readyTask], return_when=asyncio.FIRST_COMPLETED)
+        if not ready.is_set():
+            readyTask.cancel()
+            # the bot stopped before it got ready, raise whatever stopped it
+            await botTask
+            raise RuntimeError("The bot stopped before it got ready")
+        results["ready_s"] = time.perf_counter() - start
+        while main.startupTask is None:
+            await asyncio.sleep(0.01)
+        await main.startupTask
+        results["startup_s"] = time.perf_counter() - start
+        results["handshake"] = dict(probe.received)
+
+        before = collections.Counter(probe.received)
+        start = time.perf_counter()
+        await fake.play(speed)
+        results["play_s"] = time.perf_counter() - start
+        expected = {eventType: before[eventType] + count for eventType, count in fake.sent.items()}
+        try:
+            await asyncio.wait_for(drain(main, probe, expected), drain_timeout)
+            results["drained"] = True
+        except asyncio.TimeoutError:
+            results["drained"] = False
+        results["drain_s"] = time.perf_counter() - start - results["play_s"]
+        results["received"] = {eventType: probe.received[eventType] - before[eventType] for eventType in fake.sent}
+        results["parse_ms"] = {eventType: probe.parseTime[eventType] * 1000 / probe.received[eventType]
+                               for eventType in probe.received}
+        results["commands"] = {name: (main.metrics.command_duration.count(command=name),
+                                      main.metrics.command_errors.value(command=name))
+                               for name in fake.responseLatency}
+        results["pipeline"] = main.pipeline.submission_pipeline.summary()
+        results["dms"] = main.notifier.dm_dispatcher.summary()
+        results["writer"] = main.writer.group_writer.summary()
+        results["loop"] = main.looplag.monitor.summary()
+    finally:
+        await bot.close()
+        await botTask
+    return results
+
+
+def format_latency(samples: list) -> str:
+    p50, p99 = percentiles(samples)
+    return "n/a" if p50 is None else f"p50 {p50 * 1000:7.1f} ms, p99 {p99 * 1000:7.1f} ms"
+
+
+"""
+# Prints the measurements of a replay.
+# @Params:
+# fake; Expected Type: FakeDiscord - the fake discord the replay was served from
+# results; Expected Type: dict - measurements returned by 'replay'
+# speed; Expected Type: float - speed multiplier of the replay
+"""
+def report(fake: FakeDiscord, results: dict, speed: float):
+    print(f"Ready after {results['ready_s']:.2f} s, startup sync done after {results['startup_s']:.2f} s "
+          f"({len(fake.guilds)} guilds, handshake events {results['handshake']})")
+    sent = sum(fake.sent.values())
+    print(f"Replayed {sent} events in {results['play_s']:.2f} s ({sent / max(results['play_s'], 1e-9):.0f}/s), "
+          f"{fake.undeliverable} without a connected shard; drained in {results['drain_s']:.2f} s"
+          + ("" if results["drained"] else " (TIMED OUT)"))
+    p50, p99, maxLag = fake.schedule_lag()
+    if p50 is not None:
+        print(f"Send schedule lag at {speed:g}x: p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, "
+              f"max {maxLag * 1000:.1f} ms")
+    print("Events:")
+    for eventType, count in sorted(fake.sent.items()):
+        print(f"  {eventType:>20}: {count:7d} sent, {results['received'][eventType]:7d} received, "
+              f"{results['parse_ms'].get(eventType, 0):.3f} ms to parse and dispatch")
+    if fake.responseLatency:
+        print("Interactions (time until discord got the response / the followup):")
+        for name, latencies in sorted(fake.responseLatency.items()):
+            handled, errors = results["commands"][name]
+            followups = fake.followupLatency.get(name)
+            print(f"  {name:>20}: {len(latencies):6d} answered, {format_latency(latencies)}"
+                  + (f"; followup {format_latency(followups)}" if followups else "")
+                  + f"; {handled} handled, {errors:g} errors")
+    print("REST requests:")
+    for route, count in sorted(fake.requests.items()):
+        print(f"  {count:7d} {route}")
+    for route, count in sorted(fake.unknownRoutes.items()):
+        print(f"  {count:7d} {route} (not stood in for)")
+    for key in ("pipeline", "dms", "writer", "loop"):
+        print(results[key])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay captured or synthetic gateway traffic against the bot.")
+    parser.add_argument("logs", nargs="*",
+                        help="log files to replay, oldest first; a synthetic capture is generated if none are given")
+    parser.add_argument("--speed", type=float, default=100.0, help="how many times faster than captured to replay")
+    parser.add_argument("--fan-out", type=int, default=1, help="copies of every guild and its events to serve")
+    parser.add_argument("--max-gap", type=float, default=60.0,
+                        help="longest pause in seconds kept between two captured events, before the speed up")
+    parser.add_argument("--subscribed", type=float, default=0.25,
+                        help="share of every guild's members subscribed to vc notifs in the replay's database")
+    parser.add_argument("--drain-timeout", type=float, default=300.0,
+                        help="seconds the bot gets to work off the replayed events")
+    synthetic_options = parser.add_argument_group("synthetic capture")
+    synthetic_options.add_argument("--guilds", type=int, default=20)
+    synthetic_options.add_argument("--members", type=int, default=50, help="members of every guild")
+    synthetic_options.add_argument("--duration", type=float, default=600.0, help="seconds of captured traffic")
+    synthetic_options.add_argument("--rate", type=float, default=2.0, help="events per second of captured traffic")
+    synthetic_options.add_argument("--attachment-size", type=int, default=256 * 1024,
+                                   help="bytes of every submitted attachment")
+    synthetic_options.add_argument("--write-synthetic", metavar="PATH",
+                                   help="only write the synthetic capture to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dbPath = os.path.join(tmp, "poke_bot.db")
+        # 'db.py', 'logconfig.py' and 'metrics.py' read their configuration when they're first imported
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{dbPath}"
+        os.environ["LOG_FILE"] = os.path.join(tmp, "poke_bot.log")
+        os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+        os.environ.setdefault("METRICS_PORT", "")
+        os.environ["DISCORD_TOKEN"] = "replay"
+        logs = args.logs
+        if args.write_synthetic or not logs:
+            path = args.write_synthetic or os.path.join(tmp, "synthetic.log")
+            written = synthetic.synthesize(path, args.guilds, args.members, args.duration, args.rate,
+                                           args.attachment_size)
+            print(f"Wrote a synthetic capture of {args.guilds} guilds and {written} events to {path}")
+            if args.write_synthetic:
+                return 0
+            logs = [path]
+        records, skipped = capture.read(logs)
+        gatewayCapture = capture.Capture(records, skipped, args.max_gap)
+        print(f"Read {len(records)} gateway events ({dict(gatewayCapture.counts)}), skipped {skipped} "
+              f"unparseable record(s); {len(gatewayCapture.guilds)} guilds, {len(gatewayCapture.stream)} streamed "
+              f"events over {gatewayCapture.duration():.0f} s")
+        if not gatewayCapture.guilds:
+            print("The capture has no GUILD_CREATE to serve")
+            return 1
+
+        fake = FakeDiscord(gatewayCapture, args.fan_out)
+        fake.start()
+        try:
+            build_database(dbPath, fake.guilds, fake.members, args.subscribed)
+            # every REST request and gateway connection goes to the fake discord
+            discord.http.Route.BASE = fake.api
+            discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(fake.gateway)
+            main = importlib.import_module("main")
+            results = asyncio.run(replay(main, fake, args.speed, args.drain_timeout))
+        finally:
+            fake.stop()
+    report(fake, results, args.speed)
+    complete = results["drained"] and not fake.undeliverable and not fake.unknownRoutes
+    return 0 if complete else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# Synthetic gateway captures for the replay load test, written in the same JSON lines format as the bot's own
+# 'poke_bot.log' (see 'logconfig.py') but with every event in it. The log starts with a READY and a GUILD_CREATE for
+# every guild, each with an art channel, a voice channel and its members, followed by the traffic the bot sees while
+# running: members joining and leaving voice chat and using the slash commands. The traffic is generated from a fixed
+# seed, so two logs with the same options are identical and their replays comparable.
+import datetime
+import heapq
+import logging
+import random
+
+# discord's snowflake epoch in milliseconds
+DISCORD_EPOCH = 1420070400000
+# Permissions the bot and the members have on the synthetic guilds
+PERMISSIONS = "2248473465835073"
+# Share of the streamed events of every kind. Voice chat events come in join and leave pairs.
+EVENT_MIX = {
+    "voice": 50,
+    "subscribe": 8,
+    "unsubscribe": 2,
+    "amisubscribed": 10,
+    "streakstats": 15,
+    "submitart": 15,
+}
+# Average seconds a member stays in voice chat
+VOICE_DWELL = 60.0
+
+
+"""
+# Hands out increasing, unique snowflakes that look like they were created at the provided time.
+# @Params:
+# at; Expected Type: datetime.datetime - creation time encoded in the snowflakes
+"""
+class Snowflakes:
+    def __init__(self, at: datetime.datetime):
+        self._next = (int(at.timestamp() * 1000) - DISCORD_EPOCH) << 22
+
+    def __call__(self) -> str:
+        # step a whole millisecond each time so ids of different objects never share their upper bits
+        self._next += 1 << 22
+        return str(self._next)
+
+
+def user_payload(user_id: str, name: str, bot: bool = False) -> dict:
+    return {"id": user_id, "username": name, "discriminator": "0", "global_name": None, "avatar": None, "bot": bot,
+            "public_flags": 0}
+
+
+def member_payload(user: dict, joined_at: str) -> dict:
+    return {"user": user, "roles": [], "nick": None, "avatar": None, "joined_at": joined_at, "premium_since": None,
+            "deaf": False, "mute": False, "flags": 0, "pending": False, "communication_disabled_until": None}
+
+
+"""
+# Builds the GUILD_CREATE payload of a synthetic guild.
+# @Params:
+# ids; Expected Type: Snowflakes - source of the guild's ids
+# name; Expected Type: str - name of the guild
+# members; Expected Type: [dict] - member payloads, including the bot's
+# joined_at; Expected Type: str - ISO time the bot joined the guild
+"""
+def guild_payload(ids: Snowflakes, name: str, members: list, joined_at: str) -> dict:
+    guildId = ids()
+    textId = ids()
+    voiceId = ids()
+    return {
+        "id": guildId, "name": name, "icon": None, "splash": None, "discovery_splash": None, "banner": None,
+        "description": None, "owner_id": members[-1]["user"]["id"], "afk_channel_id": None, "afk_timeout": 300,
+        "verification_level": 0, "default_message_notifications": 0, "explicit_content_filter": 0, "mfa_level": 0,
+        "nsfw_level": 0, "premium_tier": 0, "premium_subscription_count": 0, "premium_progress_bar_enabled": False,
+        "preferred_locale": "en-US", "system_channel_id": textId, "system_channel_flags": 0, "rules_channel_id": None,
+        "public_updates_channel_id": None, "vanity_url_code": None, "features": [], "emojis": [], "stickers": [],
+        "roles": [{"id": guildId, "name": "@everyone", "permissions": PERMISSIONS, "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False, "icon": None, "unicode_emoji": None,
+                   "flags": 0, "tags": {}}],
+        "channels": [
+            {"id": textId, "type": 0, "name": "art", "position": 0, "permission_overwrites": [], "nsfw": False,
+             "parent_id": None, "topic": None, "last_message_id": None, "rate_limit_per_user": 0, "flags": 0},
+            {"id": voiceId, "type": 2, "name": "voice", "position": 1, "permission_overwrites": [], "nsfw": False,
+             "parent_id": None, "bitrate": 64000, "user_limit": 0, "rtc_region": None, "flags": 0},
+        ],
+        "threads": [], "presences": [], "voice_states": [], "stage_instances": [], "guild_scheduled_events": [],
+        "members": members, "member_count": len(members), "large": False, "unavailable": False, "lazy": True,
+        "joined_at": joined_at, "max_members": 500000, "application_id": None,
+    }
+
+
+"""
+# Builds an INTERACTION_CREATE payload for a slash command used by a member in a guild's art channel.
+# @Params:
+# ids; Expected Type: Snowflakes - source of the interaction's ids
+# application_id; Expected Type: str - id of the bot's application
+# guild; Expected Type: dict - GUILD_CREATE payload of the guild
+# member; Expected Type: dict - member payload of the member using the command
+# name; Expected Type: str - name of the command
+# options; Expected Type: [dict] - the command's options
+# resolved; Expected Type: dict - users and attachments the options refer to
+"""
+def interaction_payload(ids: Snowflakes, application_id: str, guild: dict, member: dict, name: str,
+                        options: list = (), resolved: dict = None) -> dict:
+    interactionId = ids()
+    channel = guild["channels"][0]
+    data = {"id": ids(), "name": name, "type": 1, "options": list(options)}
+    if resolved:
+        data["resolved"] = resolved
+    return {
+        "id": interactionId, "application_id": application_id, "type": 2, "token": f"token-{interactionId}",
+        "version": 1, "guild_id": guild["id"], "channel_id": channel["id"],
+        "channel": {**channel, "guild_id": guild["id"]}, "member": {**member, "permissions": PERMISSIONS},
+        "app_permissions": PERMISSIONS, "locale": "en-US", "guild_locale": "en-US", "entitlements": [],
+        "authorizing_integration_owners": {"0": guild["id"]}, "context": 0, "data": data,
+    }
+
+
+"""
+# Writes a synthetic capture.
+# @Params:
+# path; Expected Type: str - log file to write
+# guilds; Expected Type: int - number of guilds the bot is on
+# members; Expected Type: int - members of every guild besides the bot
+# duration; Expected Type: float - seconds of traffic after the handshake
+# rate; Expected Type: float - average events per second of the traffic
+# attachment_size; Expected Type: int - size in bytes of the art submitted with 'submitart'
+# seed; Expected Type: int - seed of the generated traffic
+# @Returns:
+# the number of streamed events written
+"""
+def synthesize(path: str, guilds: int, members: int, duration: float, rate: float,
+               attachment_size: int = 256 * 1024, seed: int = 0) -> int:
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 11, 16, 17, 0, tzinfo=datetime.timezone.utc)
+    ids = Snowflakes(start - datetime.timedelta(days=365))
+    joinedAt = (start - datetime.timedelta(days=30)).isoformat()
+    bot = user_payload(ids(), "PokeBot", bot=True)
+    applicationId = bot["id"]
+    guildPayloads = []
+    for index in range(guilds):
+        guildMembers = [member_payload(user_payload(ids(), f"artist{index}-{number}"), joinedAt)
+                        for number in range(members)]
+        guildMembers.append(member_payload(bot, joinedAt))
+        guildPayloads.append(guild_payload(ids, f"guild {index}", guildMembers, joinedAt))
+    ids = Snowflakes(start)
+
+    # imported here so 'logconfig.py' reads its configuration only once the replay has set it
+    from logconfig import JsonFormatter
+    formatter = JsonFormatter()
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        def write(at: datetime.datetime, eventType: str, data: dict, sequence: int):
+            # the same record discord.py's gateway logs, formatted the way 'logconfig.py' writes it
+            record = logging.LogRecord("discord.gateway", logging.DEBUG, __file__, 0,
+                                       "For Shard ID %s: WebSocket Event: %s",
+                                       (None, {"t": eventType, "s": sequence, "op": 0, "d": data}), None)
+            record.created = at.timestamp()
+            f.write(formatter.format(record) + "\n")
+
+        write(start, "READY", {
+            "v": 10, "user": {**bot, "verified": True, "mfa_enabled": False, "flags": 0}, "session_type": "normal",
+            "session_id": "synthetic", "resume_gateway_url": "wss://gateway.discord.gg", "user_settings": {},
+            "relationships": [], "private_channels": [], "presences": [], "guild_join_requests": [],
+            "geo_ordered_rtc_regions": [], "auth": {},
+            "guilds": [{"id": guild["id"], "unavailable": True} for guild in guildPayloads],
+            "application": {"id": applicationId, "flags": 0},
+        }, 1)
+        for number, guild in enumerate(guildPayloads):
+            write(start, "GUILD_CREATE", guild, number + 2)
+
+        kinds = list(EVENT_MIX)
+        weights = list(EVENT_MIX.values())
+        inVoice = set()
+        # (time, guild index, member index) of the members that are going to leave voice chat
+        leaves = []
+        sequence = len(guildPayloads) + 1
+        at = 0.0
+        while True:
+            at += rng.expovariate(rate)
+            # members whose time in voice chat is up leave before the next event
+            while leaves and leaves[0][0] <= min(at, duration):
+                leftAt, guildIndex, memberIndex = heapq.heappop(leaves)
+                inVoice.discard((guildIndex, memberIndex))
+                sequence += 1
+                write(start + datetime.timedelta(seconds=leftAt), "VOICE_STATE_UPDATE",
+                      voice_state(guildPayloads[guildIndex], guildIndex, memberIndex, None), sequence)
+                written += 1
+            if at > duration:
+                break
+            guildIndex = rng.randrange(guilds)
+            guild = guildPayloads[guildIndex]
+            memberIndex = rng.randrange(members)
+            member = guild["members"][memberIndex]
+            kind = rng.choices(kinds, weights)[0]
+            if kind == "voice":
+                if (guildIndex, memberIndex) in inVoice:
+                    continue
+                inVoice.add((guildIndex, memberIndex))
+                heapq.heappush(leaves, (at + rng.expovariate(1 / VOICE_DWELL), guildIndex, memberIndex))
+                eventType, data = "VOICE_STATE_UPDATE", voice_state(guild, guildIndex, memberIndex,
+                                                                    guild["channels"][1]["id"])
+            elif kind == "streakstats":
+                target = guild["members"][rng.randrange(members)]
+                targetMember = {key: value for key, value in target.items() if key != "user"}
+                eventType, data = "INTERACTION_CREATE", interaction_payload(
+                    ids, applicationId, guild, member, kind, [{"name": "user", "type": 6, "value": target["user"]["id"]}],
+                    {"users": {target["user"]["id"]: target["user"]},
+                     "members": {target["user"]["id"]: {**targetMember, "permissions": PERMISSIONS}}})
+            elif kind == "submitart":
+                attachmentId = ids()
+                url = f"https://cdn.discordapp.com/attachments/{guild['channels'][0]['id']}/{attachmentId}/art.png"
+                eventType, data = "INTERACTION_CREATE", interaction_payload(
+                    ids, applicationId, guild, member, kind, [{"name": "attachment", "type": 11, "value": attachmentId}],
+                    {"attachments": {attachmentId: {"id": attachmentId, "filename": "art.png", "size": attachment_size,
+                                                    "url": url, "proxy_url": url, "content_type": "image/png",
+                                                    "width": 512, "height": 512}}})
+            else:
+                eventType, data = "INTERACTION_CREATE", interaction_payload(ids, applicationId, guild, member, kind)
+            sequence += 1
+            write(start + datetime.timedelta(seconds=at), eventType, data, sequence)
+            written += 1
+    return written
+
+
+def voice_state(guild: dict, guild_index: int, member_index: int, channel_id) -> dict:
+    member = guild["members"][member_index]
+    return {"guild_id": guild["id"], "channel_id": channel_id, "user_id": member["user"]["id"], "member": member,
+            "session_id": f"voice-{guild_index}-{member_index}", "deaf": False, "mute": False, "self_deaf": False,
+            "self_mute": False, "self_video": False, "self_stream": False, "suppress": False,
+            "request_to_speak_timestamp": None}
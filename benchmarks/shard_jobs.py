@@ -0,0 +1,226 @@
+# Multi-process test of the sharded streak checks. Builds a sqlite database with streaks spread over every shard and
+# several timezones, then lets a handful of worker processes run the nightly check against it over a few simulated days,
+# the way the bot's 'check_streaks' does: every tick each worker takes the leases of the shards it owns, checks the due
+# timezone buckets of those shards with the shard filter pushed into the queries and records the run on the lease.
+#
+# The workers' shard ranges overlap, like the old and the new process during a rolling restart, and workers are taken
+# down for a while at random to simulate crashes. All workers share one simulated clock, stepped in lock step through a
+# barrier. Afterwards the script verifies that no (shard, timezone, day) was checked twice or skipped and that the final
+# state of every streak matches a single unsharded process that never went down. It exits with a non-zero status if not.
+#
+# Run it from the repository root with 'python -m benchmarks.shard_jobs'.
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+import models
+import sharding
+import streaks
+
+TIMEZONES = ("America/Denver", "Asia/Tokyo", "Europe/Berlin", "Asia/Kolkata")
+START = datetime.datetime(2024, 11, 10, 0, 0, tzinfo=datetime.timezone.utc)
+TICK = datetime.timedelta(hours=1)
+# Leases expire before the next tick, so any owner of a shard may pick it up on every tick.
+LEASE_TTL = 30 * 60
+
+
+"""
+# Fills the database with guilds on every shard and a few active streaks per guild, none of them submitted to during
+# the simulated days, and marks every bucket of every shard as checked two days before the simulation starts.
+# @Params:
+# url; Expected Type: str - url of the database
+# guilds; Expected Type: int - number of guilds
+# shard_count; Expected Type: int - total number of shards
+"""
+def populate(url: str, guilds: int, shard_count: int):
+    rng = random.Random(0)
+    engine = create_engine(url)
+    models.Base.metadata.create_all(engine)
+    guildIds = [(rng.randrange(1 << 30) << 22) | rng.randrange(1 << 22) for _ in range(guilds)]
+    lastChecked = START.date() - datetime.timedelta(1)
+    streakRows = []
+    for guildId in guildIds:
+        for _ in range(5):
+            created = lastChecked - datetime.timedelta(rng.randint(2, 5))
+            submitted = lastChecked - datetime.timedelta(rng.choice([0, 0, 1, 2]))
+            streakRows.append({"id": len(streakRows) + 1, "guild_id": guildId, "user_id": len(streakRows),
+                               "timezone": rng.choice(TIMEZONES), "creation_date": created,
+                               "last_submission_date": submitted, "submission_count": 1, "freezes": rng.randint(0, 2)})
+    with engine.begin() as conn:
+        conn.execute(insert(models.Guild), [{"id": guildId, "art_channel_id": guildId} for guildId in guildIds])
+        conn.execute(insert(models.ArtStreak), streakRows)
+        conn.execute(insert(models.ArtStreakSubmission), [
+            {"art_streak_id": row["id"], "user_id": row["user_id"], "creation_date": row["last_submission_date"],
+             "message_link": ""} for row in streakRows])
+        conn.execute(insert(models.StreakCheckBucket), [
+            {"timezone": timezone, "shard_id": shard, "last_check_date": lastChecked - datetime.timedelta(1)}
+            for timezone in TIMEZONES for shard in range(shard_count)])
+    engine.dispose()
+
+
+"""
+# Runs one tick of the nightly check for the shards a process owns, mirroring 'check_streaks' in 'main.py'.
+# @Params:
+# engine; Expected Type: sqlalchemy.Engine - engine pointing at the shared database
+# owned; Expected Type: sharding.ShardSet - shards the process owns
+# holder; Expected Type: str - name the process holds its leases under
+# now; Expected Type: datetime.datetime - the simulated time
+# @Returns:
+# list of (shard, timezone, date) tuples, one for every day a bucket was checked for
+"""
+def run_tick(engine, owned: sharding.ShardSet, holder: str, now: datetime.datetime) -> list:
+    checked = []
+    naiveNow = now.replace(tzinfo=None)
+    for shard in owned.split():
+        with Session(engine) as session:
+            lease = sharding.acquire_lease(session, "check_streaks", shard.ids[0], naiveNow, holder, LEASE_TTL)
+            session.commit()
+        if lease is None:
+            continue
+        with Session(engine) as session:
+            due = streaks.due_checks(session, now, shard)
+            session.commit()
+        for timezone, lastChecked, today in due:
+            with Session(engine) as session:
+                # claim the bucket the way the bot does, a bucket another process got to first is left alone
+                if not streaks.mark_checked(session, timezone, today, shard, lastChecked):
+                    session.rollback()
+                    continue
+                if (today - lastChecked).days > 1:
+                    streaks.catch_up_streaks(session, lastChecked, today, timezone, shard)
+                else:
+                    streaks.evaluate_streaks(session, today, timezone, shard)
+                session.commit()
+            days = (today - lastChecked).days
+            checked.extend((shard.ids[0], timezone, lastChecked + datetime.timedelta(i)) for i in range(1, days + 1))
+        with Session(engine) as session:
+            sharding.finish_lease(session, "check_streaks", shard.ids[0], naiveNow, holder)
+            session.commit()
+    return checked
+
+
+"""
+# Worker process. Steps through the simulated ticks in lock step with the other workers and skips the ticks it's down
+# for. Every worker is up again for the last tick.
+# @Params:
+# url; Expected Type: str - url of the shared database
+# shard_count; Expected Type: int - total number of shards
+# shard_ids; Expected Type: [int] - shards the worker owns
+# ticks; Expected Type: int - number of simulated ticks
+# barrier; Expected Type: multiprocessing.Barrier - keeps the workers' simulated clocks in step
+# results; Expected Type: multiprocessing.Queue - receives the worker's checked buckets
+# seed; Expected Type: int - seed of the worker's simulated crashes
+"""
+def worker(url: str, shard_count: int, shard_ids: list, ticks: int, barrier, results, seed: int):
+    rng = random.Random(seed)
+    engine = create_engine(url, connect_args={"timeout": 30})
+    owned = sharding.ShardSet(shard_count, shard_ids)
+    holder = f"worker-{seed}"
+    downUntil = -1
+    checked = []
+    elapsed = 0.0
+    for tick in range(ticks):
+        barrier.wait()
+        if tick > downUntil and rng.random() < 0.05:
+            # crash and stay down for up to two days
+            downUntil = tick + rng.randint(1, 48)
+        # everyone is back up for the last tick, so every shard ends up caught up
+        if tick > downUntil or tick == ticks - 1:
+            start = time.perf_counter()
+            checked.extend(run_tick(engine, owned, holder, START + tick * TICK))
+            elapsed += time.perf_counter() - start
+    engine.dispose()
+    results.put((holder, checked, elapsed))
+
+
+"""
+# Runs the same ticks in a single unsharded process that never goes down. The first tick already catches up on the
+# timezones that are a day ahead of UTC.
+# @Params:
+# url; Expected Type: str - url of the reference database
+# ticks; Expected Type: int - number of simulated ticks
+"""
+def reference(url: str, ticks: int):
+    engine = create_engine(url)
+    for tick in range(ticks):
+        now = START + tick * TICK
+        with Session(engine) as session:
+            for timezone, lastChecked, today in streaks.due_checks(session, now):
+                if (today - lastChecked).days > 1:
+                    streaks.catch_up_streaks(session, lastChecked, today, timezone)
+                else:
+                    streaks.evaluate_streaks(session, today, timezone)
+                streaks.mark_checked(session, timezone, today)
+            session.commit()
+    engine.dispose()
+
+
+def streak_states(url: str) -> list:
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        states = conn.execute(text("SELECT id, freezes, active, end_date FROM art_streaks ORDER BY id")).all()
+    engine.dispose()
+    return states
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run the sharded streak checks in several processes.")
+    parser.add_argument("--shards", type=int, default=4, help="total number of shards")
+    parser.add_argument("--guilds", type=int, default=400)
+    parser.add_argument("--days", type=int, default=7, help="simulated days")
+    args = parser.parse_args()
+
+    ticks = args.days * 24
+    half = args.shards // 2
+    # two processes splitting the shards plus one owning all of them, as during a rolling restart
+    assignments = [list(range(half)), list(range(half, args.shards)), list(range(args.shards))]
+    with tempfile.TemporaryDirectory() as tmp:
+        shardedUrl = f"sqlite:///{os.path.join(tmp, 'sharded.db')}"
+        referenceUrl = f"sqlite:///{os.path.join(tmp, 'reference.db')}"
+        populate(shardedUrl, args.guilds, args.shards)
+        populate(referenceUrl, args.guilds, 1)
+        # the reference's single bucket per timezone is shard 0 of an unsharded bot
+        reference(referenceUrl, ticks)
+
+        context = multiprocessing.get_context("spawn")
+        barrier = context.Barrier(len(assignments))
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(shardedUrl, args.shards, shardIds, ticks, barrier, results,
+                                                          seed))
+                     for seed, shardIds in enumerate(assignments)]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        counts = {}
+        for holder, checked, elapsed in outcomes:
+            print(f"{holder}: checked {len(checked)} bucket days in {elapsed:.2f} s")
+            for entry in checked:
+                counts[entry] = counts.get(entry, 0) + 1
+        # Every bucket's checked days have to run from the first day without a gap. They may stop early once the
+        # bucket has no active streaks left.
+        firstDay = START.date() - datetime.timedelta(1)
+        days = {}
+        for shard, timezone, day in counts:
+            days.setdefault((shard, timezone), set()).add(day)
+        gaps = [bucket for bucket, checked in days.items()
+                if checked != {firstDay + datetime.timedelta(i) for i in range((max(checked) - firstDay).days + 1)}]
+        twice = [entry for entry, count in counts.items() if count > 1]
+        matches = streak_states(shardedUrl) == streak_states(referenceUrl)
+    print(f"{len(counts)} bucket days checked, {len(twice)} of them more than once, {len(gaps)} bucket(s) with gaps")
+    print(f"final streak states {'match' if matches else 'DIFFER from'} the unsharded reference")
+    return 0 if not twice and not gaps and matches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
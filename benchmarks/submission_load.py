@@ -0,0 +1,137 @@
+# Load test of the submission write path. A burst of concurrent 'submitart' submissions is written to a scratch sqlite
+# database the way 'process_submission' does it, minus discord: the user's active streak is looked up, then the
+# submission is recorded. It's run three times:
+#
+#  - before: sqlite's default rollback journal with synchronous=FULL, and every submission committing on its own session
+#    like the commands used to.
+#  - tuned pragmas: WAL, synchronous=NORMAL and a busy timeout as configured in 'db.py', still one commit per submission.
+#  - group commit: the tuned pragmas with the submissions queued on the group commit writer from 'writer.py'.
+#
+# Submissions per second and the latency of a single submission are printed for every run.
+#
+# Run it from the repository root with 'python -m benchmarks.submission_load'.
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import db
+import models
+import queries
+import writer
+import writes
+
+TODAY = datetime.date(2024, 11, 16)
+
+
+def populate(path: str, guilds: int):
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Guild), [{"id": i, "art_channel_id": i} for i in range(guilds)])
+    engine.dispose()
+
+
+"""
+# Looks the user's active streak up, and the guild's art channel if there is none, like 'process_submission' does before
+# it relays the attachment.
+"""
+async def check_streak(Session, guild_id: int, user_id: int):
+    async with Session() as session:
+        if await session.scalar(queries.active_streak(guild_id, user_id)) is None:
+            await session.get(models.Guild, guild_id)
+
+
+"""
+# The submission write path as it was before the group commit writer: the streak is looked up again and the submission
+# is added and committed on a session of its own.
+"""
+async def submit_before(Session, guild_id: int, user_id: int):
+    await check_streak(Session, guild_id, user_id)
+    async with Session() as session:
+        streak = await session.scalar(queries.active_streak(guild_id, user_id))
+        if streak is None:
+            streak = models.ArtStreak(guild_id=guild_id, user_id=user_id, creation_date=TODAY)
+            session.add(streak)
+            await session.flush()
+        session.add(models.ArtStreakSubmission(art_streak_id=streak.id, creation_date=TODAY, user_id=user_id,
+                                               message_link=""))
+        streak.submission_count = models.ArtStreak.submission_count + 1
+        streak.last_submission_date = TODAY
+        await session.commit()
+
+
+async def submit_grouped(Session, groupWriter: writer.GroupCommitWriter, guild_id: int, user_id: int):
+    await check_streak(Session, guild_id, user_id)
+    await groupWriter.submit(writes.record_submission, guild_id, user_id, models.DEFAULT_TIMEZONE, TODAY, "")
+
+
+"""
+# Runs a burst of submissions against a fresh database and reports the throughput.
+# @Params:
+# label; Expected Type: str - name of the run
+# tuned; Expected Type: bool - whether the connections get the pragmas from 'db.py'
+# grouped; Expected Type: bool - whether the submissions go through the group commit writer
+"""
+async def run(label: str, tuned: bool, grouped: bool, submissions: int, concurrency: int, guilds: int, users: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "load.db")
+        populate(path, guilds)
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=AsyncAdaptedQueuePool,
+                                     pool_size=db.DB_POOL_SIZE, max_overflow=db.DB_MAX_OVERFLOW,
+                                     pool_timeout=db.DB_POOL_TIMEOUT)
+        if tuned:
+            db.tune_sqlite(engine)
+        Session = async_sessionmaker(engine, expire_on_commit=False)
+        groupWriter = writer.GroupCommitWriter(Session)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        failures = 0
+
+        async def one(i: int):
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    if grouped:
+                        await submit_grouped(Session, groupWriter, i % guilds, i % users)
+                    else:
+                        await submit_before(Session, i % guilds, i % users)
+                except Exception:
+                    failures += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(submissions)])
+        elapsed = time.perf_counter() - start
+        await groupWriter.stop()
+        async with Session() as session:
+            stored = await session.scalar(select(func.count(models.ArtStreakSubmission.id)))
+        await engine.dispose()
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    commits = f", {groupWriter.commits} commits" if grouped else ""
+    print(f"{label:>15}: {submissions / elapsed:7.0f} submissions/s, p50 {p50 * 1000:6.1f} ms, "
+          f"p99 {p99 * 1000:6.1f} ms, {stored} stored, {failures} failed{commits}")
+
+
+async def main(args):
+    await run("before", False, False, args.submissions, args.concurrency, args.guilds, args.users)
+    await run("tuned pragmas", True, False, args.submissions, args.concurrency, args.guilds, args.users)
+    await run("group commit", True, True, args.submissions, args.concurrency, args.guilds, args.users)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the submission throughput before and after group commits.")
+    parser.add_argument("--submissions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100, help="submissions in flight at once")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--users", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
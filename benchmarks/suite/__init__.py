@@ -0,0 +1,6 @@
+# Benchmark suite for the bot's commands and scheduled jobs. It builds a synthetic 'poke_bot.db' at a configurable scale
+# from the models in 'models.py' (see 'dataset.py'), imports 'main.py' against it without connecting to discord and
+# drives the real command callbacks and jobs through the stand-ins in 'fakes.py', on a clock the suite controls. Every
+# scenario's wall time, number of SQL statements and peak memory is recorded and compared against a stored baseline.
+#
+# Run it from the repository root with 'python -m benchmarks.suite'; '--help' lists the scale and baseline options.
@@ -0,0 +1,6 @@
+# Entry point of 'python -m benchmarks.suite'. The runner lives in 'runner.py' so the processes it spawns can import it.
+import sys
+
+from benchmarks.suite import runner
+
+sys.exit(runner.main())
@@ -0,0 +1,108 @@
+# Synthetic database for the benchmark suite. Builds a 'poke_bot.db' with the schema from 'models.py' filled with
+# guilds, users with their timezones and vc notif subscriptions, ended and running art streaks with their submissions
+# and the check buckets of every timezone. The data is generated from a fixed seed, so two builds at the same scale are
+# identical and their benchmark runs comparable.
+import datetime
+import random
+
+from sqlalchemy import create_engine, insert
+
+import models
+import streaks
+
+# Timezones the synthetic users are spread over
+TIMEZONES = ("America/Denver", "America/New_York", "Europe/Berlin", "Asia/Tokyo", "Australia/Sydney")
+# Rows inserted per statement
+BATCH = 50_000
+
+
+"""
+# Scale of a synthetic database.
+# @Params:
+# guilds; Expected Type: int - number of guilds
+# users; Expected Type: int - number of users, each of them a member of one guild
+# streaks_per_user; Expected Type: int - art streaks of every user, the most recent one still running
+# submissions_per_streak; Expected Type: int - submissions of every streak, one per day
+"""
+class Scale:
+    def __init__(self, guilds: int, users: int, streaks_per_user: int, submissions_per_streak: int):
+        self.guilds = guilds
+        self.users = users
+        self.streaksPerUser = streaks_per_user
+        self.submissionsPerStreak = submissions_per_streak
+
+    def as_dict(self) -> dict:
+        return {"guilds": self.guilds, "users": self.users, "streaks_per_user": self.streaksPerUser,
+                "submissions_per_streak": self.submissionsPerStreak}
+
+
+def guild_id(index: int) -> int:
+    # shaped like a discord snowflake so the guilds spread over the shards
+    return ((index + 1) << 22) | index
+
+
+def user_id(index: int) -> int:
+    return 1_000_000 + index
+
+
+"""
+# Returns the guild a synthetic user is a member of.
+# @Params:
+# index; Expected Type: int - index of the user
+# scale; Expected Type: Scale - scale of the database
+"""
+def home_guild(index: int, scale: Scale) -> int:
+    return guild_id(index % scale.guilds)
+
+
+"""
+# Builds the synthetic database. The running streaks were last submitted to between today and three days ago, so the
+# streak check finds fulfilled, frozen and terminated streaks, and every timezone's bucket was last checked the day
+# before 'now', so the check is due once the clock reaches 'now'.
+# @Params:
+# path; Expected Type: str - file the database is written to
+# scale; Expected Type: Scale - how much data to generate
+# now; Expected Type: datetime.datetime - timezone aware time the scheduled jobs will be run at
+"""
+def build(path: str, scale: Scale, now: datetime.datetime):
+    rng = random.Random(0)
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    userRows = []
+    subscriptionRows = []
+    streakRows = []
+    submissionRows = []
+    for index in range(scale.users):
+        timezone = rng.choice(TIMEZONES)
+        userRows.append({"id": user_id(index), "timezone": timezone})
+        if rng.random() < 0.25:
+            subscriptionRows.append({"user_id": user_id(index), "guild_id": home_guild(index, scale)})
+        today = streaks.local_date(timezone, now)
+        # the running streak's last submission, the older streaks ended a few weeks apart before it started
+        lastSubmission = today - datetime.timedelta(rng.choices([0, 1, 2, 3], weights=[40, 40, 15, 5])[0])
+        for number in range(scale.streaksPerUser):
+            active = number == scale.streaksPerUser - 1
+            gap = (scale.streaksPerUser - 1 - number) * (scale.submissionsPerStreak + 14)
+            end = lastSubmission - datetime.timedelta(gap)
+            creation = end - datetime.timedelta(max(scale.submissionsPerStreak - 1, 0))
+            streakId = len(streakRows) + 1
+            streakRows.append({"id": streakId, "guild_id": home_guild(index, scale), "user_id": user_id(index),
+                               "creation_date": creation, "end_date": None if active else end + datetime.timedelta(3),
+                               "active": active, "freezes": rng.randint(0, 2), "timezone": timezone,
+                               "last_submission_date": end if scale.submissionsPerStreak else None,
+                               "submission_count": scale.submissionsPerStreak})
+            for day in range(scale.submissionsPerStreak):
+                submissionRows.append({"art_streak_id": streakId, "user_id": user_id(index),
+                                       "creation_date": creation + datetime.timedelta(day),
+                                       "message_link": f"https://discord.com/channels/{streakId}/{day}"})
+    with engine.begin() as conn:
+        conn.execute(insert(models.Guild), [{"id": guild_id(i), "art_channel_id": guild_id(i) + 1}
+                                            for i in range(scale.guilds)])
+        for table, rows in ((models.User, userRows), (models.subscriber_association_table, subscriptionRows),
+                            (models.ArtStreak, streakRows), (models.ArtStreakSubmission, submissionRows)):
+            for start in range(0, len(rows), BATCH):
+                conn.execute(insert(table), rows[start:start + BATCH])
+        conn.execute(insert(models.StreakCheckBucket), [
+            {"timezone": timezone, "last_check_date": streaks.local_date(timezone, now) - datetime.timedelta(1)}
+            for timezone in TIMEZONES])
+    engine.dispose()
@@ -0,0 +1,162 @@
+# Stand-ins for the parts of discord the benchmark suite drives the bot through: a clock the suite sets, channels and
+# interactions that record what the bot sends instead of calling discord's API, and a local http server the submitted
+# attachments are relayed from. 'install' wires them into an imported 'main' module.
+import datetime
+import itertools
+
+from aiohttp import web
+
+
+"""
+# Clock the bot reads the time from while the suite runs. It only moves when it's set.
+# @Params:
+# now; Expected Type: datetime.datetime - timezone aware starting time
+"""
+class FakeClock:
+    def __init__(self, now: datetime.datetime):
+        self._now = now
+
+    def now(self) -> datetime.datetime:
+        return self._now
+
+    def set(self, now: datetime.datetime):
+        self._now = now
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, content: str):
+        self.id = next(FakeMessage._ids)
+        self.content = content
+        self.jump_url = f"https://discord.com/channels/0/0/{self.id}"
+
+
+"""
+# Text channel that counts the messages sent to it.
+"""
+class FakeChannel:
+    def __init__(self, channel_id: int, outbox: list):
+        self.id = channel_id
+        self.outbox = outbox
+
+    async def send(self, content: str = None, **kwargs) -> FakeMessage:
+        self.outbox.append((self.id, content))
+        return FakeMessage(content)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = str(guild_id)
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self._done = False
+
+    async def send_message(self, content: str = None, **kwargs):
+        self.interaction.outbox.append((self.interaction.guild_id, content))
+        self._done = True
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    def is_done(self) -> bool:
+        return self._done
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+
+    async def send(self, content: str = None, file=None, **kwargs) -> FakeMessage:
+        if file is not None:
+            # read the relayed attachment like discord.py does when it uploads it
+            file.fp.read()
+            file.close()
+        self.interaction.outbox.append((self.interaction.guild_id, content))
+        return FakeMessage(content)
+
+
+"""
+# Slash command interaction of a user on a guild. Responses and followups are recorded in the outbox.
+# @Params:
+# guild_id; Expected Type: int - id of the guild the command was used on
+# user_id; Expected Type: int - id of the user that used it
+# outbox; Expected Type: list - receives a (guild id, content) tuple for every response
+"""
+class FakeInteraction:
+    def __init__(self, guild_id: int, user_id: int, outbox: list):
+        self.guild_id = guild_id
+        self.guild = FakeGuild(guild_id)
+        self.user = FakeUser(user_id)
+        self.outbox = outbox
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+
+class FakeAttachment:
+    def __init__(self, url: str, size: int):
+        self.url = url
+        self.size = size
+        self.content_type = "image/png"
+        self.filename = "art.png"
+
+
+"""
+# Local http server the submitted attachments are downloaded from, standing in for discord's CDN.
+# @Params:
+# size; Expected Type: int - size in bytes of the served attachment
+"""
+class AttachmentServer:
+    def __init__(self, size: int = 256 * 1024):
+        self.size = size
+        self._runner = None
+        self.url = None
+
+    async def start(self):
+        body = b"\x89PNG" + bytes(self.size - 4)
+        app = web.Application()
+        app.router.add_get("/art.png", lambda request: web.Response(body=body, content_type="image/png"))
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}/art.png"
+
+    def attachment(self) -> FakeAttachment:
+        return FakeAttachment(self.url, self.size)
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+"""
+# Points an imported 'main' module at the stand-ins: the bot reads the time from the clock, is a member of the provided
+# guilds and resolves channels to fake ones that record what is sent to them.
+# @Params:
+# main; Expected Type: module - the imported 'main.py'
+# clock; Expected Type: FakeClock - clock the bot reads the time from
+# guild_ids; Expected Type: [int] - guilds the bot is a member of
+# outbox; Expected Type: list - receives a (channel id, content) tuple for every message sent to a channel
+"""
+def install(main, clock: FakeClock, guild_ids: list, outbox: list):
+    main.utc_now = clock.now
+    main.bot._connection._guilds = {guildId: FakeGuild(guildId) for guildId in guild_ids}
+    channels = {}
+
+    def get_channel(channel_id: int) -> FakeChannel:
+        if channel_id not in channels:
+            channels[channel_id] = FakeChannel(channel_id, outbox)
+        return channels[channel_id]
+
+    main.bot.get_channel = get_channel
@@ -0,0 +1,275 @@
+# Runner of the benchmark suite. Builds the synthetic database, then imports 'main.py' in a fresh process against a copy
+# of it and runs every scenario in order on the simulated clock:
+#
+#  - startup: the guild reconciliation and cache warm up 'on_ready' starts, a day before the jobs run.
+#  - check_streaks: the nightly streak check of every timezone, including the announcements.
+#  - push_reminder: the reminders of every timezone.
+#  - submitart: a burst of 'submitart' commands, relayed and written through the submission pipeline.
+#  - streakstats: 'streakstats' lookups of distinct users, all served from the database.
+#  - subscriptions: 'subscribe', 'amisubscribed' and 'unsubscribe' of distinct users.
+#
+# Every scenario's wall time, number of SQL statements (not counting transaction control, which varies with how the
+# group commit writer happens to batch) and peak traced memory is printed. The scenarios are timed over several runs,
+# each on a fresh copy, keeping every scenario's fastest time; the peak memory comes from one more run, as tracing the
+# allocations would slow the timed runs down. The results are compared against the baseline file if it exists and was
+# recorded at the same scale; a scenario regresses if it issues more statements or takes more time or memory than the
+# tolerance allows. The script exits with a non-zero status if anything regressed.
+# '--save-baseline' stores the run as the new baseline instead. Baselines hold wall times, so they are only comparable
+# on the machine they were recorded on and aren't checked in.
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import event
+
+from benchmarks.suite import dataset, fakes
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Monday 06:30 UTC: past midnight in every timezone of the dataset and not a sunday anywhere, so the check doesn't renew
+# any freezes and every bucket is due exactly once.
+CHECK_TIME = datetime.datetime(2024, 11, 18, 6, 30, tzinfo=datetime.timezone.utc)
+# Statements that only open or close (nested) transactions
+TRANSACTION_CONTROL = ("BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK", "COMMIT")
+# Below this many milliseconds a wall time difference is noise
+WALL_NOISE_MS = 5.0
+
+
+"""
+# Counts the SQL statements an engine executes.
+# @Params:
+# engine; Expected Type: sqlalchemy.Engine - the sync engine behind the bot's async engine
+"""
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(TRANSACTION_CONTROL):
+            self.count += 1
+
+
+"""
+# Runs one scenario and measures it.
+# @Params:
+# scenario; Expected Type: coroutine function - the scenario, returning a dict of what it did, e.g. messages sent
+# counter; Expected Type: StatementCounter - the statement counter of the bot's engine
+# traced; Expected Type: bool - whether to trace the peak memory, which slows the scenario down
+# @Returns:
+# dict of the scenario's measurements
+"""
+async def measure(scenario, counter: StatementCounter, traced: bool) -> dict:
+    statements = counter.count
+    if traced:
+        tracemalloc.start()
+    start = time.perf_counter()
+    work = await scenario()
+    wall = time.perf_counter() - start
+    peak = 0
+    if traced:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"wall_ms": round(wall * 1000, 1), "statements": counter.count - statements,
+            "peak_kib": round(peak / 1024), **work}
+
+
+"""
+# Runs every scenario against the bot.
+# @Params:
+# main; Expected Type: module - 'main.py', imported against the synthetic database
+# scale; Expected Type: dataset.Scale - scale of the synthetic database
+# operations; Expected Type: int - commands issued by each of the command scenarios
+# traced; Expected Type: bool - whether to trace the peak memory of the scenarios
+# @Returns:
+# dict mapping scenario names to their measurements
+"""
+async def run_scenarios(main, scale: dataset.Scale, operations: int, traced: bool) -> dict:
+    rng = random.Random(1)
+    clock = fakes.FakeClock(CHECK_TIME - datetime.timedelta(1))
+    outbox = []
+    fakes.install(main, clock, [dataset.guild_id(i) for i in range(scale.guilds)], outbox)
+    server = fakes.AttachmentServer()
+    await server.start()
+    counter = StatementCounter(main.engine.sync_engine)
+    userIndexes = rng.sample(range(scale.users), min(operations, scale.users))
+
+    def sent() -> dict:
+        messages = len(outbox)
+        outbox.clear()
+        return {"messages": messages}
+
+    async def startup():
+        await main.startup_sync()
+        return {"guilds": scale.guilds}
+
+    async def check_streaks():
+        clock.set(CHECK_TIME)
+        await main.check_streaks()
+        return sent()
+
+    async def push_reminder():
+        # every timezone is reminded, not just the ones at a reminder hour
+        await main.push_reminder(force=True)
+        return sent()
+
+    async def submit_art():
+        for index in userIndexes:
+            interaction = fakes.FakeInteraction(dataset.home_guild(index, scale), dataset.user_id(index), outbox)
+            await main.submit_art.callback(interaction, server.attachment())
+        await main.pipeline.submission_pipeline.join()
+        return {"commands": len(userIndexes), "failed": main.pipeline.submission_pipeline.failed, **sent()}
+
+    async def streak_stats():
+        main.cache.stats_cache.clear()
+        for index in userIndexes:
+            interaction = fakes.FakeInteraction(dataset.home_guild(index, scale), dataset.user_id(index), outbox)
+            await main.streak_stats.callback(interaction, fakes.FakeUser(dataset.user_id(index)))
+        return {"commands": len(userIndexes), **sent()}
+
+    async def subscriptions():
+        for index in userIndexes:
+            for command in (main.subscribe, main.am_i_subscribed, main.unsubscribe):
+                interaction = fakes.FakeInteraction(dataset.home_guild(index, scale), dataset.user_id(index), outbox)
+                await command.callback(interaction)
+        return {"commands": 3 * len(userIndexes), **sent()}
+
+    results = {}
+    try:
+        for name, scenario in (("startup", startup), ("check_streaks", check_streaks),
+                               ("push_reminder", push_reminder), ("submitart", submit_art),
+                               ("streakstats", streak_stats), ("subscriptions", subscriptions)):
+            results[name] = await measure(scenario, counter, traced)
+    finally:
+        await main.pipeline.submission_pipeline.stop()
+        await main.writer.group_writer.stop()
+        await main.media.close()
+        await server.stop()
+        await main.engine.dispose()
+    return results
+
+
+"""
+# Runs every scenario in a fresh process against a copy of the synthetic database, so the bot starts from the same state
+# with cold caches every time.
+# @Params:
+# path; Expected Type: str - the synthetic database, copied before the run
+# scale; Expected Type: dataset.Scale - scale of the synthetic database
+# operations; Expected Type: int - commands issued by each of the command scenarios
+# traced; Expected Type: bool - whether to trace the peak memory of the scenarios
+# @Returns:
+# dict mapping scenario names to their measurements
+"""
+def run_pass(path: str, scale: dataset.Scale, operations: int, traced: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "poke_bot.db")
+        shutil.copy(path, copy)
+        # 'db.py' and 'logconfig.py' read their configuration when 'main' imports them
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{copy}"
+        os.environ["LOG_FILE"] = os.path.join(tmp, "poke_bot.log")
+        os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+        main = importlib.import_module("main")
+        try:
+            return asyncio.run(run_scenarios(main, scale, operations, traced))
+        finally:
+            main.logconfig.shutdown()
+
+
+def format_result(result: dict) -> str:
+    extra = ", ".join(f"{key} {value}" for key, value in result.items()
+                      if key not in ("wall_ms", "statements", "peak_kib"))
+    return f"{result['wall_ms']:9.1f} ms, {result['statements']:6d} statements, {result['peak_kib']:7d} KiB peak" \
+           + (f" ({extra})" if extra else "")
+
+
+"""
+# Compares a run against the baseline.
+# @Params:
+# results; Expected Type: dict - measurements of the run
+# baseline; Expected Type: dict - measurements of the baseline run
+# tolerance; Expected Type: float - share by which wall time and peak memory may exceed the baseline
+# @Returns:
+# list of regression descriptions, empty if nothing regressed
+"""
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["statements"] > base["statements"]:
+            regressions.append(f"{name}: {result['statements']} statements, baseline {base['statements']}")
+        if result["wall_ms"] > base["wall_ms"] * (1 + tolerance) and \
+                result["wall_ms"] - base["wall_ms"] > WALL_NOISE_MS:
+            regressions.append(f"{name}: {result['wall_ms']} ms, baseline {base['wall_ms']} ms")
+        if result["peak_kib"] > base["peak_kib"] * (1 + tolerance):
+            regressions.append(f"{name}: {result['peak_kib']} KiB peak, baseline {base['peak_kib']} KiB")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the bot's commands and scheduled jobs on synthetic data.")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--streaks-per-user", type=int, default=3)
+    parser.add_argument("--submissions-per-streak", type=int, default=10)
+    parser.add_argument("--operations", type=int, default=200, help="commands issued by each command scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs, the fastest one of every scenario counts")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file to compare against or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="share by which wall time and peak memory may exceed the baseline")
+    parser.add_argument("--keep-db", help="build the database at this path and keep it after the run")
+    args = parser.parse_args()
+    scale = dataset.Scale(args.guilds, args.users, args.streaks_per_user, args.submissions_per_streak)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.keep_db or os.path.join(tmp, "poke_bot.db")
+        if os.path.exists(path):
+            os.remove(path)
+        start = time.perf_counter()
+        dataset.build(path, scale, CHECK_TIME)
+        print(f"Built {path} at {scale.as_dict()} in {time.perf_counter() - start:.1f} s")
+        # Wall times and statements come from untraced passes, since tracing every allocation slows the bot down a
+        # few times over, and every scenario keeps its fastest wall time to filter out noise. The peak memory comes
+        # from one more, traced pass.
+        context = multiprocessing.get_context("spawn")
+        passes = []
+        for traced in [False] * args.repeat + [True]:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                passes.append(executor.submit(run_pass, path, scale, args.operations, traced).result())
+    results = passes[0]
+    for name, result in results.items():
+        result["wall_ms"] = min(timed[name]["wall_ms"] for timed in passes[:-1])
+        result["peak_kib"] = passes[-1][name]["peak_kib"]
+        print(f"{name:>14}: {format_result(result)}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"scale": scale.as_dict(), "operations": args.operations, "scenarios": results}, f, indent=2)
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["scale"] != scale.as_dict() or baseline["operations"] != args.operations:
+        print(f"The baseline was recorded at {baseline['scale']} with {baseline['operations']} operations, "
+              f"not comparing")
+        return 0
+    regressions = compare(results, baseline["scenarios"], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions against the baseline.")
+    return 1 if regressions else 0
@@ -0,0 +1,136 @@
+# Replays bursts of voice state updates through 'voice.VoiceOccupancy' and checks how many notification waves it lets
+# through. Every scenario is a list of (seconds, member, channel) events applied to a fake guild; the expected number of
+# waves is compared to what the tracker reports and the script exits with a non-zero status on any mismatch. Afterwards
+# the per update cost of the tracker is compared to re-summing every voice channel's population on a large guild.
+#
+# Run it from the repository root with 'python -m benchmarks.voice_bursts'.
+import sys
+import time
+
+import discord
+
+from voice import VoiceOccupancy
+
+COOLDOWN = 300
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, channel_type: discord.ChannelType = discord.ChannelType.voice):
+        self.id = channel_id
+        self.type = channel_type
+        self.members = []
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, channels: int):
+        self.id = guild_id
+        self.voice_channels = [FakeChannel(i) for i in range(channels)]
+        # The last channel doubles as the afk channel.
+        self.afk_channel = self.voice_channels[-1]
+        # Stage channels aren't part of 'voice_channels', like in discord.py.
+        self.stage_channel = FakeChannel(channels, discord.ChannelType.stage_voice)
+
+
+"""
+# Applies the events of a scenario to a fresh tracker and returns the number of notification waves it triggered. Members
+# are moved between the fake channels exactly like the gateway cache would, so a reseed at the end can be compared with
+# the incrementally maintained count.
+# @Params:
+# events; Expected Type: [(float, int, int or None)] - time of the update, member id and index of the channel the member
+# moves to, None for disconnecting ('afk' moves them to the afk channel, 'stage' to the stage channel)
+# seeded; Expected Type: {int: int} - members already connected before the tracker is seeded, mapped to their channel
+"""
+def replay(events: list, seeded: dict = None) -> (int, VoiceOccupancy, FakeGuild):
+    guild = FakeGuild(1, 4)
+    located = {}
+    for member, index in (seeded or {}).items():
+        guild.voice_channels[index].members.append(member)
+        located[member] = guild.voice_channels[index]
+    tracker = VoiceOccupancy(cooldown=COOLDOWN)
+    tracker.seed([guild])
+    waves = 0
+    for now, member, index in events:
+        before = located.get(member)
+        if index is None:
+            after = None
+        else:
+            after = {"afk": guild.afk_channel, "stage": guild.stage_channel}.get(index) or guild.voice_channels[index]
+        if before is not None:
+            before.members.remove(member)
+        if after is not None:
+            after.members.append(member)
+        located[member] = after
+        if tracker.update(guild, before, after, now=now):
+            waves += 1
+    return waves, tracker, guild
+
+
+"""
+# Lists the scenarios to replay, each paired with the number of notification waves it should trigger.
+"""
+def scenarios() -> list:
+    return [
+        ("single join", [(0, 1, 0)], 1),
+        ("second member joining an occupied vc", [(0, 1, 0), (5, 2, 1)], 1),
+        ("join/leave/rejoin bounce", [(0, 1, 0), (2, 1, None), (3, 1, 0), (4, 1, None), (6, 1, 0)], 1),
+        ("bounce from several members", [(t, t % 7, 0 if t % 2 == 0 else None) for t in range(0, 200)], 1),
+        ("rejoin after the cooldown", [(0, 1, 0), (10, 1, None), (COOLDOWN + 10, 1, 0)], 2),
+        ("rejoin right before the cooldown ends", [(0, 1, 0), (10, 1, None), (COOLDOWN - 1, 1, 0)], 1),
+        ("joining the afk channel", [(0, 1, "afk"), (5, 2, "afk")], 0),
+        ("moving from the afk channel into a vc", [(0, 1, "afk"), (5, 1, 0)], 1),
+        ("joining a stage channel", [(0, 1, "stage"), (5, 2, "stage")], 0),
+        ("moving from a stage channel into a vc", [(0, 1, "stage"), (5, 1, 0), (6, 1, "stage")], 1),
+        ("moving between vcs", [(0, 1, 0), (5, 1, 1), (6, 1, 2)], 1),
+        ("vc occupied before startup", [(0, 2, 1), (5, 2, None)], 0, {1: 0}),
+        ("vc emptied after startup", [(0, 1, None), (COOLDOWN, 2, 0)], 1, {1: 0}),
+    ]
+
+
+"""
+# Measures the average cost of handling one update with the tracker and with the previous approach of summing the
+# population of every voice channel.
+# @Params:
+# channels; Expected Type: int - number of voice channels on the guild
+# members; Expected Type: int - number of members connected across them
+# updates; Expected Type: int - number of updates to time
+"""
+def time_updates(channels: int = 500, members: int = 5000, updates: int = 20000) -> (float, float):
+    guild = FakeGuild(1, channels)
+    for member in range(members):
+        guild.voice_channels[member % (channels - 1)].members.append(member)
+    tracker = VoiceOccupancy(cooldown=COOLDOWN)
+    tracker.seed([guild])
+    first = guild.voice_channels[0]
+    start = time.perf_counter()
+    for i in range(updates):
+        tracker.update(guild, None if i % 2 else first, first if i % 2 else None, now=i)
+    incremental = (time.perf_counter() - start) / updates
+    start = time.perf_counter()
+    for _ in range(updates):
+        sum(len(channel.members) for channel in guild.voice_channels if channel is not guild.afk_channel)
+    summed = (time.perf_counter() - start) / updates
+    return incremental, summed
+
+
+def main() -> int:
+    failures = 0
+    for label, events, expected, *seeded in scenarios():
+        waves, tracker, guild = replay(events, *seeded)
+        # The incrementally maintained count has to match a fresh count of the fake gateway cache.
+        counted = tracker.count(guild.id)
+        tracker.seed([guild])
+        ok = waves == expected and counted == tracker.count(guild.id)
+        failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {label}: {waves} wave(s), expected {expected}; "
+              f"tracked population {counted}, recounted {tracker.count(guild.id)}")
+    incremental, summed = time_updates()
+    print(f"Per update: incremental tracker {incremental * 1e6:.2f} us, summing every channel {summed * 1e6:.2f} us")
+    if failures:
+        print(f"{failures} scenario(s) failed.")
+        return 1
+    print("All scenarios passed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# In-memory caches that let the hot commands skip the database. Everything in here lives for the lifetime of the bot
+# process and is kept current by the commands and jobs that change the underlying rows.
+
+
+"""
+# Cache of the aggregate streak stats served by 'streakstats', keyed on (guild id, user id). Entries are dropped when a
+# user submits art or a streak of theirs is terminated, and the whole cache is cleared by the nightly streak check since
+# it ends streaks. The length of a running streak isn't cached, 'streakstats' works it out from the day it started.
+"""
+class StreakStatsCache:
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    """
+    # Returns the cached stats row for a user on a guild, or None if they have to be pulled from the database.
+    # @Params:
+    # guild_id; Expected Type: int - id of the guild the stats are for
+    # user_id; Expected Type: int - id of the user the stats are for
+    """
+    def get(self, guild_id: int, user_id: int):
+        stats = self._entries.get((guild_id, user_id))
+        if stats is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return stats
+
+    def set(self, guild_id: int, user_id: int, stats):
+        self._entries[(guild_id, user_id)] = stats
+
+    def invalidate(self, guild_id: int, user_id: int):
+        self._entries.pop((guild_id, user_id), None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+stats_cache = StreakStatsCache()
+
+
+"""
+# Set of the ids of every user that has an entry in the users table. It's warmed with all of them at startup and grows
+# as the commands register new users, so commands only have to go to the database to register a user the bot has never
+# seen. Users are never deleted, so an id in here is always backed by a row; one missing from it just means a redundant
+# (and harmless) upsert.
+"""
+class KnownUsers:
+    def __init__(self):
+        self._ids = set()
+        self.hits = 0
+        self.misses = 0
+
+    """
+    # Adds the provided user ids, e.g. every id in the users table at startup.
+    # @Params:
+    # user_ids; Expected Type: iterable of int - ids of users that have an entry
+    """
+    def load(self, user_ids):
+        self._ids.update(user_ids)
+
+    def add(self, user_id: int):
+        self._ids.add(user_id)
+
+    """
+    # Returns whether the user is known to have an entry, counting hits and misses.
+    # @Params:
+    # user_id; Expected Type: int - id of the user
+    """
+    def known(self, user_id: int) -> bool:
+        if user_id in self._ids:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+known_users = KnownUsers()
+
+
+"""
+# Index of every guild's vc notif subscribers as a set of user ids per guild, so the voice handler can look them up
+# without a query. It's loaded at startup with the subscriptions on the process' shards and kept in step by 'subscribe',
+# 'unsubscribe' and the guild removal. Until it's loaded 'subscribers' returns None and callers go to the database.
+"""
+class SubscriberIndex:
+    def __init__(self):
+        self._subscribers = {}
+        self.loaded = False
+
+    """
+    # Replaces the index with the provided subscriptions.
+    # @Params:
+    # pairs; Expected Type: iterable of (int, int) - (guild id, user id) of every subscription
+    """
+    def load(self, pairs):
+        subscribers = {}
+        for guildId, userId in pairs:
+            subscribers.setdefault(guildId, set()).add(userId)
+        self._subscribers = subscribers
+        self.loaded = True
+
+    def add(self, guild_id: int, user_id: int):
+        self._subscribers.setdefault(guild_id, set()).add(user_id)
+
+    def remove(self, guild_id: int, user_id: int):
+        subscribers = self._subscribers.get(guild_id)
+        if subscribers is not None:
+            subscribers.discard(user_id)
+            if not subscribers:
+                del self._subscribers[guild_id]
+
+    def forget(self, guild_id: int):
+        self._subscribers.pop(guild_id, None)
+
+    """
+    # Returns the ids of a guild's subscribers, or None if the index hasn't been loaded yet. The returned set must not
+    # be modified.
+    # @Params:
+    # guild_id; Expected Type: int - id of the guild
+    """
+    def subscribers(self, guild_id: int):
+        if not self.loaded:
+            return None
+        return self._subscribers.get(guild_id, frozenset())
+
+    def __len__(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+subscriber_index = SubscriberIndex()
+
+
+# Returned by the lookups that accept a default for entries that aren't cached
+MISSING = object()
+
+
+"""
+# Cache of every guild's configuration, currently just its designated art channel, plus a resolver that turns channel
+# ids into channel objects. It's loaded once in 'on_ready' and kept current by 'designate_art_channel', 'on_guild_join'
+# and 'on_guild_remove'. Channels are resolved from discord.py's gateway cache first and only fetched over REST on a
+# miss; the hit and miss counters track how often that fallback happens.
+"""
+class GuildConfigCache:
+    def __init__(self):
+        self._artChannels = {}
+        self.hits = 0
+        self.misses = 0
+
+    """
+    # Replaces the cached configuration with the provided one.
+    # @Params:
+    # art_channels; Expected Type: {int: int} - dict mapping guild ids to their art channel id (or None)
+    """
+    def load(self, art_channels: dict):
+        self._artChannels = dict(art_channels)
+
+    def set_art_channel(self, guild_id: int, art_channel_id):
+        self._artChannels[guild_id] = art_channel_id
+
+    def remove(self, guild_id: int):
+        self._artChannels.pop(guild_id, None)
+
+    """
+    # Returns the cached art channel id of a guild.
+    # @Params:
+    # guild_id; Expected Type: int - id of the guild
+    # default; Expected Type: object - returned if the guild isn't cached, e.g. because the cache hasn't been loaded
+    #                                  yet. Pass MISSING to tell a miss apart from a guild without an art channel.
+    """
+    def art_channel_id(self, guild_id: int, default=None):
+        return self._artChannels.get(guild_id, default)
+
+    """
+    # Resolves a channel id to a channel object, preferring the gateway cache over a REST request.
+    # @Params:
+    # bot; Expected Type: discord.Client - the bot whose caches and http client are used
+    # channel_id; Expected Type: int - id of the channel to resolve
+    """
+    async def resolve_channel(self, bot, channel_id: int):
+        channel = bot.get_channel(channel_id)
+        if channel is not None:
+            self.hits += 1
+            return channel
+        self.misses += 1
+        return await bot.fetch_channel(channel_id)
+
+
+guild_config = GuildConfigCache()
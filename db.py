@@ -0,0 +1,81 @@
+# Async data access layer for the bot. All coroutines talk to the database through the 'Session' factory defined here so
+# that queries run on aiosqlite's worker threads instead of blocking the gateway event loop.
+#
+# Pool / concurrency configuration (all optional, read from the environment or the .env file):
+#
+#  - DATABASE_URL: async database url. Defaults to the local sqlite file 'sqlite+aiosqlite:///poke_bot.db'. The store is
+#    SQLite only: the writes in 'writes.py' use sqlite's upserts, the models its partial indexes and date functions and
+#    the archival job its pragmas, so the url has to point at a sqlite file.
+#  - DB_POOL_SIZE: number of connections kept open in the pool. Every connection owns one aiosqlite worker thread, so
+#    this is also the number of queries that can run at the same time. Defaults to 5.
+#  - DB_MAX_OVERFLOW: extra connections that may be opened on top of the pool during bursts. Defaults to 5.
+#  - DB_POOL_TIMEOUT: seconds a coroutine waits for a free connection before giving up with an error. Defaults to 30.
+#
+# sqlite only allows one writer at a time no matter how many connections are open, so raising the pool size mostly helps
+# concurrent reads. Sessions never expire their objects on commit so attributes stay readable after a commit without
+# triggering a lazy load, which isn't possible in async code.
+#
+# Synchronous helpers like the ones in 'streaks.py' are run on an async session via 'await session.run_sync(...)'.
+#
+# Statements aren't echoed; set 'LOG_LEVELS=sqlalchemy.engine=INFO' to have them logged (see 'logconfig.py').
+#
+# sqlite connections are tuned when they're opened (all optional as well):
+#
+#  - DB_JOURNAL_MODE: sqlite journal mode. Defaults to WAL, which lets reads carry on while a write is committed and
+#    turns a commit into a single append to the write-ahead log.
+#  - DB_SYNCHRONOUS: sqlite synchronous level. Defaults to NORMAL, which in WAL mode only syncs to disk on checkpoints; a
+#    commit survives the bot crashing but may be lost if the machine loses power.
+#  - DB_BUSY_TIMEOUT: milliseconds a connection waits for another one to release its lock before giving up with
+#    'database is locked'. Defaults to 5000.
+#
+# Most writes don't commit on their own session but are handed to the group commit writer in 'writer.py'.
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///poke_bot.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))
+
+
+"""
+# Sets the journal mode, synchronous level and busy timeout on every new connection of a sqlite engine. Engines of other
+# databases, which only the tooling ever opens, are left alone.
+# @Params:
+# engine; Expected Type: sqlalchemy.ext.asyncio.AsyncEngine - the engine to configure
+# journal_mode; Expected Type: str - sqlite journal mode
+# synchronous; Expected Type: str - sqlite synchronous level
+# busy_timeout; Expected Type: int - milliseconds to wait on a locked database
+"""
+def tune_sqlite(engine: AsyncEngine, journal_mode: str = DB_JOURNAL_MODE, synchronous: str = DB_SYNCHRONOUS,
+                busy_timeout: int = DB_BUSY_TIMEOUT):
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+        cursor.close()
+
+
+# Create the async database engine and the session factory every coroutine uses to talk to the database. aiosqlite
+# defaults to opening a new connection per session, so the queue pool is requested explicitly to keep connections alive.
+engine = create_async_engine(DATABASE_URL,
+                             poolclass=AsyncAdaptedQueuePool,
+                             pool_size=DB_POOL_SIZE,
+                             max_overflow=DB_MAX_OVERFLOW,
+                             pool_timeout=DB_POOL_TIMEOUT)
+tune_sqlite(engine)
+Session = async_sessionmaker(engine, expire_on_commit=False)
@@ -0,0 +1,204 @@
+# Streaming export of a guild's art streak history for the 'export_streaks' command. The history is read through
+# sqlalchemy's streamed results, EXPORT_BATCH rows at a time, and every batch is passed down a pipeline that turns the
+# rows into records, encodes them as CSV or JSON lines and gzips them into the part that's being filled. Only one batch
+# is ever held in memory and the parts are spooled to disk once they outgrow EXPORT_SPOOL_THRESHOLD, so memory use stays
+# the same no matter how long the guild's history is. Encoding and compression run on a worker thread so a large export
+# doesn't block the event loop.
+#
+# Every record is either a streak or a submission, from the hot tables or from the archive (see 'archive.py'). The CSV
+# has one column per field of either kind and leaves the fields of the other kind empty, JSON lines records only carry
+# their own fields. A part is closed once the next batch would push it past the part size, so every part is a complete
+# gzip file of its own, CSV parts starting with the header row.
+#
+# Configuration (all optional, read from the environment or the .env file):
+#
+#  - EXPORT_BATCH: rows fetched from the database and compressed at a time. Defaults to 1000.
+#  - EXPORT_PART_SIZE: largest part in bytes. Defaults to 0, which uses the upload limit of the guild.
+#  - EXPORT_COMPRESSION_LEVEL: gzip compression level from 1 to 9. Defaults to 6.
+#  - EXPORT_SPOOL_THRESHOLD: size in bytes above which a part is spooled to disk. Defaults to 1 MiB.
+import asyncio
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import zlib
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import queries
+import streaks
+
+load_dotenv()
+
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "1000"))
+EXPORT_PART_SIZE = int(os.getenv("EXPORT_PART_SIZE", "0"))
+EXPORT_COMPRESSION_LEVEL = int(os.getenv("EXPORT_COMPRESSION_LEVEL", "6"))
+EXPORT_SPOOL_THRESHOLD = int(os.getenv("EXPORT_SPOOL_THRESHOLD", str(1024 * 1024)))
+
+FORMATS = ("csv", "jsonl")
+# Columns of the CSV, every field of a streak or a submission record
+FIELDS = ("type", "archived", "streak_id", "user_id", "creation_date", "end_date", "active", "duration",
+          "submission_count", "timezone", "message_link")
+# Bytes a gzip stream grows by when it's finished after a sync flush: the final empty block and the 8 byte trailer
+_GZIP_FINISH = 16
+
+
+"""
+# Gzips encoded records into parts no larger than a given size.
+# @Params:
+# fmt; Expected Type: str - 'csv' or 'jsonl'
+# part_size; Expected Type: int - largest part in bytes. A single batch that compresses to more than this still ends up
+#                                 in one part of its own.
+# level; Expected Type: int - gzip compression level
+"""
+class GzipParts:
+    def __init__(self, fmt: str, part_size: int, level: int = EXPORT_COMPRESSION_LEVEL):
+        self.fmt = fmt
+        self.partSize = part_size
+        self.level = level
+        self.records = 0
+        self._file = None
+        self._compressor = None
+        self._size = 0
+        self._partRecords = 0
+
+    """
+    # Encodes and compresses a batch of records into the current part.
+    # @Params:
+    # records; Expected Type: [dict] - the records, keyed by the names in FIELDS
+    # @Returns:
+    # the previous part, rewound to its start, if the batch didn't fit in it and was written to a new one, else None
+    """
+    def write(self, records: list):
+        data = self._encode(records)
+        if self._file is None:
+            self._start()
+        # the compressor's state before the batch, to fall back to if the batch doesn't fit
+        before = self._compressor.copy()
+        chunk = self._compress(data)
+        finished = None
+        if self._partRecords and self._size + len(chunk) + _GZIP_FINISH > self.partSize:
+            # the full part is finished without the batch, which is compressed again at the start of the new one
+            self._compressor = before
+            finished = self.finish()
+            self._start()
+            chunk = self._compress(data)
+        self._file.write(chunk)
+        self._size += len(chunk)
+        self._partRecords += len(records)
+        self.records += len(records)
+        return finished
+
+    """
+    # Finishes the current part.
+    # @Returns:
+    # the part rewound to its start, None if no part was started
+    """
+    def finish(self):
+        if self._file is None:
+            return None
+        file = self._file
+        file.write(self._compressor.flush())
+        file.seek(0)
+        self._file = None
+        return file
+
+    """
+    # Closes the part being filled without returning it, e.g. when the export failed halfway.
+    """
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _start(self):
+        self._file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_THRESHOLD)
+        # wbits 31 writes a gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        self._size = 0
+        self._partRecords = 0
+        if self.fmt == "csv":
+            header = self._compress((",".join(FIELDS) + "\r\n").encode())
+            self._file.write(header)
+            self._size += len(header)
+
+    def _compress(self, data: bytes) -> bytes:
+        # a sync flush pushes out everything compressed so far, so the part's size is known after every batch
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def _encode(self, records: list) -> bytes:
+        if self.fmt == "jsonl":
+            return "".join(json.dumps(record, default=str) + "\n" for record in records).encode()
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, FIELDS).writerows(records)
+        return buffer.getvalue().encode()
+
+
+"""
+# Turns a batch of result rows into records.
+# @Params:
+# kind; Expected Type: str - 'streak' or 'submission'
+# archived; Expected Type: bool - whether the rows come from the archive
+# rows; Expected Type: [sqlalchemy.RowMapping] - the rows
+# now; Expected Type: datetime.datetime - timezone aware time of the export
+"""
+def to_records(kind: str, archived: bool, rows: list, now: datetime.datetime) -> list[dict]:
+    records = [{"type": kind, "archived": archived, **row} for row in rows]
+    # running streaks are counted up to the current date in their own timezone
+    for record in records:
+        if kind == "streak" and record["active"]:
+            record["duration"] = (streaks.local_date(record["timezone"], now) - record["creation_date"]).days + 1
+    return records
+
+
+"""
+# Streams a guild's art streak history out of the database in batches of records.
+# @Params:
+# session; Expected Type: sqlalchemy.ext.asyncio.AsyncSession - session the history is read on
+# guild_id; Expected Type: int - id of the guild
+# now; Expected Type: datetime.datetime - timezone aware time of the export
+# batch; Expected Type: int - rows fetched at a time
+"""
+async def stream_records(session: AsyncSession, guild_id: int, now: datetime.datetime, batch: int = EXPORT_BATCH):
+    for kind, archived, statement in queries.guild_export(guild_id):
+        result = await session.stream(statement.execution_options(yield_per=batch))
+        async for rows in result.mappings().partitions():
+            yield to_records(kind, archived, rows, now)
+
+
+"""
+# Exports a guild's art streak history into gzipped parts, handing every part out as soon as it's complete so it can be
+# uploaded while the next one is filled. A guild without any history produces no parts. The caller owns the parts and
+# is expected to close them.
+# @Params:
+# session; Expected Type: sqlalchemy.ext.asyncio.AsyncSession - session the history is read on
+# guild_id; Expected Type: int - id of the guild
+# fmt; Expected Type: str - 'csv' or 'jsonl'
+# part_size; Expected Type: int - largest part in bytes
+# name; Expected Type: str - file name of the export without its extensions
+# now; Expected Type: datetime.datetime - timezone aware time of the export
+# @Returns:
+# async generator of (file name, file) tuples. The parts are named '<name>-part<n>.<fmt>.gz' if the export had to be
+# split and '<name>.<fmt>.gz' if it wasn't.
+"""
+async def export_parts(session: AsyncSession, guild_id: int, fmt: str, part_size: int, name: str,
+                       now: datetime.datetime):
+    parts = GzipParts(fmt, part_size)
+    number = 0
+    try:
+        async for records in stream_records(session, guild_id, now):
+            finished = await asyncio.to_thread(parts.write, records)
+            if finished is not None:
+                number += 1
+                yield f"{name}-part{number}.{fmt}.gz", finished
+        if parts.records == 0:
+            parts.discard()
+            return
+        finished = await asyncio.to_thread(parts.finish)
+        number += 1
+        yield (f"{name}-part{number}.{fmt}.gz" if number > 1 else f"{name}.{fmt}.gz"), finished
+    finally:
+        parts.discard()
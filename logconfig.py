@@ -0,0 +1,192 @@
+# Logging setup for the bot. Records are handed to a queue on the calling thread and a background listener thread does
+# the formatting into JSON lines and all of the file I/O, so the event loop never waits on a disk write. The queue is
+# bounded; if the listener ever falls that far behind, records are dropped and counted instead of blocking.
+#
+# discord.py logs every gateway event at DEBUG level including its whole payload, which for GUILD_CREATE is the full
+# member list of the guild. Those records are sampled and truncated before they are queued.
+#
+# Configuration (all optional, read from the environment or the .env file):
+#
+#  - LOG_FILE: file the JSON lines are written to. Defaults to 'poke_bot.log', or to one file per process when the bot
+#    runs sharded (see 'sharding.py').
+#  - LOG_MAX_BYTES: size in bytes at which the log file is rotated. Defaults to 5 MiB.
+#  - LOG_BACKUPS: number of rotated files kept around ('poke_bot.log.1' and so on). Defaults to 3.
+#  - LOG_LEVEL: level of every logger without a level of its own. Defaults to INFO.
+#  - LOG_LEVELS: comma separated per subsystem levels, e.g. 'pokebot.notifier=DEBUG,sqlalchemy.engine=INFO'. By default
+#    discord.py logs at INFO and sqlalchemy's statement logging is off.
+#  - LOG_CONSOLE_LEVEL: level of the human readable copy of the records written to stderr. Defaults to INFO.
+#  - LOG_MAX_MESSAGE: characters of a message kept before it's truncated. Defaults to 4000.
+#  - LOG_GATEWAY_SAMPLE: one in how many gateway payload records is kept. Defaults to 100.
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+from dotenv import load_dotenv
+
+import sharding
+
+load_dotenv()
+
+LOG_FILE = os.getenv("LOG_FILE", sharding.default_log_file("poke_bot.log"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "3"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_CONSOLE_LEVEL = os.getenv("LOG_CONSOLE_LEVEL", "INFO")
+LOG_MAX_MESSAGE = int(os.getenv("LOG_MAX_MESSAGE", "4000"))
+LOG_GATEWAY_SAMPLE = int(os.getenv("LOG_GATEWAY_SAMPLE", "100"))
+LOG_QUEUE_SIZE = 10000
+
+# Levels of the subsystems that don't get one from LOG_LEVELS.
+DEFAULT_LEVELS = {
+    "discord": "INFO",
+    "sqlalchemy.engine": "WARNING",
+}
+# Attributes every LogRecord has. Anything else was passed through 'extra' and ends up as a field of the JSON record.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+"""
+# Formats records as single line JSON objects. Fields passed through 'extra' are included as they are.
+"""
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+"""
+# Queue handler that does as little as possible on the calling thread. The message is rendered and truncated, then the
+# record is queued without waiting; when the queue is full the record is dropped and counted.
+"""
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message now since the arguments may be changed by the caller once this returns. Exceptions are
+        # rendered by the listener; the traceback objects are kept alive until then.
+        message = record.getMessage()
+        if len(message) > LOG_MAX_MESSAGE:
+            message = f"{message[:LOG_MAX_MESSAGE]}... ({len(message) - LOG_MAX_MESSAGE} characters truncated)"
+        record.msg = message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+"""
+# Keeps one in every 'rate' of discord.py's gateway payload records and lets everything else through untouched.
+# The check runs before the record's message is rendered, so dropped payloads are never turned into strings.
+# @Params:
+# rate; Expected Type: int - one in how many gateway payload records is kept
+"""
+class GatewayPayloadSampler(logging.Filter):
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or not record.name.startswith("discord.gateway") \
+                or "WebSocket Event" not in str(record.msg):
+            return True
+        self._seen += 1
+        return self._seen % self.rate == 1 or self.rate == 1
+
+
+"""
+# Parses a comma separated list of 'logger=LEVEL' pairs.
+# @Params:
+# spec; Expected Type: str - the list to parse
+"""
+def parse_levels(spec: str) -> dict:
+    levels = {}
+    for pair in spec.split(","):
+        if "=" in pair:
+            name, level = pair.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+"""
+# Installs the queue based logging pipeline on the root logger and starts its listener thread. Calling it again does
+# nothing until 'shutdown' has been called.
+# @Params:
+# log_file; Expected Type: str - file the JSON lines are written to, None to only log to stderr
+"""
+def setup(log_file: str = LOG_FILE):
+    global _listener
+    if _listener is not None:
+        return
+    handlers = []
+    if log_file:
+        fileHandler = logging.handlers.RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES,
+                                                           backupCount=LOG_BACKUPS, encoding="utf-8")
+        fileHandler.setFormatter(JsonFormatter())
+        handlers.append(fileHandler)
+    consoleHandler = logging.StreamHandler()
+    consoleHandler.setLevel(LOG_CONSOLE_LEVEL.upper())
+    consoleHandler.setFormatter(logging.Formatter("[%(asctime)s] [%(levelname)-8s] %(name)s: %(message)s",
+                                                  "%Y-%m-%d %H:%M:%S"))
+    handlers.append(consoleHandler)
+    logQueue = queue.Queue(LOG_QUEUE_SIZE)
+    queueHandler = NonBlockingQueueHandler(logQueue)
+    queueHandler.addFilter(GatewayPayloadSampler(LOG_GATEWAY_SAMPLE))
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL.upper())
+    root.addHandler(queueHandler)
+    for name, level in {**DEFAULT_LEVELS, **parse_levels(LOG_LEVELS)}.items():
+        logging.getLogger(name).setLevel(level)
+    _listener = logging.handlers.QueueListener(logQueue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+"""
+# Returns the number of records dropped because the queue was full.
+"""
+def dropped() -> int:
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            return handler.dropped
+    return 0
+
+
+"""
+# Flushes every queued record and stops the listener thread.
+"""
+def shutdown():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    _listener = None
@@ -0,0 +1,194 @@
+# Event loop lag monitor and blocking call detector. A sampler task sleeps for a fixed interval over and over and
+# records how late the loop wakes it up, which is the scheduling delay every other callback sees as well. Next to it a
+# watchdog thread keeps an eye on the sampler; when the sampler hasn't been able to run for longer than the threshold,
+# something is blocking the loop and the watchdog grabs a stack snapshot of the loop's thread to show what it is.
+#
+# Configuration (all optional, read from the environment or the .env file):
+#
+#  - LOOP_LAG_INTERVAL: seconds between two samples. Defaults to 0.1.
+#  - LOOP_LAG_THRESHOLD: seconds the loop may be blocked before a stack snapshot is taken. Defaults to 0.25.
+#  - LOOP_LAG_EXPORT: path of a JSON file the counters are written to every LOOP_LAG_EXPORT_INTERVAL seconds
+#    (defaults to 60). Nothing is written if it isn't set.
+import asyncio
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+load_dotenv()
+log = logging.getLogger("pokebot.looplag")
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))
+LOOP_LAG_EXPORT = os.getenv("LOOP_LAG_EXPORT")
+LOOP_LAG_EXPORT_INTERVAL = float(os.getenv("LOOP_LAG_EXPORT_INTERVAL", "60"))
+
+# Upper bounds in seconds of the lag histogram buckets.
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+# Frames from this directory (and not from installed packages) are what a hot spot gets attributed to.
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+STACK_DEPTH = 12
+
+
+"""
+# Samples the scheduling delay of the running event loop and takes stack snapshots of whatever blocks it.
+# @Params:
+# interval; Expected Type: float - seconds between two samples
+# threshold; Expected Type: float - seconds the loop may be blocked before a stack snapshot is taken
+# export_path; Expected Type: str - file the counters are periodically written to as JSON, None to disable
+# export_interval; Expected Type: float - seconds between two exports
+"""
+class LoopLagMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD,
+                 export_path: str = LOOP_LAG_EXPORT, export_interval: float = LOOP_LAG_EXPORT_INTERVAL):
+        self.interval = interval
+        self.threshold = threshold
+        self.exportPath = export_path
+        self.exportInterval = export_interval
+        self._sampler = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+        self._loopThread = None
+        self._beat = time.monotonic()
+        self._capturedBeat = None
+        self._lags = collections.deque(maxlen=3000)
+        self.buckets = [0] * len(LAG_BUCKETS)
+        self.samples = 0
+        self.stalls = 0
+        self.maxLag = 0.0
+        self.hotspots = collections.Counter()
+
+    """
+    # Starts the sampler task and the watchdog thread. Must be called from a coroutine running on the monitored loop.
+    """
+    def start(self):
+        self._loopThread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._sampler = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    """
+    # Stops the sampler and the watchdog and writes a final export if one is configured.
+    """
+    async def stop(self):
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+            await asyncio.gather(self._sampler, return_exceptions=True)
+            self._sampler = None
+        if self.exportPath:
+            await asyncio.to_thread(self.export, self.exportPath)
+
+    """
+    # Returns the median and 99th percentile scheduling delay in seconds over recent samples.
+    """
+    def percentiles(self) -> tuple:
+        if not self._lags:
+            return None, None
+        ordered = sorted(self._lags)
+        return ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+    """
+    # Returns every counter of the monitor as a JSON serializable dict.
+    """
+    def snapshot(self) -> dict:
+        p50, p99 = self.percentiles()
+        return {
+            "samples": self.samples,
+            "stalls": self.stalls,
+            "max_lag_seconds": self.maxLag,
+            "p50_lag_seconds": p50,
+            "p99_lag_seconds": p99,
+            "lag_buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                            for bound, count in zip(LAG_BUCKETS, self.buckets)},
+            "hotspots": dict(self.hotspots.most_common()),
+        }
+
+    """
+    # Writes the current counters to a JSON file. The file is replaced in one step so readers never see half of it.
+    # @Params:
+    # path; Expected Type: str - file to write
+    """
+    def export(self, path: str):
+        tmpPath = f"{path}.tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmpPath, path)
+
+    def summary(self) -> str:
+        p50, p99 = self.percentiles()
+        lag = "n/a" if p50 is None else f"p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, " \
+                                       f"max {self.maxLag * 1000:.0f} ms"
+        summary = f"Event loop lag: {lag}, stalls over {self.threshold * 1000:.0f} ms: {self.stalls}"
+        if self.hotspots:
+            summary += "\nBlocking hot spots:"
+            for where, count in self.hotspots.most_common(5):
+                summary += f"\n  {count}x {where}"
+        return summary
+
+    async def _sample(self):
+        lastExport = time.monotonic()
+        while True:
+            due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            self._record(max(0.0, now - due))
+            if self.exportPath and now - lastExport >= self.exportInterval:
+                lastExport = now
+                try:
+                    await asyncio.to_thread(self.export, self.exportPath)
+                except Exception:
+                    log.exception("Failed to export the loop lag counters")
+
+    def _record(self, lag: float):
+        self.samples += 1
+        self._lags.append(lag)
+        self.maxLag = max(self.maxLag, lag)
+        for i, bound in enumerate(LAG_BUCKETS):
+            if lag <= bound:
+                self.buckets[i] += 1
+                break
+        if lag > self.threshold:
+            self.stalls += 1
+
+    def _watch(self):
+        while not self._stopped.wait(min(self.interval, self.threshold) / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            # Only one snapshot per stall; the sampler moves the beat along once the loop is free again.
+            if blocked <= self.threshold or beat == self._capturedBeat:
+                continue
+            self._capturedBeat = beat
+            frame = sys._current_frames().get(self._loopThread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            hotspot = _hotspot(stack)
+            self.hotspots[hotspot] += 1
+            log.warning("Event loop blocked for over %.0f ms, currently running:\n%s", blocked * 1000,
+                        "".join(traceback.format_list(stack[-STACK_DEPTH:])), extra={"hotspot": hotspot})
+
+
+"""
+# Attributes a stack to the innermost frame that belongs to the bot's own code, falling back to the innermost frame.
+# @Params:
+# stack; Expected Type: traceback.StackSummary - stack of the blocked loop thread
+"""
+def _hotspot(stack: traceback.StackSummary) -> str:
+    for frame in reversed(stack):
+        if frame.filename.startswith(PROJECT_DIR) and "site-packages" not in frame.filename:
+            return f"{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno} in {frame.name}"
+    frame = stack[-1]
+    return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+
+monitor = LoopLagMonitor()
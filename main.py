@@ -26,7 +26,7 @@
 #
 # TODO for v2.0 release:
 #
-#  - TODO: setup proper error logging
+#  - DONE: setup proper error logging
 #  - TODO: organize features into discord.py's 'cog' extension
 #  - TODO: rebuild models around a dedicated user table
 #
@@ -44,53 +44,85 @@
 
 
 import datetime
-import io
 import os
 import typing
 import json
-from requests import get
+import time
+import logging
+import zoneinfo
 
 from dotenv import load_dotenv
 from discord.ext import commands, tasks
 import discord
 from discord import app_commands
-from sqlalchemy import delete, create_engine, and_, func
-from models import User, Guild, ArtStreak, ArtStreakSubmission, PersistentVars
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm.collections import InstrumentedList
+from sqlalchemy import select
+from models import User, Guild, DEFAULT_TIMEZONE
+from db import engine, Session
+import streaks
+import queries
+import cache
+import notifier
+import voice
+import media
+import pipeline
+import looplag
+import metrics
+import logconfig
+import sharding
+import archive
+import export
+import writer
+import writes
 import asyncio
-import aiohttp
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 
 # Declare time values for task scheduling.
-# Definition of mountain time
-mtn = datetime.timezone(datetime.timedelta(hours=-6), name="Mountain Time")
-# Time definitions
-streak_check_time = datetime.time(hour=0, tzinfo=mtn)
-streak_reminder_times = [
-    datetime.time(hour=9, tzinfo=mtn),
-    datetime.time(hour=12, tzinfo=mtn),
-    datetime.time(hour=15, tzinfo=mtn),
-    datetime.time(hour=18, tzinfo=mtn)
-]
-
-# Create database engine from the engine factory and instantiate the session factory based on the persistent engine
-engine = create_engine("sqlite:///poke_bot.db", echo=True)
-Session = sessionmaker(bind=engine)
+# The streak jobs wake up every quarter hour and only handle the timezones whose local time has come, which also covers
+# the timezones that are offset by a half or a quarter hour.
+SCHEDULE_TICK_MINUTES = 15
+streak_schedule_times = [datetime.time(hour=hour, minute=minute, tzinfo=datetime.timezone.utc)
+                         for hour in range(24) for minute in range(0, 60, SCHEDULE_TICK_MINUTES)]
+# The archival job runs once a day, see 'archive.py'
+archive_schedule_time = datetime.time(hour=archive.ARCHIVE_HOUR, tzinfo=datetime.timezone.utc)
+# Local hours reminders are sent at in every timezone
+STREAK_REMINDER_HOURS = (9, 12, 15, 18)
+# How far back reminder hours missed while no process was running the reminders are still sent out
+REMINDER_CATCH_UP_MINUTES = 60
+# Every timezone the 'settimezone' command accepts
+TIMEZONES = sorted(zoneinfo.available_timezones())
+
+# Discord's maximum message length and the number of channels the bot sends batched messages to at once.
+MESSAGE_LENGTH_LIMIT = 2000
+CHANNEL_SEND_CONCURRENCY = 5
+
+# The 'help' manual is read once at startup instead of from disk on every call.
+with open("manual_entries.json", 'r') as f:
+    MANUAL_ENTRIES = json.load(f)
 
 # set discords special permission requests, in this case viewing message content, and initialize the bot object
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Run sharded if SHARD_COUNT is configured, see 'sharding.py'.
+shardOptions = sharding.bot_options()
+if shardOptions is None:
+    bot = commands.Bot(command_prefix='!', intents=intents)
+else:
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, **shardOptions)
+# The shards this process runs the scheduled jobs for, known once the bot is connected.
+shards = sharding.ShardSet()
+# Background task reconciling the guilds and catching up on streak checks after 'on_ready'.
+startupTask = None
+# Keeps the streak check after startup and the scheduled ones from running at the same time.
+streakCheckLock = asyncio.Lock()
 
 # load environmental variables and retrieve the bot token from them
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 
-# initialize the scheduler object
-scheduler = AsyncIOScheduler()
+# route every log record through the non-blocking logging pipeline
+logconfig.setup()
+log = logging.getLogger("pokebot.main")
 
 
 """
@@ -102,38 +134,44 @@ scheduler = AsyncIOScheduler()
 """
 @bot.event
 async def on_ready():
-    print(f"Logged in as {bot.user}!")
+    global shards, startupTask
+    shards = sharding.ShardSet.from_bot(bot)
+    log.info("Logged in as %s on %s!", bot.user, shards)
+    # Count who's already sitting in voice chat so the occupancy tracker starts out in sync with the gateway cache.
+    voice.occupancy.seed(bot.guilds)
     check_streaks.start()
     push_reminder.start()
+    archive_streaks.start()
+    # Reconcile the registered guilds and catch up on missed streak checks in the background, so readiness isn't held
+    # up by either. Keep a reference to the task, the event loop only holds a weak one.
+    startupTask = asyncio.create_task(startup_sync())
+
+
+"""
+# Runs once the bot is ready. Brings the registered guilds in line with the guilds the bot is connected to, loads their
+# configuration, the known users and the vc notif subscribers into the in-memory caches and then runs the streak check
+# so anything missed while the bot was down is caught up on. The check runs after the reconciliation so it doesn't
+# evaluate streaks of guilds that were just removed.
+"""
+async def startup_sync():
+    start = time.perf_counter()
+    try:
+        # Only the guilds on this process' shards are looked at, the others belong to other processes.
+        artChannels, added, removed = await writer.group_writer.submit(
+            writes.reconcile_guilds, {guild.id for guild in bot.guilds}, shards)
+        cache.guild_config.load(artChannels)
+        # Warm the known-user set so commands of users the bot has seen before skip registering them.
+        async with Session() as session:
+            cache.known_users.load(await session.scalars(select(User.id)))
+        # Load the subscriber index through the writer, so a subscription change can't land between reading the
+        # subscriptions and replacing the index with them.
+        cache.subscriber_index.load(await writer.group_writer.submit(
+            lambda session: session.execute(queries.subscriptions(shards)).all()))
+        log.info("Reconciled %d guild(s) in %.1f ms: %d registered, %d removed", len(artChannels),
+                 (time.perf_counter() - start) * 1000, added, removed)
+    except Exception:
+        log.exception("Failed to reconcile the registered guilds on startup")
     await check_streaks()
-    discordGuilds = []
-    # open a session with the database
-    with Session() as session:
-        try:
-            # Iterate through all guild entries stored on local db and compare them with guilds that the bot is
-            # currently a member of. If any are in the db that the bot is no longer a member of, then send them to the
-            # 'unregister_guild' function for removal.
-            guilds = session.query(Guild).all()
-            guildsToDelete = []
-            for guild in guilds:
-                discordGuildObj = discord.utils.get(bot.guilds, id=guild.id)
-                if discordGuildObj is None:
-                    guildsToDelete.append(guild)
-            # Iterate through all guilds the bot is a member of and compare each of them to the ones registered in the
-            # db. If any are not found in the db they are queued in the 'discordGuilds' array to be sent to the
-            # registering function.
-            for guild in bot.guilds:
-                result = session.query(Guild.id).filter(Guild.id.in_([guild.id])).first()
-                if result is None:
-                    discordGuilds.append(guild)
-        except Exception as e:
-            print(e)
-    # If the queue of guild entries to be removed has anything in it, send it off to the 'unregister_guild' function.
-    if len(guildsToDelete) > 0:
-        unregister_guild(guildsToDelete)
-    # If the queue of new guilds to be registered has anything in it, send it off to the 'register_guild' function.
-    if len(discordGuilds) > 0:
-        register_guild(discordGuilds)
 
 
 """
@@ -145,7 +183,8 @@ async def on_ready():
 """
 @bot.event
 async def on_guild_join(guild):
-    register_guild([guild])
+    voice.occupancy.seed([guild])
+    await register_guild([guild])
 
 
 """
@@ -157,24 +196,25 @@ async def on_guild_join(guild):
 """
 @bot.event
 async def on_guild_remove(guild):
-    unregister_guild([guild])
+    voice.occupancy.forget(guild.id)
+    await unregister_guild([guild])
 
 
 """
 # Helper function that handles the removal of guild entries from the local db.
-# Iterates through the provided list of guilds and removes from the local db.
+# Removes the provided guilds together with their art streaks and subscriptions in bulk.
 # @Params:
 # guilds; Expected Type: [discord.Guild] - list of guilds to remove from local db
 """
-def unregister_guild(guilds: [discord.Guild]):
-    print("Unregistering guilds...")
-    with Session() as session:
-        try:
-            for guild in guilds:
-                session.query(Guild).filter(Guild.id == guild.id).delete()
-            session.commit()
-        except Exception as e:
-            print(e)
+async def unregister_guild(guilds: [discord.Guild]):
+    log.info("Unregistering %d guild(s)...", len(guilds))
+    try:
+        await writer.group_writer.submit(writes.unregister_guilds, [guild.id for guild in guilds])
+        for guild in guilds:
+            cache.guild_config.remove(guild.id)
+            cache.subscriber_index.forget(guild.id)
+    except Exception:
+        log.exception("Failed to unregister guilds")
 
 
 """
@@ -182,19 +222,15 @@ def unregister_guild(guilds: [discord.Guild]):
 # @Params: 
 # guilds; Expected Type: [discord.Guild] - list of guilds to register
 """
-def register_guild(guilds: [discord.Guild]):
-    print("Registering new guilds...")
-    # Start a session with the bot side database
-    with Session() as session:
-        try:
-            for guild in guilds:
-                guildObj = Guild(id=guild.id)
-                session.add(guildObj)
-                print(f"Adding guild: \"{guild.name}\" to session...")
-            session.commit()
-            print("Guilds committed!")
-        except Exception as e:
-            print(e)
+async def register_guild(guilds: [discord.Guild]):
+    log.info("Registering %d new guild(s)...", len(guilds))
+    try:
+        await writer.group_writer.submit(writes.register_guilds, [guild.id for guild in guilds])
+        log.info("Guilds committed!")
+        for guild in guilds:
+            cache.guild_config.set_art_channel(guild.id, None)
+    except Exception:
+        log.exception("Failed to register guilds")
 
 
 """
@@ -205,149 +241,445 @@ def register_guild(guilds: [discord.Guild]):
 async def main():
     # Initialize async functions and launch the bot's built in event loop.
     async with bot:
-        await bot.start(TOKEN)
+        # Watch the event loop for anything that blocks it, starting with the bot's own startup.
+        looplag.monitor.start()
+        # Time every db statement and discord REST call and start serving the metrics.
+        metrics.instrument_engine(engine.sync_engine)
+        metrics.instrument_http(bot.http)
+        register_gauges()
+        await metrics.server.start()
+        try:
+            await bot.start(TOKEN)
+        finally:
+            # Stop the submission and notification workers and close the shared http client and every pooled database
+            # connection once the bot shuts down.
+            await metrics.server.stop()
+            await looplag.monitor.stop()
+            await pipeline.submission_pipeline.stop()
+            await notifier.dm_dispatcher.stop()
+            await writer.group_writer.stop()
+            await media.close()
+            # Hand this process' shards over to its successor right away instead of after the leases expire.
+            try:
+                async with Session() as session:
+                    await session.run_sync(sharding.release_leases, utc_now().replace(tzinfo=None))
+                    await session.commit()
+            except Exception:
+                log.exception("Failed to release the job leases")
+            await engine.dispose()
+            logconfig.shutdown()
+
+
+"""
+# Exposes the counters of the caches and background workers as gauges on the metrics endpoint.
+# @Params:
+# NONE
+"""
+def register_gauges():
+    metrics.add_gauge("pokebot_submission_queue_depth", "Submissions waiting or being processed.",
+                      pipeline.submission_pipeline.depth)
+    metrics.add_gauge("pokebot_submission_processing_p50_seconds", "Median submission processing time.",
+                      lambda: pipeline.submission_pipeline.percentiles()[0])
+    metrics.add_gauge("pokebot_submission_processing_p99_seconds", "99th percentile submission processing time.",
+                      lambda: pipeline.submission_pipeline.percentiles()[1])
+    metrics.add_gauge("pokebot_write_queue_depth", "Writes waiting for the group commit writer.",
+                      writer.group_writer.depth)
+    metrics.add_gauge("pokebot_group_commits", "Transactions committed by the group commit writer.",
+                      lambda: writer.group_writer.commits)
+    metrics.add_gauge("pokebot_writes_per_commit", "Average writes per group commit over recent commits.",
+                      writer.group_writer.average_group)
+    metrics.add_gauge("pokebot_dms_delivered", "VC notification DMs delivered.", lambda: notifier.dm_dispatcher.delivered)
+    metrics.add_gauge("pokebot_dms_failed", "VC notification DMs given up on.", lambda: notifier.dm_dispatcher.failed)
+    metrics.add_gauge("pokebot_dms_dropped", "VC notification DMs skipped because the user's DMs are closed.",
+                      lambda: notifier.dm_dispatcher.dropped)
+    metrics.add_gauge("pokebot_stats_cache_hits", "Streak stats cache hits.", lambda: cache.stats_cache.hits)
+    metrics.add_gauge("pokebot_stats_cache_misses", "Streak stats cache misses.", lambda: cache.stats_cache.misses)
+    metrics.add_gauge("pokebot_known_users", "Users in the known-user set.", lambda: len(cache.known_users))
+    metrics.add_gauge("pokebot_known_user_misses", "Commands that had to register their user in the database.",
+                      lambda: cache.known_users.misses)
+    metrics.add_gauge("pokebot_indexed_subscriptions", "VC notif subscriptions in the in-memory subscriber index.",
+                      lambda: len(cache.subscriber_index))
+    metrics.add_gauge("pokebot_loop_lag_p99_seconds", "99th percentile event loop scheduling delay.",
+                      lambda: looplag.monitor.percentiles()[1])
+    metrics.add_gauge("pokebot_loop_stalls", "Times the event loop was blocked past the lag threshold.",
+                      lambda: looplag.monitor.stalls)
 
 
 """
 # Scheduler call back function that handles the firing off of reminders for art streaks to all users with currently
 # active art streaks in respective guilds.
-# It uses a lot of copied code from the 'check_streaks' function which has already caused problems. Both functions could
-# probably be optimized and need a closer look in the future.
+# Reminders go out at the reminder hours of every streak's own timezone. All streaks of the due timezones that haven't
+# been fulfilled today are pulled and grouped by their guild's art channel so each channel gets one combined reminder
+# instead of one message per streak.
+# Every shard of this process is reminded under its own lease, so no shard is reminded twice when processes overlap
+# during a restart. Reminder hours that passed since the shard was last reminded are caught up on, up to
+# REMINDER_CATCH_UP_MINUTES back.
 # @Params:
-# NONE
+# force; Expected Type: bool - remind every timezone right now instead of only the ones at a reminder hour
 """
-@tasks.loop(time=streak_reminder_times)
-async def push_reminder():
+@tasks.loop(time=streak_schedule_times)
+async def push_reminder(force=False):
+    start = time.perf_counter()
     try:
-        with Session() as session:
-            # Pull a list of all active art streaks from local db
-            result = session.query(ArtStreak).filter(ArtStreak.active).all()
-            # Iterate through list
-            for streak in result:
-                # Pull a list of all art streak submissions registered under the current art streak.
-                submissionResults = session.query(ArtStreakSubmission)\
-                    .join(ArtStreak, ArtStreakSubmission.art_streak_id == streak.id)\
-                    .order_by(ArtStreakSubmission.creation_date.desc())\
-                    .all()
-                streakFulfilled = False
-                # Iterate through said art streak list. If there has been a submission to this art streak today, then do
-                # nothing. Otherwise, send a reminder to the art streak's user.
-                for submissionResult in submissionResults:
-                    if submissionResult.creation_date == datetime.date.today():
-                        streakFulfilled = True
-                        break
-                    else:
-                        break
-                if not streakFulfilled:
-                    guildObj = session.query(Guild).filter(Guild.id == streak.guild_id).first()
-                    artChannel = await bot.fetch_channel(guildObj.art_channel_id)
-                    await artChannel.send(f"<@{streak.user_id}> still needs to submit art today and is a cringe, gay baby for not doing so already.")
-    except Exception as e:
-        print(e)
+        now = utc_now()
+        channels = {}
+        dueCount = 0
+        for shard in shards.split():
+            lease = await take_lease("push_reminder", shard, now)
+            if lease is None:
+                continue
+            async with Session() as session:
+                timezones = await session.run_sync(streaks.active_timezones, shard)
+                if force:
+                    due = [(timezone, streaks.local_date(timezone, now)) for timezone in timezones]
+                else:
+                    since = now - datetime.timedelta(minutes=SCHEDULE_TICK_MINUTES)
+                    if lease.last_run is not None:
+                        since = max(lease.last_run.replace(tzinfo=datetime.timezone.utc),
+                                    now - datetime.timedelta(minutes=REMINDER_CATCH_UP_MINUTES))
+                    due = streaks.due_reminders(timezones, since, now, STREAK_REMINDER_HOURS)
+                # Pull the users that still need to submit today in their timezone, grouped by the art channel of their
+                # guild.
+                for timezone, today in due:
+                    unfulfilled = await session.run_sync(streaks.find_unfulfilled, today, timezone, shard)
+                    for artChannelId, userIds in unfulfilled.items():
+                        channels.setdefault(artChannelId, []).extend(userIds)
+                # The shard counts as reminded as soon as its reminders are queued.
+                await session.run_sync(sharding.finish_lease, "push_reminder", shard.ids[0],
+                                       now.replace(tzinfo=None))
+                await session.commit()
+            dueCount += len(due)
+        if dueCount == 0:
+            return
+        # Build one reminder per art channel and send them all out concurrently.
+        messages = {}
+        for artChannelId, userIds in channels.items():
+            mentions = [f"<@{userId}>" for userId in userIds]
+            if len(mentions) == 1:
+                suffix = " still needs to submit art today and is a cringe, gay baby for not doing so already."
+            else:
+                suffix = " still need to submit art today and are cringe, gay babies for not doing so already."
+            messages[artChannelId] = split_message(mentions, ", ", suffix)
+        await send_channel_messages(messages)
+        metrics.record_job("push_reminder", time.perf_counter() - start,
+                           timezones=dueCount, users=sum(len(userIds) for userIds in channels.values()),
+                           channels=len(channels),
+                           messages=sum(len(channelMessages) for channelMessages in messages.values()))
+    except Exception:
+        log.exception("Failed to push streak reminders")
+
+
+"""
+# Returns the current time in UTC. The scheduled jobs and 'submitart' read the time through here, so the benchmark suite
+# can run them against a clock it controls.
+"""
+def utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+"""
+# Helper function that takes or renews this process' lease on a scheduled job for one shard.
+# @Params:
+# job; Expected Type: str - name of the job
+# shard; Expected Type: sharding.ShardSet - the single shard the job is about to run for
+# now; Expected Type: datetime.datetime - timezone aware current time
+# @Returns:
+# the lease, or None if another process holds it
+"""
+async def take_lease(job: str, shard: sharding.ShardSet, now: datetime.datetime):
+    async with Session() as session:
+        lease = await session.run_sync(sharding.acquire_lease, job, shard.ids[0], now.replace(tzinfo=None))
+        await session.commit()
+    if lease is None:
+        log.debug("Skipping %s for shard %d, another process holds its lease", job, shard.ids[0])
+    return lease
+
+
+"""
+# Helper function that joins a list of message parts into as few messages as possible without exceeding discord's
+# message length limit. The suffix is appended to every message produced.
+# @Params:
+# parts; Expected Type: [str] - the pieces of text to join, e.g. user mentions
+# separator; Expected Type: str - string placed between two parts
+# suffix; Expected Type: str - string appended to the end of every message
+# prefix; Expected Type: str - string placed at the start of every message
+# @Returns:
+# list of message strings
+"""
+def split_message(parts: [str], separator: str, suffix: str, prefix: str = "") -> [str]:
+    messages = []
+    current = ""
+    for part in parts:
+        candidate = part if current == "" else current + separator + part
+        if current != "" and len(prefix) + len(candidate) + len(suffix) > MESSAGE_LENGTH_LIMIT:
+            messages.append(prefix + current + suffix)
+            candidate = part
+        current = candidate
+    if current != "":
+        messages.append(prefix + current + suffix)
+    return messages
+
+
+"""
+# Helper function that sends a batch of messages to a set of channels. Every channel's messages are sent in order, while
+# different channels are handled concurrently. The number of channels being sent to at once is bounded by a semaphore
+# so large batches don't pile up against discord's global rate limit; per route limits are waited out by discord.py.
+# A failure on one channel is printed and doesn't stop the rest from being sent.
+# @Params:
+# messages; Expected Type: {int: [str]} - dict mapping channel ids to the list of messages to send in that channel
+"""
+async def send_channel_messages(messages: {int: [str]}):
+    semaphore = asyncio.Semaphore(CHANNEL_SEND_CONCURRENCY)
+
+    async def send(channelId, channelMessages):
+        async with semaphore:
+            channel = await cache.guild_config.resolve_channel(bot, channelId)
+            for message in channelMessages:
+                await channel.send(message)
+
+    results = await asyncio.gather(*[send(channelId, channelMessages)
+                                     for channelId, channelMessages in messages.items()], return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            log.error("Failed to send a batched channel message", exc_info=result)
 
 
 """
 # Helper function that handles the job of iterating through all active streaks in the database and checking whether they
 # had a submission today or yesterday. If not then a freeze is subtracted. If no freezes remain then the streak is 
-# terminated and the helper function 'terminate_streak' is dispatched.
+# terminated. Every art channel gets the announcements of its members' lost freezes and ended streaks in one batch.
+# Streaks are checked per timezone right after midnight in that timezone. Every timezone's bucket remembers the date it
+# was last checked for, so a bucket is checked exactly once per local day. If more than one day was missed, e.g. while
+# the bot was offline, the bucket is caught up on every missed day in one pass and each art channel gets a single summary
+# instead of one message per lost freeze.
 # @Params:
-# NONE
+# force; Expected Type: bool - check every timezone for its current date, even if it has already been checked
 """
-@tasks.loop(time=streak_check_time)
+@tasks.loop(time=streak_schedule_times)
 async def check_streaks(force=False):
+    # The scheduled ticks and the check after startup run under the same lease holder, so the leases don't keep them
+    # from overlapping within this process.
+    async with streakCheckLock:
+        await run_streak_check(force)
+
+
+"""
+# Helper function that does the work of 'check_streaks' once no other check of this process is running.
+# @Params:
+# force; Expected Type: bool - check every timezone for its current date, even if it has already been checked
+"""
+async def run_streak_check(force: bool):
+    start = time.perf_counter()
     try:
-        print("Checking streaks...")
-        with Session() as session:
-            # Pull the persistent vars entry in the db.
-            persistentVars = session.query(PersistentVars).first()
-            # If persistent vars has no entry then make one.
-            if persistentVars is None:
-                print("No 'PersistentVars' entry found. Creating entry...")
-                persistentVars = PersistentVars()
-                persistentVars.last_streak_check_date = datetime.date.today() - datetime.timedelta(1)
-                session.add(persistentVars)
-            else:
-                print(f"Streaks were last checked on: {persistentVars.last_streak_check_date}")
-            # If persistent vars says that the bot has not checked streaks yet today, then do so.
-            if persistentVars.last_streak_check_date == datetime.date.today() and not force:
-                print("Streaks have already been checked today. Skipping rest of function...")
-                return
-            # Update the entry detailing the last time streaks have been checked.
-            persistentVars.last_streak_check_date = datetime.date.today()
-            session.commit()
-            # Pulls a list of active art steaks.
-            result = session.query(ArtStreak).filter(ArtStreak.active).all()
-            # Iterates through said list.
-            for streak in result:
-                # Renews freezes on sunday
-                if datetime.datetime.today().weekday() == 6:
-                   streak.freezes = 2
-                # Calculates yesterday's date.
-                yesterday = datetime.date.today() - datetime.timedelta(1)
-                # Pulls a list of all submissions for the current art steak.
-                submissionResults = session.query(ArtStreakSubmission)\
-                    .join(ArtStreak, ArtStreakSubmission.art_streak_id == streak.id)\
-                    .order_by(ArtStreakSubmission.creation_date.desc())\
-                    .all()
-                streakFulfilled = False
-                # Iterates through all the submissions and determines if a submission has been given yesterday or
-                # today. If one hasn't, then remove a freeze from the streak. If the streak is out of freezes, then
-                # terminate the streak.
-                for submissionResult in submissionResults:
-                    if submissionResult.creation_date == yesterday or submissionResult.creation_date == datetime.date.today():
-                        streakFulfilled = True
-                        break
-                    else:
+        now = utc_now()
+        dueCount = 0
+        frozenCount = 0
+        terminatedCount = 0
+        caughtUpDays = 0
+        for shard in shards.split():
+            # Only the holder of the shard's lease checks it. The buckets' check dates keep the checks of a shard
+            # exactly once per day even when its lease changes hands.
+            if await take_lease("check_streaks", shard, now) is None:
+                continue
+            renewed = time.monotonic()
+            async with Session() as session:
+                if force:
+                    timezones = await session.run_sync(streaks.active_timezones, shard)
+                    due = []
+                    for timezone in timezones:
+                        today = streaks.local_date(timezone, now)
+                        due.append((timezone, today - datetime.timedelta(1), today))
+                else:
+                    due = await session.run_sync(streaks.due_checks, now, shard)
+                    # Keep the buckets of timezones seen for the first time.
+                    await session.commit()
+            dueCount += len(due)
+            for timezone, lastChecked, today in due:
+                # Renew the lease while the announcements of a long run are sent so it doesn't run out under the job.
+                # Whatever is left over is checked by whoever takes the shard over.
+                if time.monotonic() - renewed > sharding.LEASE_TTL / 2:
+                    if await take_lease("check_streaks", shard, utc_now()) is None:
+                        log.warning("Lost the check_streaks lease of shard %d during the check", shard.ids[0])
                         break
-                if not streakFulfilled:
-                    if streak.freezes == 0:
-                        await terminate_streak(streak.id, 1)
-                    else:
-                        streak.freezes -= 1
-                        guildObj = session.query(Guild).filter(Guild.id == streak.guild_id).first()
-                        artChannel = await bot.fetch_channel(guildObj.art_channel_id)
-                        await artChannel.send(f"<@{streak.user_id}> failed to fulfill yesterday's streak requirement and has lost a freeze.")
-            session.commit()
-            print("Streaks checked successfully!")
-    except Exception as e:
-        print(e)
-
-
-"""
-# Helper function that handles the termination of art streaks.
-# Deals with setting an art streak to inactive in the db, setting the end date of the art streak, and announcing on the
-# art channel that the streak in question has ended.
+                    renewed = time.monotonic()
+                try:
+                    if (today - lastChecked).days > 1:
+                        frozen, terminated = await catch_up_streaks(timezone, lastChecked, today, shard)
+                        caughtUpDays += (today - lastChecked).days
+                        frozenCount += frozen
+                        terminatedCount += terminated
+                        continue
+                    log.info("Checking streaks in %s for %s on shard %d...", timezone, today, shard.ids[0])
+                    async with Session() as session:
+                        # Move the bucket's check date on first. It only moves if the bucket is still at the date it was
+                        # found at, so when another check got to the bucket in the meantime its streaks aren't
+                        # evaluated a second time.
+                        if not await session.run_sync(streaks.mark_checked, timezone, today, shard,
+                                                      None if force else lastChecked):
+                            await session.rollback()
+                            log.info("Streaks in %s on shard %d were already checked for %s", timezone, shard.ids[0],
+                                     today)
+                            continue
+                        # Evaluate the timezone's active streaks in one pass and apply the freeze and termination
+                        # updates in bulk in the same transaction. It's committed before anything is announced so the
+                        # write lock isn't held across discord calls.
+                        frozen, terminated = await session.run_sync(streaks.evaluate_streaks, today, timezone, shard)
+                        await session.commit()
+                    # Running streaks are a day longer and some have ended, so the cached stats are stale.
+                    cache.stats_cache.clear()
+                    # Announce the streaks that lost a freeze and the ones that were terminated, collected into as
+                    # few messages per art channel as the length limit allows. Guilds without an art channel are
+                    # skipped and a failing channel doesn't hold up the others.
+                    lines = {}
+                    for streak in frozen:
+                        if streak.art_channel_id is not None:
+                            lines.setdefault(streak.art_channel_id, []).append(
+                                f"<@{streak.user_id}> failed to fulfill yesterday's streak requirement and has lost "
+                                f"a freeze.")
+                    for streak in terminated:
+                        if streak.art_channel_id is not None:
+                            duration = (today - streak.creation_date).days + 1
+                            lines.setdefault(streak.art_channel_id, []).append(
+                                termination_message(streak.user_id, duration, 1))
+                    await send_channel_messages({artChannelId: split_message(channelLines, "\n", "")
+                                                 for artChannelId, channelLines in lines.items()})
+                    frozenCount += len(frozen)
+                    terminatedCount += len(terminated)
+                except Exception:
+                    log.exception("Streak check failed for %s on shard %d", timezone, shard.ids[0])
+            async with Session() as session:
+                await session.run_sync(sharding.finish_lease, "check_streaks", shard.ids[0], now.replace(tzinfo=None))
+                await session.commit()
+        if dueCount == 0:
+            return
+        metrics.record_job("check_streaks", time.perf_counter() - start,
+                           timezones=dueCount, frozen=frozenCount, terminated=terminatedCount,
+                           caught_up_days=caughtUpDays)
+        log.info("Streaks checked successfully! %d frozen, %d terminated.", frozenCount, terminatedCount)
+        log.debug("Channel cache: %d hits, %d REST fallbacks so far.",
+                  cache.guild_config.hits, cache.guild_config.misses)
+    except Exception:
+        log.exception("Streak check failed")
+
+
+"""
+# Helper function that catches a timezone's streaks up on every check missed since the bucket was last checked. All
+# missed days are evaluated and applied in one transaction by 'streaks.catch_up_streaks', then every art channel gets one
+# summary listing the freezes its members lost and the streaks that ended, split only where discord's message length
+# limit requires it.
+# @Params:
+# timezone; Expected Type: str - the bucket's timezone
+# last_checked; Expected Type: datetime.date - the last date the bucket was checked for
+# today; Expected Type: datetime.date - the bucket's current local date
+# shard; Expected Type: sharding.ShardSet - the single shard the bucket belongs to
+# @Returns:
+# tuple of the number of running streaks that lost freezes and the number of streaks that were terminated
+"""
+async def catch_up_streaks(timezone: str, last_checked: datetime.date, today: datetime.date,
+                           shard: sharding.ShardSet) -> (int, int):
+    missedDays = (today - last_checked).days
+    log.info("Catching up %d missed streak checks in %s (%s to %s)...", missedDays, timezone,
+             last_checked + datetime.timedelta(1), today)
+    async with Session() as session:
+        # claim the bucket before anything is evaluated, see 'run_streak_check'
+        if not await session.run_sync(streaks.mark_checked, timezone, today, shard, last_checked):
+            await session.rollback()
+            log.info("Streaks in %s on shard %d were already caught up to %s", timezone, shard.ids[0], today)
+            return 0, 0
+        outcomes = await session.run_sync(streaks.catch_up_streaks, last_checked, today, timezone, shard)
+        await session.commit()
+    cache.stats_cache.clear()
+    # Collect the lines of every art channel's summary.
+    lines = {}
+    for outcome in outcomes:
+        if outcome.art_channel_id is None:
+            continue
+        if outcome.end_date is not None:
+            duration = (outcome.end_date - outcome.creation_date).days + 1
+            line = f"<@{outcome.user_id}>'s art streak ended on {outcome.end_date.isoformat()} after {duration} days."
+        else:
+            plural = "" if outcome.freezes_lost == 1 else "s"
+            line = f"<@{outcome.user_id}> lost {outcome.freezes_lost} freeze{plural}."
+        lines.setdefault(outcome.art_channel_id, []).append(line)
+    header = f"While I was away I missed {missedDays} days of streak checks, here's what happened since " \
+             f"{(last_checked + datetime.timedelta(1)).isoformat()}:\n"
+    messages = {artChannelId: split_message(channelLines, "\n", "", header)
+                for artChannelId, channelLines in lines.items()}
+    await send_channel_messages(messages)
+    return sum(1 for outcome in outcomes if outcome.end_date is None), \
+        sum(1 for outcome in outcomes if outcome.end_date is not None)
+
+
+"""
+# Helper function that builds the announcement of an art streak's termination.
 # @Params:
-# streak_id; Expected Type: int - the id for the streak to be ended
+# user_id; Expected Type: int - the id of the user the streak belonged to
+# duration; Expected Type: int - the length of the streak in days
 # reason; Expected Type: int - the numeric code for the reason to provide in the announcement for why the streak was terminated
 """
 # reason uses ints as error code type bits. 0 = cancelled by user; 1 = failure to meet streak requirements
-async def terminate_streak(streak_id: int, reason: int):
+def termination_message(user_id: int, duration: int, reason: int) -> str:
+    # Initialize the str for the corresponding termination reason numeric code.
+    if reason == 0:
+        reasonStr = "The streak was cancelled by the user."
+    elif reason == 1:
+        reasonStr = "The streak parameters were not fulfilled in time."
+    return f"<@{user_id}>'s art streak of {duration} days has ended.\nReason: {reasonStr}"
+
+
+"""
+# Scheduler call back function that moves the art streaks that ended more than ARCHIVE_RETENTION_DAYS ago into the
+# archive tables and then hands the pages they took up back to the file system, see 'archive.py'.
+# Every shard of this process is archived under its own lease. The streaks are moved one batch per write through the
+# group commit writer, so the commands' writes keep going through in between and no write waits on the whole job. The
+# stats of an archived streak stay the same, so the stats cache is left alone.
+"""
+@tasks.loop(time=archive_schedule_time)
+async def archive_streaks():
+    start = time.perf_counter()
     try:
-        print(f"Terminating streak: {streak_id}...")
-        with Session() as session:
-            # Pull the requested art streak.
-            artStreak = session.query(ArtStreak).filter(ArtStreak.id == streak_id).first()
-            # Set it to inactive and set its end date.
-            artStreak.active = False
-            artStreak.end_date = datetime.date.today()
-            session.commit()
-            # Initialize the str for the corresponding termination reason numeric code.
-            if reason == 0:
-                reasonStr = "The streak was cancelled by the user."
-            elif reason == 1:
-                reasonStr = "The streak parameters were not fulfilled in time."
-            print(f"Termination reason: {reasonStr}")
-            # Pull the guild that the art streak belongs to.
-            guildObj = session.query(Guild).filter(Guild.id == artStreak.guild_id).first()
-            # Pull the designated art channel for said guild.
-            artChannel = await bot.fetch_channel(guildObj.art_channel_id)
-            # Send the announcement for the art streak's termination.
-            await artChannel.send(f"<@{artStreak.user_id}>'s art streak of {artStreak.get_duration()} days has ended."
-                                  f"\nReason: {reasonStr}")
-            print("Streak terminated successfully!")
-    except Exception as e:
-        print(e)
+        now = utc_now()
+        cutoff = now.date() - datetime.timedelta(archive.ARCHIVE_RETENTION_DAYS)
+        streakCount = 0
+        submissionCount = 0
+        for shard in shards.split():
+            if await take_lease("archive_streaks", shard, now) is None:
+                continue
+            renewed = time.monotonic()
+            while True:
+                moved, submissions = await writer.group_writer.submit(archive.archive_streaks, cutoff, shard)
+                streakCount += moved
+                submissionCount += submissions
+                if moved < archive.ARCHIVE_BATCH:
+                    break
+                # Renew the lease while working off a large backlog so it doesn't run out under the job.
+                if time.monotonic() - renewed > sharding.LEASE_TTL / 2:
+                    if await take_lease("archive_streaks", shard, utc_now()) is None:
+                        break
+                    renewed = time.monotonic()
+            async with Session() as session:
+                await session.run_sync(sharding.finish_lease, "archive_streaks", shard.ids[0],
+                                       now.replace(tzinfo=None))
+                await session.commit()
+        # Free pages belong to the whole database file rather than to a shard, and vacuuming them twice is harmless.
+        freedPages = 0
+        async with Session() as session:
+            vacuumEnabled = await session.run_sync(archive.vacuum_enabled)
+        if vacuumEnabled:
+            while True:
+                freed, remaining = await writer.group_writer.submit(archive.incremental_vacuum)
+                freedPages += freed
+                if remaining == 0 or freed == 0:
+                    break
+        else:
+            log.warning("The database isn't in incremental auto vacuum mode, run the migrations to have the pages of "
+                        "archived streaks freed")
+        metrics.record_job("archive_streaks", time.perf_counter() - start,
+                           streaks=streakCount, submissions=submissionCount, pages=freedPages)
+        log.info("Archived %d streaks with %d submissions and freed %d pages.", streakCount, submissionCount,
+                 freedPages)
+    except Exception:
+        log.exception("Streak archival failed")
 
 
 """
@@ -357,19 +689,20 @@ async def terminate_streak(streak_id: int, reason: int):
 NEEDS RECOMMENTING
 """
 @bot.tree.command(name="amisubscribed", description="Tells you if you're subscribed for vc notifs or not.")
+@metrics.timed_command("amisubscribed")
 async def am_i_subscribed(interaction: discord.Interaction) -> None:
     # Open session with local db
-    with Session() as session:
+    async with Session() as session:
         try:
-            check_user_entry(interaction.user.id)
-            guild = session.get(Guild, interaction.guild.id)
-            usr = session.get(User, interaction.user.id)
-            if usr.notif_subscriptions.__contains__(guild):
+            await check_user_entry(interaction.user.id)
+            # look the single subscription row up instead of loading the guild's whole subscriber list
+            if await session.scalar(queries.subscription(interaction.guild.id, interaction.user.id)) is not None:
                 await interaction.response.send_message("You are subscribed")
             else:
                 await interaction.response.send_message("You are not subscribed")
-        except Exception as e:
-            print(e)
+        except Exception:
+            log.exception("amisubscribed failed")
+            metrics.note_error()
             await interaction.response.send_message("An error has occurred. Go bug Artemis.")
 
 
@@ -380,23 +713,24 @@ async def am_i_subscribed(interaction: discord.Interaction) -> None:
 # NEEDS RECOMMENTING
 """
 @bot.tree.command(name="subscribe", description="Subscribes you to vc notifs.")
+@metrics.timed_command("subscribe")
 async def subscribe(interaction: discord.Interaction) -> None:
-    # Open session with the local db.
-    with Session() as session:
-        try:
-            check_user_entry(interaction.user.id)
-            usr = session.get(User, interaction.user.id)
-            guild = session.get(Guild, interaction.guild.id)
-            subscribed = usr.notif_subscriptions.__contains__(guild)
-            if not subscribed:
-                guild.member_subs.append(usr)
-                session.commit()
-                await interaction.response.send_message("You have been subscribed.")
-            else:
-                await interaction.response.send_message("You are already subscribed.")
-        except Exception as e:
-            print(e)
-            await interaction.response.send_message("An error has occurred. Go bug Artemis.")
+    try:
+        # Queue the subscription on the group commit writer, which also creates the user's entry unless the user is
+        # already known.
+        changed = await writer.group_writer.submit(writes.set_subscription, interaction.user.id, interaction.guild.id,
+                                                   True, cache.known_users.known(interaction.user.id))
+        cache.known_users.add(interaction.user.id)
+        # keep the vc notifier's subscriber index in step
+        cache.subscriber_index.add(interaction.guild.id, interaction.user.id)
+        if changed:
+            await interaction.response.send_message("You have been subscribed.")
+        else:
+            await interaction.response.send_message("You are already subscribed.")
+    except Exception:
+        log.exception("subscribe failed")
+        metrics.note_error()
+        await interaction.response.send_message("An error has occurred. Go bug Artemis.")
 
 
 """
@@ -406,42 +740,91 @@ async def subscribe(interaction: discord.Interaction) -> None:
 NEEDS RECOMMENTING
 """
 @bot.tree.command(name="unsubscribe", description="Unsubscribes you from vc notifs.")
+@metrics.timed_command("unsubscribe")
 async def unsubscribe(interaction: discord.Interaction) -> None:
-    with Session() as session:
-        try:
-            check_user_entry(interaction.user.id)
-            usr = session.get(User, interaction.user.id)
-            guild = session.get(Guild, interaction.guild.id)
-            if usr.notif_subscriptions.__contains__(guild):
-                guild.member_subs.remove(usr)
-                session.commit()
-                await interaction.response.send_message("You have been unsubscribed.")
-            else:
-                await interaction.response.send_message("You aren't subscribed to begin with.")
-        except Exception as e:
-            print(e)
-            await interaction.response.send_message("An error has occurred. Go bug Artemis.")
+    try:
+        changed = await writer.group_writer.submit(writes.set_subscription, interaction.user.id, interaction.guild.id,
+                                                   False, cache.known_users.known(interaction.user.id))
+        cache.known_users.add(interaction.user.id)
+        cache.subscriber_index.remove(interaction.guild.id, interaction.user.id)
+        if changed:
+            await interaction.response.send_message("You have been unsubscribed.")
+        else:
+            await interaction.response.send_message("You aren't subscribed to begin with.")
+    except Exception:
+        log.exception("unsubscribe failed")
+        metrics.note_error()
+        await interaction.response.send_message("An error has occurred. Go bug Artemis.")
 
 
-def check_user_entry(id) -> bool:
-    with Session() as session:
-        result = session.query(User)\
-            .filter(User.id == id)\
-            .first()
-        if result is not None:
-            return True
-        usr = User(id=id)
-        session.add(usr)
-        session.commit()
-        return False
+"""
+# Helper function that creates a user's entry through the group commit writer if the bot hasn't seen them before.
+# Users in the known-user set are answered from memory without touching the database.
+# @Params:
+# id; Expected Type: int - id of the user
+# @Returns:
+# whether the user already had an entry
+"""
+async def check_user_entry(id) -> bool:
+    if cache.known_users.known(id):
+        return True
+    existed = await writer.group_writer.submit(writes.ensure_user, id)
+    cache.known_users.add(id)
+    return existed
+
+
+"""
+# Command that sets the timezone the user's art streaks follow. Streak days end at midnight in that timezone and
+# reminders are sent at its local reminder hours. The setting is stored on the user and copied onto every active streak
+# they have so the streak jobs pick them up in the new timezone's bucket. Accepts IANA timezone names and offers
+# matching names as autocomplete suggestions.
+# @Params:
+# interaction; Expected Type: discord.Interaction - the interaction object discord passes for all tree commands
+# timezone; Expected Type: str - IANA timezone name, e.g. 'America/New_York'
+"""
+@bot.tree.command(name="settimezone", description="Sets the timezone your art streak days and reminders follow.")
+@app_commands.describe(timezone="Your timezone, e.g. America/New_York or Europe/Berlin.")
+@metrics.timed_command("settimezone")
+async def set_timezone(interaction: discord.Interaction, timezone: str):
+    if timezone not in TIMEZONES:
+        await interaction.response.send_message("That is not a timezone I know. "
+                                                "Please pick one of the suggestions, e.g. America/New_York.")
+        return
+    try:
+        # Store the timezone and move the user's running streaks over to it in one write, creating the user's entry if
+        # this is the first time the bot sees them.
+        await writer.group_writer.submit(writes.set_timezone, interaction.user.id, timezone,
+                                         cache.known_users.known(interaction.user.id))
+        cache.known_users.add(interaction.user.id)
+        await interaction.response.send_message(f"Your timezone has been set to {timezone}. "
+                                                f"Your art streak days now end at midnight there.")
+    except Exception:
+        log.exception("settimezone failed")
+        metrics.note_error()
+        await interaction.response.send_message("An error has occurred. Go bug Artemis.")
+
+
+"""
+# Autocomplete callback for the 'timezone' option of 'settimezone'. Suggests up to 25 timezone names containing what
+# has been typed so far.
+# @Params:
+# interaction; Expected Type: discord.Interaction - the autocomplete interaction
+# current; Expected Type: str - what the user has typed so far
+"""
+@set_timezone.autocomplete("timezone")
+async def timezone_autocomplete(interaction: discord.Interaction, current: str) -> [app_commands.Choice[str]]:
+    current = current.lower()
+    matches = [timezone for timezone in TIMEZONES if current in timezone.lower()][:25]
+    return [app_commands.Choice(name=timezone, value=timezone) for timezone in matches]
 
 
 """
 # Command that allows the user to submit art which either adds to their active art streak on the local guild or starts
-# a new one if there isn't one already. Accepts image and audio files as valid media formats. Handles the backend work
-# for initializing a new streak and adding new submissions to streaks in the data base and the frontend work of sending
-# responses to discord that display the submission file and a mention of the author and the day of the streak the 
-# submission was posted on.
+# a new one if there isn't one already. Accepts image and audio files as valid media formats. The interaction is
+# acknowledged with a deferred response right away and the submission is queued on the submission pipeline, where
+# 'process_submission' does the backend work for initializing a new streak and adding new submissions to streaks in the
+# data base and the frontend work of sending responses to discord that display the submission file and a mention of the
+# author and the day of the streak the submission was posted on.
 # @Params:
 # interaction; Expected Type: discord.Interaction - the interaction object discord passes for all tree commands 
 #                                                        (mainly handles meta data and a bunch of async call back stuff)
@@ -449,56 +832,84 @@ def check_user_entry(id) -> bool:
 #                                                                                      command and passes it to the code                                
 """
 @bot.tree.command(name="submitart", description="Submit art for an art streak. Only accepts image and audio files.")
+@metrics.timed_command("submitart")
 async def submit_art(interaction: discord.Interaction, attachment: discord.Attachment):
     # check if the attachment is a valid file type (currently only allows audio or image)
     if attachment.content_type.__contains__("image") or attachment.content_type.__contains__("audio"):
-        try:
-            with Session() as session:
-                # query all active art streaks linked to the local guild
-                result = session.query(ArtStreak)\
-                    .join(Guild, ArtStreak.guild_id == Guild.id)\
-                    .filter(and_(and_(Guild.id == interaction.guild_id, ArtStreak.user_id == interaction.user.id), ArtStreak.active))\
-                    .first()
-                # if none exist then create a new one
-                if result is None:
-                    guildObj: Guild = session.query(Guild).filter(Guild.id == interaction.guild_id).first()
-                    # if guild has not designated an art channel then raise exception and inform user
-                    if guildObj.art_channel_id is None:
-                        await interaction.response.send_message("This guild has not designated an art channel!")
-                        raise Exception("Art channel not designated on this guild!")
-                    # initialize new art streak and add to session
-                    result = ArtStreak(guild_id=interaction.guild_id
-                                          , user_id=interaction.user.id
-                                          , creation_date=datetime.date.today())
-                    guildObj.art_streaks.append(result)
-                    session.add(result)
-                # initialize submission and add it to the art streak
-                submissionObj = ArtStreakSubmission(art_streak_id=result.id, creation_date=datetime.date.today(), user_id=interaction.user.id)
-                result.submissions.append(submissionObj)
-                # Parse the byte stream of the attachment object provided by discord and turn it back into a file so it
-                # can be posted by the bot in the response
-                async with aiohttp.ClientSession() as aioSession:
-                    async with aioSession.get(attachment.url) as resp:
-                        img = await resp.read()
-                        with io.BytesIO(img) as file:
-                            await interaction.response\
-                                .send_message(content=f"Day {(datetime.date.today() - result.creation_date).days + 1} art"
-                                                      f" streak submission by <@{interaction.user.id}>."
-                                                , file=discord.File(file, attachment.filename))
-                # retrieve object of the response just sent and log its message link in the database entry for the
-                # submission so the db can refer back to the corresponding message
-                message = await interaction.original_response()
-                submissionObj.message_link = message.jump_url
-                session.add(submissionObj)
-                session.commit()
-        except Exception as e:
-            print(e)
+        # refuse attachments above the relay's size limit before touching the db or downloading anything
+        if attachment.size > media.ATTACHMENT_MAX_SIZE:
+            await interaction.response\
+                .send_message(f"That file is too large. Submissions can be at most "
+                              f"{media.ATTACHMENT_MAX_SIZE // (1024 * 1024)} MB.")
+            return
+        # acknowledge the interaction right away so discord doesn't time it out, then hand the actual work off to the
+        # submission pipeline which processes the guild's submissions in order in the background
+        await interaction.response.defer(thinking=True)
+        await pipeline.submission_pipeline.submit(interaction.guild_id, process_submission, interaction, attachment)
     else:
         # inform the user they have entered an invalid media format
         await interaction.response\
             .send_message("That is not an accepted media format. Please Submit an image or audio file.")
 
 
+"""
+# Pipeline job that does the work behind a deferred 'submitart' interaction. The active streak is only looked up at
+# first, so nothing is locked in the db while the attachment is relayed. Once the response message has been sent, the
+# submission is written together with the link to that message and the streak's counters in one short transaction,
+# creating the streak if there wasn't one. Submissions from the same guild are processed one after another by the
+# pipeline, so the streak can't change hands in between.
+# @Params:
+# interaction; Expected Type: discord.Interaction - the deferred 'submitart' interaction
+# attachment; Expected Type: discord.Attachment - the submitted file
+"""
+async def process_submission(interaction: discord.Interaction, attachment: discord.Attachment):
+    try:
+        async with Session() as session:
+            # query the user's active art streak on the local guild
+            result = await session.scalar(queries.active_streak(interaction.guild_id, interaction.user.id))
+            # if none exists a new one is going to be started, which needs a designated art channel
+            if result is None:
+                artChannelId = cache.guild_config.art_channel_id(interaction.guild_id, cache.MISSING)
+                # the guild config cache is loaded by 'startup_sync' after the bot is ready, until then (or if that
+                # failed) the guild's entry is read from the db instead
+                if artChannelId is cache.MISSING:
+                    guildObj: Guild = await session.get(Guild, interaction.guild_id)
+                    artChannelId = guildObj.art_channel_id if guildObj is not None else None
+                if artChannelId is None:
+                    await interaction.followup.send("This guild has not designated an art channel!")
+                    return
+                # a new streak follows the user's timezone setting
+                userObj = await session.get(User, interaction.user.id)
+                timezone = userObj.timezone if userObj is not None and userObj.timezone else DEFAULT_TIMEZONE
+            else:
+                timezone = result.timezone
+        # the submission counts for the current day in the streak's timezone
+        today = streaks.local_date(timezone, utc_now())
+        day = 1 if result is None else (today - result.creation_date).days + 1
+        # Relay the attachment through the shared http client so it can be posted by the bot in the response.
+        # It's streamed in chunks into a spooled temp file that only moves to disk once it gets large.
+        with await media.fetch_attachment(attachment.url) as file:
+            message = await interaction.followup.send(content=f"Day {day} art streak submission by "
+                                                              f"<@{interaction.user.id}>.",
+                                                      file=discord.File(file, attachment.filename),
+                                                      wait=True)
+        # Record the submission with the message link of the response just sent so the db can refer back to the
+        # corresponding message. The group commit writer starts the streak if it's new and commits the submission
+        # together with the streak's counters and whatever other writes are queued right now.
+        await writer.group_writer.submit(writes.record_submission, interaction.guild_id, interaction.user.id, timezone,
+                                         today, message.jump_url)
+        # the user's cached stats are stale now
+        cache.stats_cache.invalidate(interaction.guild_id, interaction.user.id)
+    except media.AttachmentTooLarge as e:
+        # the file turned out bigger than discord reported, nothing has been written
+        log.warning("Rejected submission: %s", e)
+        await interaction.followup.send("That file is too large to be submitted.")
+    except Exception:
+        log.exception("Failed to process a submission")
+        metrics.note_error("submitart")
+        await interaction.followup.send("Something went wrong while processing your submission. Please try again.")
+
+
 """
 # Command that allows users to see an array of art streak related stats for any requested user. The stats tracked and
 # shown are as follows: the number of art streaks a user has had on the guild, the total amount of submissions made on
@@ -509,67 +920,50 @@ async def submit_art(interaction: discord.Interaction, attachment: discord.Attac
 # user; Expected Type: discord.User - tells discord to require the input of a user to retrieve stats on
 """
 @bot.tree.command(name="streakstats", description="View the stats of your current art streak.")
+@metrics.timed_command("streakstats")
 async def streak_stats(interaction: discord.Interaction, user: discord.User):
     try:
-        with Session() as session:
-            # Get list of all the specified user's streaks on the local guild.
-            streaksList = session.query(ArtStreak)\
-                .join(Guild, ArtStreak.guild_id == interaction.guild_id)\
-                .filter(and_(Guild.id == interaction.guild_id, ArtStreak.user_id == user.id))\
-                .order_by(ArtStreak.get_duration.desc())\
-                .all()
-            # Check if the user has any streaks on the local guild. If yes: then proceed, otherwise: inform command
-            # submitter that the requested user has no streaks locally.
-            if len(streaksList) != 0:
-                # Retrieve number of streaks a user has made on the local guild.
-                numstreaks = session.query(func.count(ArtStreak.id))\
-                    .join(Guild, ArtStreak.guild_id == interaction.guild_id)\
-                    .filter(and_(Guild.id == interaction.guild_id, ArtStreak.user_id == user.id))\
-                    .scalar()
-                # Retrieve number of total submission on the local guild across all streaks.
-                totalart = session.query(func.count(ArtStreakSubmission.id))\
-                    .filter(and_(ArtStreakSubmission.user_id == user.id, ArtStreakSubmission.art_streak.has(guild_id=interaction.guild_id)))\
-                    .scalar()
-                # Pull the currently active art streak on the guild for the requested user if one exists.
-                hasActiveStreak = session.query(ArtStreak)\
-                    .join(Guild, ArtStreak.guild_id == interaction.guild_id)\
-                    .filter(
-                    and_(and_(Guild.id == interaction.guild_id, ArtStreak.user_id == user.id)), ArtStreak.active)\
-                    .first()
-                # If the user does not have a currently active streak: then retrieve the most recent one and assign it
-                # to the 'mostRecentStreak' variable.
-                if hasActiveStreak is None:
-                    mostRecentStreak = session.query(ArtStreak.end_date)\
-                        .join(Guild, ArtStreak.guild_id == interaction.guild_id)\
-                        .filter(and_(Guild.id == interaction.guild_id, ArtStreak.user_id == user.id))\
-                        .order_by(ArtStreak.end_date.desc())\
-                        .first()
-                # Otherwise: assign the result of the 'hasActiveStreak' query to 'mostRecentStreak'.
-                else:
-                    mostRecentStreak = hasActiveStreak
-                # Check if the most recent streak is currently active. If yes: set the output string to say so;
-                # Otherwise: set the output string to tell how many days ago the most recent streak was.
-                if mostRecentStreak.active:
-                    mostRecentStreakOut = "user currently has a running streak"
-                else:
-                    mostRecentStreakOut = f"User's last streak was " \
-                                          f"{(datetime.date.today() - mostRecentStreak.end_date).days} days ago."
-                # Serve the response with all the requested data in it.
-                await interaction.response.send_message(f"<@{user.id}>'s streak stats:"
-                                                        f"\nNumber of streaks: {numstreaks}"
-                                                        f"\nTotal art submissions: {totalart}"
-                                                        f"\nLongest streak: {streaksList[0].get_duration.days}"
-                                                        f"\nMost recent streak: {mostRecentStreakOut}")
+        # Serve the stats from the cache if nothing has changed since they were last looked up. Otherwise pull all of
+        # them from the database in a single aggregate query and cache the result.
+        stats = cache.stats_cache.get(interaction.guild_id, user.id)
+        if stats is None:
+            async with Session() as session:
+                stats = (await session.execute(queries.user_streak_stats(interaction.guild_id, user.id))).one()
+            cache.stats_cache.set(interaction.guild_id, user.id, stats)
+        # Check if the user has any streaks on the local guild. If yes: then proceed, otherwise: inform command
+        # submitter that the requested user has no streaks locally.
+        if stats.num_streaks != 0:
+            # Check if the user currently has a running streak. If yes: set the output string to say so; Otherwise: set
+            # the output string to tell how many days ago the most recent streak ended.
+            # "Today" is the current date in the timezone the user's streak days follow, not on the server.
+            today = streaks.local_date(stats.timezone, utc_now())
+            longestStreak = stats.longest_streak or 0
+            if stats.active_since is not None:
+                mostRecentStreakOut = "user currently has a running streak"
+                longestStreak = max(longestStreak, (today - stats.active_since).days + 1)
             else:
-                # Inform the command submitter that the requested user has no streaks on the local guild.
-                await interaction.response.send_message(f"<@{user.id}> has no streaks archived on the local guild.")
-    except Exception as e:
-        print(e)
+                mostRecentStreakOut = f"User's last streak was " \
+                                      f"{(today - stats.last_end_date).days} days ago."
+            # Serve the response with all the requested data in it.
+            await interaction.response.send_message(f"<@{user.id}>'s streak stats:"
+                                                    f"\nNumber of streaks: {stats.num_streaks}"
+                                                    f"\nTotal art submissions: {stats.total_submissions}"
+                                                    f"\nLongest streak: {longestStreak}"
+                                                    f"\nMost recent streak: {mostRecentStreakOut}")
+        else:
+            # Inform the command submitter that the requested user has no streaks on the local guild.
+            await interaction.response.send_message(f"<@{user.id}> has no streaks archived on the local guild.")
+    except Exception:
+        log.exception("streakstats failed")
+        metrics.note_error()
 
 
 @bot.tree.command(name="get_ip", description="Pulls the public ip of the host machine which runs all our servers and posts it in chat.")
+@metrics.timed_command("get_ip")
 async def get_ip(interaction: discord.Interaction):
-    ip = get('https://api.ipify.org').content.decode('utf8')
+    # go through the shared http client so the request doesn't block the event loop
+    async with media.get_session().get('https://api.ipify.org') as resp:
+        ip = await resp.text()
     await interaction.response.send_message(f"Here is the server ip: {ip}")
 
 
@@ -585,18 +979,18 @@ async def get_ip(interaction: discord.Interaction):
     app_commands.Choice(name="Voice Chat Notifications", value="vc"),
     app_commands.Choice(name="Art Streaks", value="as")
 ])
+@metrics.timed_command("help")
 async def help(interaction: discord.Interaction, entry: typing.Optional[app_commands.Choice[str]]):
     try:
         if entry is None:
             entry = "mn"
         else:
             entry = entry.value
-        with open("manual_entries.json", 'r') as f:
-            manual = json.load(f)
-        entryStr = manual[entry]
+        entryStr = MANUAL_ENTRIES[entry]
         await interaction.response.send_message(entryStr)
-    except Exception as e:
-        print(e)
+    except Exception:
+        log.exception("help failed")
+        metrics.note_error()
 
 
 """
@@ -612,10 +1006,10 @@ async def push_reminder_test(ctx: commands.Context):
 
 
 """
-# Event handler for when a voice state is updated in any guild the bot is apart of. The logic in this handler
-# specifically filters for the event of someone going from not connected to any voice channels on that guild to being in
-# one. Then it further filters for whether they have brought the summed population of all the guild's voice channels
-# from zero to one. If so, the bot requests a list of users subscribed to vc notifs on the local guild from the db and
+# Event handler for when a voice state is updated in any guild the bot is apart of. The update is applied to the guild's
+# voice chat population kept by 'voice.occupancy', which reports whether it just brought the population of the guild's
+# voice channels (excepting the afk channel) from zero to one and no notification wave went out for the guild within the
+# cooldown window. If so, the bot requests a list of users subscribed to vc notifs on the local guild from the db and
 # iterates through them to send each a dm about the guild's VCs gaining population.
 # @Params:
 # member; Expected Type: discord.Member - user whom precipitated the change
@@ -624,37 +1018,27 @@ async def push_reminder_test(ctx: commands.Context):
 """
 @bot.event
 async def on_voice_state_update(member, before, after):
-    # Filter for user going from no voice channel connection to a voice channel connection
-    if before.channel is None and after.channel is not None:
-        # Retrieve the guild in which the change happened
-        guild: discord.Guild = after.channel.guild
-        # Retrieve a list of all voice channels except the afk channel
-        channels = [i for i in guild.voice_channels if i is not guild.afk_channel]
-        # Sum up all chatters in all VCs
-        totalChatters = 0
-        for channel in channels:
-            totalChatters += len(channel.members)
-        # If the total chatters out of ever voice channel is one, then begin notifying those subscribed to notifs
-        if totalChatters == 1:
-            print(f"The VC in {guild.name} now active!")
-            # Open session with local db
-            with Session() as session:
-                try:
-                    # This statement retrieves all user ids of subscribers affiliated with the local guild
-                    guildObj = session.get(Guild, guild.id)
-                    memberSubs = guildObj.member_subs
-                    # Iterate through the list of subscriber user ids and dm them each a notification about activity in
-                    # the guild
-                    for sub in memberSubs:
-                        user = discord.utils.get(guild.members, id=sub.id)
-                        # Avoid messaging the user who just joined the vc.
-                        if sub.id != member.id:
-                            # If the bot does not have an active dm with a user, create one before notifying them.
-                            if user.dm_channel is None:
-                                await bot.create_dm(user)
-                            await user.dm_channel.send(f"The VC in {guild.name} is now active!")
-                except Exception as e:
-                    print(e)
+    # Retrieve the guild in which the change happened
+    guild: discord.Guild = member.guild
+    # Apply the change to the guild's population counter. Only the first join into an empty voice chat outside of the
+    # cooldown window starts a notification wave.
+    if voice.occupancy.update(guild, before.channel, after.channel):
+        log.info("The VC in %s is now active!", guild.name)
+        try:
+            # The subscribers come from the in-memory index, the database is only asked until it has been loaded.
+            subscriberIds = cache.subscriber_index.subscribers(guild.id)
+            if subscriberIds is None:
+                async with Session() as session:
+                    subscriberIds = (await session.scalars(queries.guild_subscribers(guild.id))).all()
+            # Iterate through the subscriber ids and queue a dm for each of them about activity in the guild. The
+            # dispatcher delivers them in the background so the handler returns right away.
+            for subId in subscriberIds:
+                user = guild.get_member(subId)
+                # Avoid messaging the user who just joined the vc and subscribers that have left the guild.
+                if subId != member.id and user is not None:
+                    notifier.dm_dispatcher.enqueue(user, f"The VC in {guild.name} is now active!")
+        except Exception:
+            log.exception("Failed to queue VC notifications for guild %s", guild.id)
 
 
 """
@@ -667,12 +1051,12 @@ async def on_voice_state_update(member, before, after):
 @commands.is_owner()
 async def sync(ctx: commands.Context):
     try:
-        print("Syncing...")
+        log.info("Syncing...")
         synced = await bot.tree.sync()
-        print(synced)
-        print("Syncing complete!")
-    except Exception as e:
-        print(e)
+        log.info("Synced %d command(s)", len(synced))
+        log.info("Syncing complete!")
+    except Exception:
+        log.exception("Command sync failed")
 
 
 """
@@ -685,6 +1069,7 @@ async def sync(ctx: commands.Context):
 # run testing for the streak check function itself
 # run testing for the freeze decrease and replenishment feature
 # run streak stats while user has no streaks
+# run the archival of ended streaks
 """
 @bot.command(description="Trigger a test function for debugging")
 @commands.is_owner()
@@ -694,6 +1079,62 @@ async def run_test(ctx: commands.Context, *args):
             await check_streaks(force=True)
         else:
             await check_streaks()
+    elif(args[0] == "archive_streaks"):
+        await archive_streaks()
+
+
+"""
+# Command that recomputes the denormalized submission counters of every art streak from the submissions table and
+# reports any streaks whose stored counters have drifted. Passing '--fix' or '-f' also corrects the drifted counters.
+# It's only usable by the bot owner.
+# @Params:
+# ctx; Expected Type: commands.Context - standard non-tree bot command context object (See discord docs for more info).
+# args; Expected Type: str - optional flags passed after the command
+"""
+@bot.command(description="Checks the art streak submission counters for drift. Only usable by Artemis.")
+@commands.is_owner()
+async def check_counters(ctx: commands.Context, *args):
+    try:
+        fix = args.__contains__("--fix") or args.__contains__("-f")
+        if fix:
+            # the corrections are written through the group commit writer like every other write
+            drifted = await writer.group_writer.submit(writes.fix_counter_drift)
+            cache.stats_cache.clear()
+        else:
+            async with Session() as session:
+                drifted = await session.run_sync(streaks.find_counter_drift)
+        if len(drifted) == 0:
+            await ctx.channel.send("All art streak counters are consistent.")
+            return
+        # Report the drifted streaks, keeping the message within discord's length limit.
+        lines = [f"Streak {row.id}: count {row.submission_count} (actual {row.actual_count}), "
+                 f"last submission {row.last_submission_date} (actual {row.actual_last_submission_date})"
+                 for row in drifted]
+        status = "Corrected" if fix else "Found"
+        for message in split_message(lines, "\n", ""):
+            await ctx.channel.send(message)
+        await ctx.channel.send(f"{status} {len(drifted)} art streak(s) with drifted counters.")
+    except Exception:
+        log.exception("Counter check failed")
+
+
+"""
+# Command that reports the hit and miss counters of the bot's in-memory caches along with the statistics of its
+# background workers.
+# It's only usable by the bot owner.
+# @Params:
+# ctx; Expected Type: commands.Context - standard non-tree bot command context object (See discord docs for more info).
+"""
+@bot.command(description="Shows the bot's cache and worker statistics. Only usable by Artemis.")
+@commands.is_owner()
+async def cache_stats(ctx: commands.Context):
+    await ctx.channel.send(f"Streak stats cache: {cache.stats_cache.hits} hits, {cache.stats_cache.misses} misses"
+                           f"\nChannel cache: {cache.guild_config.hits} hits, "
+                           f"{cache.guild_config.misses} REST fallbacks"
+                           f"\n{notifier.dm_dispatcher.summary()}"
+                           f"\n{pipeline.submission_pipeline.summary()}"
+                           f"\n{looplag.monitor.summary()}"
+                           f"\nVC notification waves suppressed by the cooldown: {voice.occupancy.suppressed}")
 
 
 """
@@ -708,17 +1149,50 @@ async def run_test(ctx: commands.Context, *args):
 @commands.has_permissions(administrator=True)
 async def designate_art_channel(ctx: commands.Context):
     try:
-        with Session() as session:
-            # Retrieve db entry for the guild the command was issued on.
-            guildObj = session.query(Guild).filter(Guild.id == ctx.guild.id).first()
-            # Set the guild entry's 'art_channel_id' field to the id of the channel the command was issued from.
-            guildObj.art_channel_id = ctx.channel.id
-            session.commit()
+        # Set the guild entry's 'art_channel_id' field to the id of the channel the command was issued from.
+        await writer.group_writer.submit(writes.set_art_channel, ctx.guild.id, ctx.channel.id)
+        cache.guild_config.set_art_channel(ctx.guild.id, ctx.channel.id)
         # Inform the command submitter that the art channel has been designated.
         await ctx.channel.send("This channel has been designated as the art channel.")
-    except Exception as e:
-        print(e)
+    except Exception:
+        log.exception("Failed to designate the art channel")
+
+
+"""
+# Command that exports the art streak history of the guild it's issued on, every streak and submission including the
+# archived ones, as a gzipped CSV file, or as JSON lines when '--jsonl' or '-j' is passed. The history is streamed out
+# of the database a batch at a time and uploaded to the channel the command was issued in. Exports bigger than the guild's
+# upload limit are split into several files, each uploaded as soon as it's full.
+# It's restricted to guild administrators.
+# @Params:
+# ctx; Expected Type: commands.Context - standard non-tree bot command context object (See discord docs for more info).
+# args; Expected Type: str - optional flags passed after the command
+"""
+@bot.command(description="Exports the guild's art streak history as a compressed file. Requires guild admin to use.")
+@commands.has_permissions(administrator=True)
+async def export_streaks(ctx: commands.Context, *args):
+    try:
+        fmt = "jsonl" if args.__contains__("--jsonl") or args.__contains__("-j") else "csv"
+        partSize = export.EXPORT_PART_SIZE or ctx.guild.filesize_limit
+        now = utc_now()
+        name = f"art-streaks-{ctx.guild.id}-{now.date().isoformat()}"
+        start = time.perf_counter()
+        sent = 0
+        async with Session() as session:
+            async for filename, file in export.export_parts(session, ctx.guild.id, fmt, partSize, name, now):
+                with file:
+                    await ctx.channel.send(file=discord.File(file, filename))
+                sent += 1
+        if sent == 0:
+            await ctx.channel.send("This guild has no art streak history to export.")
+            return
+        log.info("Exported the art streak history of guild %d in %d file(s) in %.1fs", ctx.guild.id, sent,
+                 time.perf_counter() - start)
+    except Exception:
+        log.exception("Streak export failed")
+        await ctx.channel.send("The export failed, please try again later.")
 
 
-# Starting call to entrypoint function
-asyncio.run(main())
+# Starting call to entrypoint function. Importing the module, e.g. from the benchmark suite, doesn't start the bot.
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+# Shared HTTP client and attachment relay. One aiohttp session with a pooled, keep-alive connector lives as long as the
+# bot so requests to the discord CDN reuse open TLS connections instead of doing a fresh handshake every time.
+# Attachments are streamed through in bounded chunks into a spooled temporary file, which only moves to disk once it
+# grows past the spool threshold, so large audio files never have to sit in memory as a whole.
+#
+# Configuration (all optional, read from the environment or the .env file):
+#
+#  - HTTP_POOL_SIZE: maximum number of connections the shared client keeps open. Defaults to 20.
+#  - HTTP_KEEPALIVE: seconds an idle connection is kept alive for reuse. Defaults to 60.
+#  - ATTACHMENT_MAX_SIZE: largest attachment in bytes that will be relayed. Defaults to 25 MiB.
+#  - ATTACHMENT_SPOOL_THRESHOLD: size in bytes above which a relayed attachment is spooled to disk. Defaults to 1 MiB.
+import os
+import tempfile
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60"))
+ATTACHMENT_MAX_SIZE = int(os.getenv("ATTACHMENT_MAX_SIZE", str(25 * 1024 * 1024)))
+ATTACHMENT_SPOOL_THRESHOLD = int(os.getenv("ATTACHMENT_SPOOL_THRESHOLD", str(1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+_session = None
+
+
+"""
+# Raised when an attachment is larger than the configured maximum size.
+"""
+class AttachmentTooLarge(Exception):
+    pass
+
+
+"""
+# Returns the bot's shared HTTP client, creating it on first use so it's bound to the running event loop.
+"""
+def get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=HTTP_KEEPALIVE)
+        _session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120))
+    return _session
+
+
+"""
+# Closes the shared HTTP client and every pooled connection. Called once when the bot shuts down.
+"""
+async def close():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+"""
+# Streams a file from the given url into a spooled temporary file. The caller owns the returned file and is expected to
+# close it, preferably by using it as a context manager.
+# @Params:
+# url; Expected Type: str - url of the file to download, usually an attachment on the discord CDN
+# max_size; Expected Type: int - largest number of bytes accepted before the download is aborted
+# @Returns:
+# tempfile.SpooledTemporaryFile rewound to the start of the downloaded content
+"""
+async def fetch_attachment(url: str, max_size: int = ATTACHMENT_MAX_SIZE) -> tempfile.SpooledTemporaryFile:
+    file = tempfile.SpooledTemporaryFile(max_size=ATTACHMENT_SPOOL_THRESHOLD)
+    try:
+        async with get_session().get(url) as resp:
+            resp.raise_for_status()
+            # Refuse early if the server already tells us the file is too big.
+            if resp.content_length is not None and resp.content_length > max_size:
+                raise AttachmentTooLarge(f"Attachment is {resp.content_length} bytes, the limit is {max_size}")
+            received = 0
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                received += len(chunk)
+                # The header can be missing or wrong, so the limit is enforced on what actually arrives as well.
+                if received > max_size:
+                    raise AttachmentTooLarge(f"Attachment exceeds the limit of {max_size} bytes")
+                file.write(chunk)
+        file.seek(0)
+        return file
+    except BaseException:
+        file.close()
+        raise
@@ -0,0 +1,376 @@
+# Metrics for the bot: latency histograms and error counts for every app command, timings of every database statement
+# and discord REST call, and the duration and item counts of the scheduled jobs. Everything is kept in memory and served
+# in the Prometheus text format on a local HTTP endpoint. It can also be dumped to a file for offline analysis.
+#
+# Configuration (all optional, read from the environment or the .env file):
+#
+#  - METRICS_HOST: interface the endpoint listens on. Defaults to 127.0.0.1 so it's only reachable locally.
+#  - METRICS_PORT: port of the endpoint, served under '/metrics'. Defaults to 9108, offset by the process' first shard
+#    when the bot runs sharded (see 'sharding.py'); set it empty to disable the endpoint. If the port is taken the bot
+#    logs a warning and runs without the endpoint.
+#  - METRICS_DUMP: path of a file the metrics are written to every METRICS_DUMP_INTERVAL seconds (defaults to 60) and
+#    on shutdown. Nothing is written if it isn't set.
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+
+import discord
+from aiohttp import web
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+import sharding
+
+load_dotenv()
+log = logging.getLogger("pokebot.metrics")
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT", str(sharding.default_metrics_port(9108)))
+METRICS_DUMP = os.getenv("METRICS_DUMP")
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+
+# Upper bounds in seconds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+# Scheduled jobs take a lot longer than a single command or query.
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, float("inf"))
+
+# Name of the app command the current task is handling, so errors caught inside of it can be attributed to it.
+_currentCommand = contextvars.ContextVar("current_command", default=None)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+"""
+# Monotonically increasing count, split by label values.
+# @Params:
+# name; Expected Type: str - metric name
+# help; Expected Type: str - description shown in the exposition
+# labels; Expected Type: (str) - names of the labels the count is split by
+"""
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelNames = labels
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelNames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.labelNames), 0)
+
+    def render(self) -> [str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelNames, key)} {value}")
+        return lines
+
+
+"""
+# Distribution of observed values in cumulative buckets, split by label values.
+# @Params:
+# name; Expected Type: str - metric name
+# help; Expected Type: str - description shown in the exposition
+# labels; Expected Type: (str) - names of the labels the distribution is split by
+# buckets; Expected Type: (float) - ascending upper bounds of the buckets, ending with infinity
+"""
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelNames = labels
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelNames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(labels[name] for name in self.labelNames))
+        return 0 if series is None else series[2]
+
+    def render(self) -> [str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets, counts):
+                cumulative += bucketCount
+                labels = _format_labels(self.labelNames, key, 'le="' + _format_bound(bound) + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelNames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelNames, key)} {count}")
+        return lines
+
+
+"""
+# Value read from a callback whenever the metrics are rendered, e.g. the current depth of a queue.
+# @Params:
+# name; Expected Type: str - metric name
+# help; Expected Type: str - description shown in the exposition
+# read; Expected Type: function - returns the current value, None if there is none yet
+"""
+class Gauge:
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> [str]:
+        try:
+            value = self.read()
+        except Exception:
+            log.exception("Failed to read gauge %s", self.name)
+            value = None
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+"""
+# Holds every metric of the bot and renders them in the Prometheus text format.
+"""
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+command_duration = registry.register(Histogram(
+    "pokebot_command_duration_seconds", "Time spent handling an app command.", ("command",)))
+command_errors = registry.register(Counter(
+    "pokebot_command_errors_total", "Errors raised or caught while handling an app command.", ("command",)))
+db_query_duration = registry.register(Histogram(
+    "pokebot_db_query_duration_seconds", "Time spent executing a database statement.", ("operation",)))
+db_errors = registry.register(Counter(
+    "pokebot_db_errors_total", "Database statements that raised an error.", ("operation",)))
+rest_duration = registry.register(Histogram(
+    "pokebot_discord_rest_duration_seconds", "Time spent on a discord REST request.", ("method", "route")))
+rest_errors = registry.register(Counter(
+    "pokebot_discord_rest_errors_total", "Discord REST requests that failed.", ("method", "route", "status")))
+job_duration = registry.register(Histogram(
+    "pokebot_job_duration_seconds", "Time spent on a run of a scheduled job.", ("job",), JOB_BUCKETS))
+job_items = registry.register(Counter(
+    "pokebot_job_items_total", "Items processed by the runs of a scheduled job.", ("job", "item")))
+
+
+"""
+# Registers a gauge whose value is read from a callback every time the metrics are rendered.
+# @Params:
+# name; Expected Type: str - metric name
+# help; Expected Type: str - description shown in the exposition
+# read; Expected Type: function - returns the current value, None if there is none yet
+"""
+def add_gauge(name: str, help: str, read):
+    registry.register(Gauge(name, help, read))
+
+
+"""
+# Decorator that records the latency of an app command and counts the exceptions escaping it. Errors the command
+# catches itself are counted by calling 'note_error' in its except block.
+# @Params:
+# name; Expected Type: str - name of the command the metrics are recorded under
+"""
+def timed_command(name: str):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = _currentCommand.set(name)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                command_errors.inc(command=name)
+                raise
+            finally:
+                command_duration.observe(time.perf_counter() - start, command=name)
+                _currentCommand.reset(token)
+        return wrapper
+    return decorator
+
+
+"""
+# Counts an error that was caught while handling an app command.
+# @Params:
+# command; Expected Type: str - command the error belongs to, defaults to the command currently being handled
+"""
+def note_error(command: str = None):
+    command = command or _currentCommand.get()
+    if command is not None:
+        command_errors.inc(command=command)
+
+
+"""
+# Records a finished run of a scheduled job.
+# @Params:
+# job; Expected Type: str - name of the job
+# duration; Expected Type: float - seconds the run took
+# items; Expected Type: int - number of items processed in the run, one keyword per kind of item
+"""
+def record_job(job: str, duration: float, **items):
+    job_duration.observe(duration, job=job)
+    for item, count in items.items():
+        job_items.inc(count, job=job, item=item)
+
+
+"""
+# Times every statement executed by a database engine.
+# @Params:
+# engine; Expected Type: sqlalchemy.Engine - the engine to instrument, for an async engine pass its 'sync_engine'
+"""
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        db_query_duration.observe(time.perf_counter() - start, operation=_operation(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+        db_errors.inc(operation=_operation(context.statement or ""))
+
+
+def _operation(statement: str) -> str:
+    words = statement.split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+"""
+# Times every REST request made through a discord http client. The route label is the route's template, e.g.
+# '/channels/{channel_id}/messages', so it doesn't grow with the number of channels.
+# @Params:
+# http; Expected Type: discord.http.HTTPClient - the client to instrument, usually 'bot.http'
+"""
+def instrument_http(http):
+    request = http.request
+
+    async def timed_request(route, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await request(route, **kwargs)
+        except discord.HTTPException as e:
+            rest_errors.inc(method=route.method, route=route.path, status=str(e.status))
+            raise
+        except Exception:
+            rest_errors.inc(method=route.method, route=route.path, status="error")
+            raise
+        finally:
+            rest_duration.observe(time.perf_counter() - start, method=route.method, route=route.path)
+
+    http.request = timed_request
+
+
+"""
+# Writes the current metrics to a file in the Prometheus text format. The file is replaced in one step so readers never
+# see half of it.
+# @Params:
+# path; Expected Type: str - file to write
+"""
+def dump(path: str):
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "w") as f:
+        f.write(registry.render())
+    os.replace(tmpPath, path)
+
+
+"""
+# Serves the metrics on the local endpoint and periodically dumps them to a file, depending on the configuration. A port
+# that is already taken only costs the endpoint, the bot keeps running.
+# @Params:
+# host; Expected Type: str - interface the endpoint listens on
+# port; Expected Type: str - port of the endpoint, empty to disable it
+# dump_path; Expected Type: str - file the metrics are dumped to, None to disable dumping
+# dump_interval; Expected Type: float - seconds between two dumps
+"""
+class MetricsServer:
+    def __init__(self, host: str = METRICS_HOST, port: str = METRICS_PORT, dump_path: str = METRICS_DUMP,
+                 dump_interval: float = METRICS_DUMP_INTERVAL):
+        self.host = host
+        self.port = port
+        self.dumpPath = dump_path
+        self.dumpInterval = dump_interval
+        self._runner = None
+        self._dumper = None
+
+    async def start(self):
+        if self.port:
+            app = web.Application()
+            app.router.add_get("/metrics", self._serve)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            try:
+                await web.TCPSite(self._runner, self.host, int(self.port)).start()
+                log.info("Serving metrics on http://%s:%s/metrics", self.host, self.port)
+            except OSError as e:
+                # e.g. another process on the host still holds the port, which mustn't keep the bot from starting
+                log.warning("Can't serve metrics on %s:%s, running without the endpoint: %s", self.host, self.port, e)
+                await self._runner.cleanup()
+                self._runner = None
+        if self.dumpPath:
+            self._dumper = asyncio.create_task(self._dump_periodically())
+
+    async def stop(self):
+        if self._dumper is not None:
+            self._dumper.cancel()
+            await asyncio.gather(self._dumper, return_exceptions=True)
+            self._dumper = None
+            await asyncio.to_thread(dump, self.dumpPath)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _serve(self, request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def _dump_periodically(self):
+        while True:
+            await asyncio.sleep(self.dumpInterval)
+            try:
+                await asyncio.to_thread(dump, self.dumpPath)
+            except Exception:
+                log.exception("Failed to dump the metrics")
+
+
+server = MetricsServer()
@@ -2,11 +2,17 @@
 import datetime
 
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, ForeignKey, Date, Boolean, Table, Column
+from sqlalchemy import String, ForeignKey, Date, DateTime, Boolean, Table, Column, Index, Integer, ColumnElement, text, \
+    case, cast, func, literal
 from typing import List
 from sqlalchemy.ext import hybrid
 
 
+# Timezone art streaks follow unless their user has set one of their own. It's the zone the streak jobs used to be hard
+# coded to.
+DEFAULT_TIMEZONE = "America/Denver"
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -16,6 +22,8 @@ subscriber_association_table = Table(
     Base.metadata,
     Column("user_id", ForeignKey("users.id"), primary_key=True),
     Column("guild_id", ForeignKey("guilds.id"), primary_key=True),
+    # the primary key only covers lookups by user, subscriber lists are pulled by guild
+    Index("ix_subscriber_association_table_guild_id", "guild_id"),
 )
 
 
@@ -27,9 +35,11 @@ class User(Base):
     notif_subscriptions: Mapped[List["Guild"]] = relationship(
         secondary=subscriber_association_table, back_populates="member_subs"
     )
+    # IANA timezone name set through 'settimezone', None for the default timezone
+    timezone: Mapped[str] = mapped_column(String(64), nullable=True)
 
     def __repr__(self) -> str:
-        return f"User(id={self.id}, notif_subscriptions={self.notif_subscriptions})"
+        return f"User(id={self.id}, notif_subscriptions={self.notif_subscriptions}, timezone={self.timezone!r})"
 
 
 class Guild(Base):
@@ -49,6 +59,17 @@ class Guild(Base):
 
 class ArtStreak(Base):
     __tablename__ = "art_streaks"
+    __table_args__ = (
+        # per user lookups from 'submitart' and 'streakstats'
+        Index("ix_art_streaks_guild_id_user_id_active", "guild_id", "user_id", "active"),
+        # partial index over active streaks only, used by the streak checks and the reminders of every timezone
+        Index("ix_art_streaks_active_timezone_last_submission_date", "timezone", "last_submission_date",
+              sqlite_where=text("active = 1")),
+        # partial index over ended streaks only, used by the archival job to find the streaks past the retention window
+        Index("ix_art_streaks_inactive_end_date", "end_date", sqlite_where=text("active = 0")),
+        # archived streaks keep their id, so an id must never be handed out again once its streak has been archived
+        {"sqlite_autoincrement": True},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     guild_id: Mapped[int] = mapped_column(ForeignKey("guilds.id"))
@@ -58,6 +79,13 @@ class ArtStreak(Base):
     end_date: Mapped[Date] = mapped_column(Date(), nullable=True)
     active: Mapped[bool] = mapped_column(Boolean(), default=True)
     freezes: Mapped[int] = mapped_column(default=2)
+    # Denormalized counters maintained by 'submitart' in the same transaction that adds a submission, so the streak
+    # jobs and stats don't have to scan the submissions table.
+    last_submission_date: Mapped[Date] = mapped_column(Date(), nullable=True)
+    submission_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    # Timezone whose midnight ends the streak's days, copied from the user's setting so the streak jobs can pick the
+    # streaks of one timezone straight from the index.
+    timezone: Mapped[str] = mapped_column(String(64), default=DEFAULT_TIMEZONE, server_default=DEFAULT_TIMEZONE)
     submissions: Mapped[List["ArtStreakSubmission"]] = relationship()
 
     def __repr__(self) -> str:
@@ -67,19 +95,44 @@ class ArtStreak(Base):
                f", creation_date={self.creation_date!r})" \
                f", end_date={self.end_date!r}" \
                f", active={self.active}" \
-               f", freezes={self.freezes}"
-
-
-    @hybrid.hybrid_property
-    def get_duration(self) -> datetime.timedelta:
-        if self.active:
-            return datetime.date.today() - self.creation_date + datetime.timedelta(1)
-        else:
-            return self.end_date - self.creation_date + datetime.timedelta(1)
+               f", freezes={self.freezes}" \
+               f", last_submission_date={self.last_submission_date!r}" \
+               f", submission_count={self.submission_count}" \
+               f", timezone={self.timezone!r}"
+
+
+    """
+    # Length of the streak in days, counting the day it started and the day it ended. A running streak is counted up to
+    # 'today', which has to be the current date in the streak's own timezone.
+    # @Params:
+    # today; Expected Type: datetime.date - current date in the streak's timezone, None leaves the length of a running
+    #                                       streak unknown
+    """
+    @hybrid.hybrid_method
+    def get_duration(self, today: datetime.date = None) -> datetime.timedelta:
+        endDate = today if self.active else self.end_date
+        if endDate is None:
+            return None
+        return endDate - self.creation_date + datetime.timedelta(1)
+
+    # SQL side of 'get_duration'. sqlite has no date arithmetic, so both dates are converted to julian day numbers and
+    # the result is the streak's length as a whole number of days rather than a timedelta. 'today' is bound as a
+    # parameter since sqlite only knows the server's time, and without it running streaks come out as NULL.
+    @get_duration.inplace.expression
+    @classmethod
+    def _get_duration_expression(cls, today: datetime.date = None) -> ColumnElement[int]:
+        endDate = case((cls.active, literal(today, Date())), else_=cls.end_date)
+        return cast(func.julianday(endDate) - func.julianday(cls.creation_date), Integer) + 1
 
 
 class ArtStreakSubmission(Base):
     __tablename__ = "art_streak_submissions"
+    __table_args__ = (
+        Index("ix_art_streak_submissions_art_streak_id_creation_date", "art_streak_id", "creation_date"),
+        Index("ix_art_streak_submissions_user_id", "user_id"),
+        # archived submissions keep their id as well
+        {"sqlite_autoincrement": True},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     art_streak_id: Mapped[int] = mapped_column(ForeignKey("art_streaks.id"))
@@ -95,7 +148,60 @@ class ArtStreakSubmission(Base):
                f", message_link={self.message_link!r})"
 
 
+class ArchivedStreak(Base):
+    # Ended art streaks moved out of 'art_streaks' by the archival job in 'archive.py' once they're past the retention
+    # window. Every streak keeps its original id and is reduced to one summary row with its length and submission count
+    # already worked out, plus links to its first and last submission.
+    __tablename__ = "archived_streaks"
+    __table_args__ = (
+        # per user lookups from 'streakstats'
+        Index("ix_archived_streaks_guild_id_user_id", "guild_id", "user_id"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    guild_id: Mapped[int] = mapped_column(ForeignKey("guilds.id"))
+    user_id: Mapped[int] = mapped_column()
+    creation_date: Mapped[Date] = mapped_column(Date())
+    end_date: Mapped[Date] = mapped_column(Date())
+    # length of the streak in days, the same number 'ArtStreak.get_duration' gave while it was still in 'art_streaks'
+    duration: Mapped[int] = mapped_column()
+    submission_count: Mapped[int] = mapped_column()
+    first_message_link: Mapped[str] = mapped_column(String(100), nullable=True)
+    last_message_link: Mapped[str] = mapped_column(String(100), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"ArchivedStreak(id={self.id!r}" \
+               f", guild_id={self.guild_id!r}" \
+               f", user_id={self.user_id!r}" \
+               f", creation_date={self.creation_date!r}" \
+               f", end_date={self.end_date!r}" \
+               f", duration={self.duration}" \
+               f", submission_count={self.submission_count})"
+
+
+class ArchivedSubmission(Base):
+    # Submissions of the archived streaks, moved along with them. The submitting user is the streak's user, so only what
+    # can't be found on the archived streak is kept.
+    __tablename__ = "archived_submissions"
+    __table_args__ = (
+        Index("ix_archived_submissions_art_streak_id_creation_date", "art_streak_id", "creation_date"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    art_streak_id: Mapped[int] = mapped_column(ForeignKey("archived_streaks.id"))
+    creation_date: Mapped[Date] = mapped_column(Date())
+    message_link: Mapped[str] = mapped_column(String(100))
+
+    def __repr__(self) -> str:
+        return f"ArchivedSubmission(id={self.id!r}" \
+               f", art_streak_id={self.art_streak_id!r}" \
+               f", creation_date={self.creation_date!r}" \
+               f", message_link={self.message_link!r})"
+
+
 class PersistentVars(Base):
+    # The global last check date was superseded by the per timezone 'streak_check_buckets'. The migration that added
+    # them seeds the default timezone's bucket from it.
     __tablename__ = "persistent_vars"
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -105,3 +211,37 @@ class PersistentVars(Base):
         return f"PersistentVars(id={self.id!r}" \
                f", last_streak_check_date={self.last_streak_check_date!r})"
 
+
+class StreakCheckBucket(Base):
+    # One row per timezone with active streaks and shard, recording the local date the streaks of the timezone's guilds
+    # on that shard were last checked for. Unsharded deployments only use shard 0.
+    __tablename__ = "streak_check_buckets"
+
+    timezone: Mapped[str] = mapped_column(String(64), primary_key=True)
+    shard_id: Mapped[int] = mapped_column(primary_key=True, default=0, server_default="0")
+    last_check_date: Mapped[Date] = mapped_column(Date())
+
+    def __repr__(self) -> str:
+        return f"StreakCheckBucket(timezone={self.timezone!r}" \
+               f", shard_id={self.shard_id!r}" \
+               f", last_check_date={self.last_check_date!r})"
+
+
+class JobLease(Base):
+    # Lease on one scheduled job for one shard. Whoever holds an unexpired lease is the only process that runs the job for
+    # the guilds on that shard; see 'sharding.py'.
+    __tablename__ = "job_leases"
+
+    job: Mapped[str] = mapped_column(String(32), primary_key=True)
+    shard_id: Mapped[int] = mapped_column(primary_key=True)
+    holder: Mapped[str] = mapped_column(String(128))
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime())
+    # when the holder last finished the job for the shard, None if it never has
+    last_run: Mapped[datetime.datetime] = mapped_column(DateTime(), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"JobLease(job={self.job!r}" \
+               f", shard_id={self.shard_id!r}" \
+               f", holder={self.holder!r}" \
+               f", expires_at={self.expires_at!r}" \
+               f", last_run={self.last_run!r})"
@@ -0,0 +1,180 @@
+# Background dispatcher for direct message notifications. Event handlers enqueue messages and return immediately while a
+# bounded pool of worker tasks delivers them, pacing requests per discord route, retrying transient failures with
+# exponential backoff and skipping users whose DMs are closed.
+import asyncio
+import collections
+import logging
+import random
+import time
+
+import discord
+
+log = logging.getLogger("pokebot.notifier")
+
+
+"""
+# Token bucket that paces requests against a single discord route. discord.py already waits out 429 responses, this just
+# keeps a burst of notifications from running into them in the first place.
+"""
+class RouteLimiter:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    """
+    # Waits until the route has capacity for another request and takes it.
+    """
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+"""
+# Queue backed pool of workers that delivers DMs in the background.
+# @Params:
+# workers; Expected Type: int - number of deliveries that may be in flight at once
+# max_attempts; Expected Type: int - attempts made per message before it's given up on
+# backoff; Expected Type: float - delay in seconds before the first retry, doubled on every further retry
+# closed_dm_ttl; Expected Type: float - seconds a user whose DMs are closed is skipped for
+# route_rate; Expected Type: float - requests per second allowed on each route
+"""
+class DMDispatcher:
+    def __init__(self, workers: int = 8, max_attempts: int = 4, backoff: float = 1.0,
+                 closed_dm_ttl: float = 24 * 60 * 60, route_rate: float = 5.0):
+        self.numWorkers = workers
+        self.maxAttempts = max_attempts
+        self.backoff = backoff
+        self.closedDmTtl = closed_dm_ttl
+        self._queue = None
+        self._workers = []
+        # One limiter per route a delivery touches: opening the DM channel and posting the message.
+        self._routes = {
+            "create_dm": RouteLimiter(route_rate, workers),
+            "send_message": RouteLimiter(route_rate, workers),
+        }
+        self._closedDms = {}
+        self._latencies = collections.deque(maxlen=1000)
+        self._pending = 0
+        self._idle = None
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+
+    """
+    # Starts the worker pool. Called lazily on the first enqueue so the queue is bound to the running event loop.
+    """
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.numWorkers)]
+
+    """
+    # Cancels the worker pool. Anything still queued is discarded.
+    """
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    """
+    # Queues a DM for delivery and returns immediately. Users whose DMs were recently found to be closed are skipped.
+    # @Params:
+    # user; Expected Type: discord.User or discord.Member - recipient of the message
+    # content; Expected Type: str - message to send
+    """
+    def enqueue(self, user, content: str):
+        closedAt = self._closedDms.get(user.id)
+        if closedAt is not None:
+            if time.monotonic() - closedAt < self.closedDmTtl:
+                self.dropped += 1
+                return
+            del self._closedDms[user.id]
+        if not self._workers:
+            self.start()
+        self._pending += 1
+        self._idle.clear()
+        self._queue.put_nowait((user, content, time.monotonic(), 1))
+
+    """
+    # Waits until every DM queued so far has been delivered or given up on, including the ones waiting for a retry.
+    """
+    async def join(self):
+        if self._idle is not None:
+            await self._idle.wait()
+
+    """
+    # Returns the median and 99th percentile enqueue-to-delivery latency in seconds over recent deliveries.
+    """
+    def latency_percentiles(self) -> tuple:
+        if not self._latencies:
+            return None, None
+        ordered = sorted(self._latencies)
+        return ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+    def summary(self) -> str:
+        p50, p99 = self.latency_percentiles()
+        latency = "n/a" if p50 is None else f"p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms"
+        return f"DMs delivered: {self.delivered}, failed: {self.failed}, dropped (DMs closed): {self.dropped}, " \
+               f"enqueue-to-delivery latency: {latency}"
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                finished = await self._deliver(*job)
+            except Exception:
+                log.exception("DM delivery failed")
+                self.failed += 1
+                finished = True
+            self._queue.task_done()
+            if finished:
+                self._pending -= 1
+                # Report once a wave of notifications has been worked off completely.
+                if self._pending == 0:
+                    self._idle.set()
+                    log.info(self.summary())
+
+    """
+    # Makes one delivery attempt. Returns False if the message was requeued for another attempt.
+    """
+    async def _deliver(self, user, content: str, enqueued: float, attempt: int) -> bool:
+        try:
+            if user.dm_channel is None:
+                await self._routes["create_dm"].acquire()
+                await user.create_dm()
+            await self._routes["send_message"].acquire()
+            await user.dm_channel.send(content)
+        except discord.Forbidden:
+            # The user has DMs closed or blocked the bot; retrying won't help.
+            self._closedDms[user.id] = time.monotonic()
+            self.dropped += 1
+            return True
+        except (discord.HTTPException, OSError) as e:
+            status = getattr(e, "status", None)
+            if (status is not None and status < 500 and status != 429) or attempt >= self.maxAttempts:
+                self.failed += 1
+                log.warning("Giving up on DM to %s: %s", user.id, e)
+                return True
+            # Requeue after an exponentially growing, jittered delay without tying up a worker.
+            delay = self.backoff * 2 ** (attempt - 1) * random.uniform(1, 1.5)
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait,
+                                                  (user, content, enqueued, attempt + 1))
+            return False
+        self.delivered += 1
+        self._latencies.append(time.monotonic() - enqueued)
+        return True
+
+
+dm_dispatcher = DMDispatcher()
@@ -0,0 +1,114 @@
+# Background pipeline for art streak submissions. 'submitart' acknowledges the interaction right away with a deferred
+# response and hands the actual work (database write, attachment relay and message link) to this pipeline, so slow
+# downloads or a busy database can't make it miss discord's acknowledgement window.
+#
+# Every guild is pinned to one worker, so submissions from the same guild are processed strictly in the order they came
+# in while different guilds are processed in parallel. Each worker's queue is bounded; once it's full, new submissions
+# wait for room instead of piling up in memory.
+import asyncio
+import collections
+import logging
+import time
+
+log = logging.getLogger("pokebot.pipeline")
+
+
+"""
+# Pool of workers that runs jobs in the background with per-guild ordering.
+# @Params:
+# workers; Expected Type: int - number of jobs that may run at once, every guild is pinned to one of them
+# max_queued; Expected Type: int - number of jobs that may wait on a single worker before submitting blocks
+"""
+class SubmissionPipeline:
+    def __init__(self, workers: int = 4, max_queued: int = 50):
+        self.numWorkers = workers
+        self.maxQueued = max_queued
+        self._queues = []
+        self._workers = []
+        self._inFlight = 0
+        self._timings = collections.deque(maxlen=1000)
+        self._waits = collections.deque(maxlen=1000)
+        self.processed = 0
+        self.failed = 0
+
+    """
+    # Starts the workers. Called lazily on the first submission so the queues are bound to the running event loop.
+    """
+    def start(self):
+        self._queues = [asyncio.Queue(maxsize=self.maxQueued) for _ in range(self.numWorkers)]
+        self._workers = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    """
+    # Cancels the workers. Anything still queued is discarded.
+    """
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    """
+    # Queues a job behind every earlier job of the same guild. Waits if that guild's worker already has a full queue.
+    # @Params:
+    # guild_id; Expected Type: int - guild the job belongs to, None for jobs outside of a guild
+    # job; Expected Type: coroutine function - the work to run
+    # args; Expected Type: any - arguments the job is called with
+    """
+    async def submit(self, guild_id: int, job, *args):
+        if not self._workers:
+            self.start()
+        await self._queues[(guild_id or 0) % self.numWorkers].put((job, args, time.monotonic()))
+
+    """
+    # Waits until every job submitted so far has been processed.
+    """
+    async def join(self):
+        for queue in self._queues:
+            await queue.join()
+
+    """
+    # Returns the number of jobs that are either waiting or being processed.
+    """
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues) + self._inFlight
+
+    """
+    # Returns the median and 99th percentile processing time in seconds over recent jobs.
+    """
+    def percentiles(self) -> tuple:
+        return _percentiles(self._timings)
+
+    def summary(self) -> str:
+        p50, p99 = self.percentiles()
+        waitP50, waitP99 = _percentiles(self._waits)
+        timing = "n/a" if p50 is None else f"p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms " \
+                                           f"(queued p50 {waitP50 * 1000:.0f} ms, p99 {waitP99 * 1000:.0f} ms)"
+        return f"Submissions processed: {self.processed}, failed: {self.failed}, queue depth: {self.depth()}, " \
+               f"processing time: {timing}"
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job, args, enqueued = await queue.get()
+            started = time.monotonic()
+            self._inFlight += 1
+            try:
+                await job(*args)
+                self.processed += 1
+            except Exception:
+                log.exception("Pipeline job failed")
+                self.failed += 1
+            finally:
+                self._inFlight -= 1
+                self._timings.append(time.monotonic() - started)
+                self._waits.append(started - enqueued)
+                queue.task_done()
+
+
+def _percentiles(samples) -> tuple:
+    if not samples:
+        return None, None
+    ordered = sorted(samples)
+    return ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+
+submission_pipeline = SubmissionPipeline()
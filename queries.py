@@ -0,0 +1,109 @@
+# Statement builders for the queries issued by the bot's commands. Keeping them in one place lets the query plan checks
+# in 'benchmarks/query_plans.py' run EXPLAIN QUERY PLAN on exactly the statements the commands execute.
+from sqlalchemy import select, func, Select, union_all, false, null, case
+
+from models import ArtStreak, ArtStreakSubmission, ArchivedStreak, ArchivedSubmission, User, \
+    subscriber_association_table, DEFAULT_TIMEZONE
+
+
+"""
+# Selects the active art streak of a user on a guild, if there is one.
+# @Params:
+# guild_id; Expected Type: int - id of the guild the streak belongs to
+# user_id; Expected Type: int - id of the user the streak belongs to
+"""
+def active_streak(guild_id: int, user_id: int) -> Select:
+    return select(ArtStreak)\
+        .filter(ArtStreak.guild_id == guild_id, ArtStreak.user_id == user_id, ArtStreak.active)
+
+
+"""
+# Selects every stat shown by 'streakstats' for a user on a guild in a single aggregate row: the number of streaks, the
+# total number of submissions, the length of the longest ended streak in days, the date the running streak started if
+# there is one, the date the most recent streak ended and the timezone the user's days follow, which is the running
+# streak's or else the user's own. Streaks moved to the archive by 'archive.py' are counted the same as the ones still
+# in 'art_streaks'. The running streak's length depends on the current date in its timezone, so it's left to the caller
+# and none of the stats change until a streak does.
+# @Params:
+# guild_id; Expected Type: int - id of the guild the streaks belong to
+# user_id; Expected Type: int - id of the user the streaks belong to
+"""
+def user_streak_stats(guild_id: int, user_id: int) -> Select:
+    hot = select(ArtStreak.get_duration().label("duration"), ArtStreak.submission_count, ArtStreak.active,
+                 ArtStreak.creation_date, ArtStreak.end_date, ArtStreak.timezone)\
+        .filter(ArtStreak.guild_id == guild_id, ArtStreak.user_id == user_id)
+    # archived streaks have all ended and carry their length with them
+    archived = select(ArchivedStreak.duration, ArchivedStreak.submission_count, false().label("active"),
+                      ArchivedStreak.creation_date, ArchivedStreak.end_date, null().label("timezone"))\
+        .filter(ArchivedStreak.guild_id == guild_id, ArchivedStreak.user_id == user_id)
+    streaks = union_all(hot, archived).subquery()
+    userTimezone = select(User.timezone).filter(User.id == user_id).scalar_subquery()
+    return select(func.count().label("num_streaks"),
+                  func.coalesce(func.sum(streaks.c.submission_count), 0).label("total_submissions"),
+                  func.max(streaks.c.duration).label("longest_streak"),
+                  func.max(case((streaks.c.active, streaks.c.creation_date))).label("active_since"),
+                  func.max(streaks.c.end_date).label("last_end_date"),
+                  func.coalesce(func.max(case((streaks.c.active, streaks.c.timezone))), userTimezone,
+                                DEFAULT_TIMEZONE).label("timezone"))
+
+
+"""
+# Selects the subscription row of a user on a guild, if they are subscribed to its vc notifs.
+# @Params:
+# guild_id; Expected Type: int - id of the guild
+# user_id; Expected Type: int - id of the user
+"""
+def subscription(guild_id: int, user_id: int) -> Select:
+    return select(subscriber_association_table.c.user_id)\
+        .filter(subscriber_association_table.c.guild_id == guild_id, subscriber_association_table.c.user_id == user_id)
+
+
+"""
+# Selects the user ids of every vc notif subscriber of a guild.
+# @Params:
+# guild_id; Expected Type: int - id of the guild
+"""
+def guild_subscribers(guild_id: int) -> Select:
+    return select(subscriber_association_table.c.user_id).filter(subscriber_association_table.c.guild_id == guild_id)
+
+
+"""
+# Selects the (guild id, user id) pair of every vc notif subscription on the provided shards.
+# @Params:
+# shards; Expected Type: sharding.ShardSet - shards whose guilds' subscriptions are selected
+"""
+def subscriptions(shards) -> Select:
+    return select(subscriber_association_table.c.guild_id, subscriber_association_table.c.user_id)\
+        .filter(shards.clause(subscriber_association_table.c.guild_id))
+
+
+"""
+# Selects a guild's whole art streak history for 'export_streaks': its streaks and their submissions, each from the hot
+# tables and from the archive. Every statement comes with the kind of record its rows become and whether they come
+# from the archive. Running streaks come without a length, which depends on the current date in their timezone. Rows
+# are left in index order, so sqlite can hand them out as they're read instead of sorting the
+# whole history first.
+# @Params:
+# guild_id; Expected Type: int - id of the guild
+# @Returns:
+# list of (record kind, archived, statement) tuples
+"""
+def guild_export(guild_id: int) -> list[tuple[str, bool, Select]]:
+    return [
+        ("streak", False, select(ArtStreak.id.label("streak_id"), ArtStreak.user_id, ArtStreak.creation_date,
+                                 ArtStreak.end_date, ArtStreak.active, ArtStreak.get_duration().label("duration"),
+                                 ArtStreak.submission_count, ArtStreak.timezone)
+            .filter(ArtStreak.guild_id == guild_id)),
+        ("streak", True, select(ArchivedStreak.id.label("streak_id"), ArchivedStreak.user_id,
+                                ArchivedStreak.creation_date, ArchivedStreak.end_date, false().label("active"),
+                                ArchivedStreak.duration, ArchivedStreak.submission_count)
+            .filter(ArchivedStreak.guild_id == guild_id)),
+        ("submission", False, select(ArtStreakSubmission.art_streak_id.label("streak_id"), ArtStreakSubmission.user_id,
+                                     ArtStreakSubmission.creation_date, ArtStreakSubmission.message_link)
+            .join(ArtStreak, ArtStreak.id == ArtStreakSubmission.art_streak_id)
+            .filter(ArtStreak.guild_id == guild_id)),
+        ("submission", True, select(ArchivedSubmission.art_streak_id.label("streak_id"), ArchivedStreak.user_id,
+                                    ArchivedSubmission.creation_date, ArchivedSubmission.message_link)
+            .join(ArchivedStreak, ArchivedStreak.id == ArchivedSubmission.art_streak_id)
+            .filter(ArchivedStreak.guild_id == guild_id)),
+    ]
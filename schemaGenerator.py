@@ -2,8 +2,19 @@
 
 import models
 from sqlalchemy import create_engine
+from alembic import command
+from alembic.config import Config
 
 engine = create_engine("sqlite:///poke_bot.db", echo=True)
 
 models.Base.metadata.drop_all(engine)
-models.Base.metadata.create_all(engine)
\ No newline at end of file
+models.Base.metadata.create_all(engine)
+
+# the archival job in 'archive.py' relies on incremental auto vacuum, which an existing file only switches to with a
+# VACUUM outside of a transaction
+with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+    conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.exec_driver_sql("VACUUM")
+
+# the fresh schema already matches the latest migration, so mark it as such for alembic
+command.stamp(Config("alembic.ini"), "head")
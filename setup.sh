@@ -1,3 +1 @@
 python3 schemaGenerator.py
-python3 alembic init alembic
-
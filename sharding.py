@@ -0,0 +1,226 @@
+# Sharding support for running the bot as several processes. discord assigns every guild to a shard with
+# '(guild_id >> 22) % shard_count'; every process connects a range of shards through discord.py's 'AutoShardedBot' and
+# only runs the scheduled jobs for the guilds on those shards. The same formula is pushed into the job queries, so a
+# process never even reads the streaks of another process' guilds.
+#
+# Processes coordinate over the shared sqlite database, so they have to run on the same host, with one lease per job and
+# shard in the 'job_leases' table. A process only runs a job for a shard while it holds that shard's lease, and a lease
+# is taken over with a single conditional UPDATE, so two processes that both think they own a shard, e.g. the old and
+# the new one during a rolling restart, can never run the same job for it at the same time. Leases outlive a crashed
+# holder by at most LEASE_TTL seconds, after which the next process on the shard takes them over; the per shard check
+# dates of the streak buckets make sure it catches up on whatever the crashed process didn't get to.
+#
+# Configuration (all optional, read from the environment or the .env file):
+#
+#  - SHARD_COUNT: total number of shards across every process. Leave it unset to run a single unsharded 'commands.Bot',
+#    set it to 'auto' to run every shard discord recommends in this process.
+#  - SHARD_IDS: shards this process connects, as a comma separated list of ids and ranges, e.g. '0-3' or '0,2,4'.
+#    Defaults to every shard.
+#  - LEASE_HOLDER: name this process holds its leases under. Defaults to '<hostname>:<pid>'.
+#  - LEASE_TTL: seconds a lease stays valid after it was taken. Must be shorter than the jobs' tick. Defaults to 300.
+#
+# Every process on the host needs a metrics port and a log file of its own, since two processes can't listen on the same
+# port and rotating one log file from several processes loses records. When SHARD_COUNT is set and METRICS_PORT and
+# LOG_FILE aren't, the defaults are derived per process:
+#
+#  - the metrics port is 9108 plus the first id in SHARD_IDS, so processes with different shards never collide. The old
+#    and the new process of a rolling restart share their shards and with them the port; the new one logs a warning and
+#    runs without the endpoint until the old one is gone (see 'metrics.py').
+#  - the log file is 'poke_bot-<LEASE_HOLDER>.log', with every character other than letters, digits, '.', '_' and '-'
+#    replaced by '-'. The default holder contains the pid, so even the processes of a rolling restart log separately.
+import datetime
+import os
+import re
+import socket
+
+from dotenv import load_dotenv
+from sqlalchemy import update, Integer, ColumnElement, true
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import JobLease
+
+load_dotenv()
+
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = os.getenv("SHARD_IDS")
+LEASE_HOLDER = os.getenv("LEASE_HOLDER", f"{socket.gethostname()}:{os.getpid()}")
+LEASE_TTL = float(os.getenv("LEASE_TTL", "300"))
+
+
+"""
+# Returns the default port of this process' metrics endpoint: the base port, offset by the first shard the process
+# connects when it runs sharded.
+# @Params:
+# base; Expected Type: int - port an unsharded bot uses
+"""
+def default_metrics_port(base: int) -> int:
+    if SHARD_COUNT is None or not SHARD_IDS:
+        return base
+    return base + parse_shard_ids(SHARD_IDS)[0]
+
+
+"""
+# Returns the default file name of this process' log file: the base name when the bot runs unsharded, else the base
+# name with the process' lease holder appended to it, e.g. 'poke_bot-myhost-1234.log'.
+# @Params:
+# base; Expected Type: str - file name an unsharded bot uses
+"""
+def default_log_file(base: str) -> str:
+    if SHARD_COUNT is None:
+        return base
+    root, extension = os.path.splitext(base)
+    return f"{root}-{re.sub(r'[^A-Za-z0-9._-]', '-', LEASE_HOLDER)}{extension}"
+
+
+"""
+# Returns the shard discord assigns a guild to.
+# @Params:
+# guild_id; Expected Type: int - id of the guild
+# shard_count; Expected Type: int - total number of shards
+"""
+def shard_id(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+
+"""
+# Parses a comma separated list of shard ids and ranges like '0-3,6'.
+# @Params:
+# spec; Expected Type: str - the list to parse
+"""
+def parse_shard_ids(spec: str) -> list[int]:
+    ids = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-", 1)
+            ids.update(range(int(first), int(last) + 1))
+        elif part:
+            ids.add(int(part))
+    return sorted(ids)
+
+
+"""
+# The shards of one process, or a subset of them. An unsharded bot is a single shard 0 out of 1.
+# @Params:
+# count; Expected Type: int - total number of shards across every process
+# ids; Expected Type: [int] - the shards in the set, None for all of them
+"""
+class ShardSet:
+    def __init__(self, count: int = 1, ids: list[int] = None):
+        self.count = count
+        self.ids = sorted(ids) if ids is not None else list(range(count))
+
+    """
+    # Builds the set from a connected bot's shard configuration.
+    # @Params:
+    # bot; Expected Type: commands.Bot - a plain or auto sharded bot
+    """
+    @classmethod
+    def from_bot(cls, bot) -> "ShardSet":
+        count = bot.shard_count or 1
+        ids = getattr(bot, "shard_ids", None)
+        return cls(count, ids)
+
+    """
+    # Splits the set into one single shard set per shard.
+    """
+    def split(self) -> list["ShardSet"]:
+        return [ShardSet(self.count, [shardId]) for shardId in self.ids]
+
+    def owns(self, guild_id: int) -> bool:
+        return shard_id(guild_id, self.count) in self.ids
+
+    """
+    # Returns a SQL condition that limits a guild id column to the guilds on these shards. It's a plain 'true' when the
+    # set covers every shard, so an unsharded bot's queries are left untouched.
+    # @Params:
+    # column; Expected Type: sqlalchemy.Column - a column holding guild ids
+    """
+    def clause(self, column) -> ColumnElement[bool]:
+        if len(self.ids) == self.count:
+            return true()
+        shard = column.op(">>", return_type=Integer)(22) % self.count
+        if len(self.ids) == 1:
+            return shard == self.ids[0]
+        return shard.in_(self.ids)
+
+    def __repr__(self) -> str:
+        return f"ShardSet(count={self.count!r}, ids={self.ids!r})"
+
+
+"""
+# Takes or renews the lease on a job for a shard. Succeeds if the shard has no lease yet, the lease expired or this
+# holder already has it. The caller is responsible for committing the session, which should happen right away so other
+# processes see the lease.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the lease is taken on
+# job; Expected Type: str - name of the job
+# shard; Expected Type: int - the shard the job is run for
+# now; Expected Type: datetime.datetime - current time in UTC, without timezone info
+# holder; Expected Type: str - name of the process taking the lease
+# ttl; Expected Type: float - seconds the lease stays valid
+# @Returns:
+# the lease if it was taken, None if another process holds it
+"""
+def acquire_lease(session: Session, job: str, shard: int, now: datetime.datetime, holder: str = LEASE_HOLDER,
+                  ttl: float = LEASE_TTL) -> JobLease:
+    expires = now + datetime.timedelta(seconds=ttl)
+    # Compare and set in one statement so two processes can't both take over an expired lease.
+    taken = session.execute(
+        update(JobLease)
+        .where(JobLease.job == job, JobLease.shard_id == shard,
+               (JobLease.holder == holder) | (JobLease.expires_at < now))
+        .values(holder=holder, expires_at=expires)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not taken:
+        # Either the shard never had a lease or someone else holds it. The primary key makes sure only one of several
+        # processes creating the first lease at the same time succeeds.
+        try:
+            with session.begin_nested():
+                session.add(JobLease(job=job, shard_id=shard, holder=holder, expires_at=expires))
+        except IntegrityError:
+            return None
+    return session.get(JobLease, (job, shard), populate_existing=True)
+
+
+"""
+# Records that the holder finished a job for a shard. Nothing is recorded if the lease was taken over in the meantime.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the update is issued on
+# job; Expected Type: str - name of the job
+# shard; Expected Type: int - the shard the job was run for
+# now; Expected Type: datetime.datetime - current time in UTC, without timezone info
+# holder; Expected Type: str - name of the process that ran the job
+"""
+def finish_lease(session: Session, job: str, shard: int, now: datetime.datetime, holder: str = LEASE_HOLDER):
+    session.execute(update(JobLease).where(JobLease.job == job, JobLease.shard_id == shard, JobLease.holder == holder)
+                    .values(last_run=now).execution_options(synchronize_session=False))
+
+
+"""
+# Gives up every lease of a holder, so the process taking over its shards doesn't have to wait for them to expire.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the update is issued on
+# now; Expected Type: datetime.datetime - current time in UTC, without timezone info
+# holder; Expected Type: str - name of the process giving up its leases
+"""
+def release_leases(session: Session, now: datetime.datetime, holder: str = LEASE_HOLDER):
+    session.execute(update(JobLease).where(JobLease.holder == holder, JobLease.expires_at > now)
+                    .values(expires_at=now).execution_options(synchronize_session=False))
+
+
+"""
+# Returns the shard count and ids configured through SHARD_COUNT and SHARD_IDS as keyword arguments for
+# 'AutoShardedBot', or None if the bot should run unsharded.
+"""
+def bot_options() -> dict:
+    if SHARD_COUNT is None:
+        return None
+    if SHARD_COUNT == "auto":
+        return {}
+    options = {"shard_count": int(SHARD_COUNT)}
+    if SHARD_IDS:
+        options["shard_ids"] = parse_shard_ids(SHARD_IDS)
+    return options
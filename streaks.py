@@ -0,0 +1,355 @@
+# Set based helpers for the art streak jobs. Everything in here works on a plain synchronous session so the same code can
+# be driven by the bot's scheduled tasks or by the benchmark scripts without a discord connection.
+#
+# Every streak follows the timezone of its user. The streaks of one timezone form a bucket that is checked right after
+# midnight in that timezone and reminded at that timezone's reminder hours, so the work is spread over the whole day
+# instead of landing on one fixed hour.
+#
+# When the bot runs sharded, every job takes the shards it runs for and only touches the streaks of guilds on them. The
+# check dates of the buckets are kept per shard, so every process tracks the progress of its own shards.
+import collections
+import datetime
+import zoneinfo
+
+from sqlalchemy import select, update, bindparam, or_, func
+from sqlalchemy.orm import Session
+
+from models import Guild, ArtStreak, ArtStreakSubmission, StreakCheckBucket
+from sharding import ShardSet
+
+# Outcome of a catch-up for one streak, see 'catch_up_streaks'.
+CatchUpOutcome = collections.namedtuple("CatchUpOutcome", ["id", "guild_id", "user_id", "creation_date",
+                                                           "art_channel_id", "freezes_lost", "end_date"])
+
+
+"""
+# Returns the current date in a timezone.
+# @Params:
+# timezone; Expected Type: str - IANA timezone name
+# now; Expected Type: datetime.datetime - timezone aware current time
+"""
+def local_date(timezone: str, now: datetime.datetime) -> datetime.date:
+    return now.astimezone(zoneinfo.ZoneInfo(timezone)).date()
+
+
+"""
+# Returns the timezones that have at least one active streak.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the query is issued on
+# shards; Expected Type: sharding.ShardSet - only consider the streaks of guilds on these shards, None for every guild
+"""
+def active_timezones(session: Session, shards: ShardSet = None) -> list[str]:
+    return list(session.scalars(select(ArtStreak.timezone).where(*_in_bucket(None, shards)).distinct()))
+
+
+"""
+# Finds the timezone buckets of a shard whose local day rolled over since their streaks were last checked. Timezones that
+# don't have a bucket on the shard yet get one marked as checked for the date the timezone's buckets on other shards
+# were last checked for, or for their current date if there are none, since their streaks were either just created or
+# already checked under another timezone today. The caller is responsible for committing the session.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the queries are issued on
+# now; Expected Type: datetime.datetime - timezone aware current time
+# shards; Expected Type: sharding.ShardSet - a single shard whose buckets are checked, None when running unsharded
+# @Returns:
+# list of (timezone, last checked date, local date) tuples, one for every bucket that is due for a check
+"""
+def due_checks(session: Session, now: datetime.datetime,
+               shards: ShardSet = None) -> list[tuple[str, datetime.date, datetime.date]]:
+    shardId = _bucket_shard(shards)
+    timezones = active_timezones(session, shards)
+    buckets = {}
+    otherShards = {}
+    for bucket in session.scalars(select(StreakCheckBucket).where(StreakCheckBucket.timezone.in_(timezones))):
+        if bucket.shard_id == shardId:
+            buckets[bucket.timezone] = bucket
+        else:
+            otherShards[bucket.timezone] = max(bucket.last_check_date,
+                                               otherShards.get(bucket.timezone, bucket.last_check_date))
+    due = []
+    for timezone in timezones:
+        today = local_date(timezone, now)
+        bucket = buckets.get(timezone)
+        if bucket is None:
+            # a shard that was just added continues where the rest of the timezone is
+            lastChecked = min(otherShards.get(timezone, today), today)
+            session.add(StreakCheckBucket(timezone=timezone, shard_id=shardId, last_check_date=lastChecked))
+            if lastChecked < today:
+                due.append((timezone, lastChecked, today))
+        elif bucket.last_check_date < today:
+            due.append((timezone, bucket.last_check_date, today))
+    return due
+
+
+"""
+# Picks the timezones whose local time reached one of the reminder hours since the reminders were last sent.
+# @Params:
+# timezones; Expected Type: [str] - timezones with active streaks
+# since; Expected Type: datetime.datetime - timezone aware time reminders were last sent at
+# now; Expected Type: datetime.datetime - timezone aware current time
+# hours; Expected Type: (int) - local hours reminders are sent at
+# @Returns:
+# list of (timezone, local date) tuples, one for every timezone that is due for a reminder
+"""
+def due_reminders(timezones: list[str], since: datetime.datetime, now: datetime.datetime,
+                  hours: tuple) -> list[tuple[str, datetime.date]]:
+    # Every timezone's full hours fall on a quarter hour in UTC, so only those have to be looked at.
+    quarter = datetime.timedelta(minutes=15)
+    boundary = since.replace(minute=since.minute - since.minute % 15, second=0, microsecond=0) + quarter
+    boundaries = []
+    while boundary <= now:
+        boundaries.append(boundary)
+        boundary += quarter
+    due = {}
+    for timezone in timezones:
+        zone = zoneinfo.ZoneInfo(timezone)
+        for boundary in boundaries:
+            local = boundary.astimezone(zone)
+            if local.minute == 0 and local.hour in hours:
+                due[timezone] = local.date()
+    return list(due.items())
+
+
+"""
+# Records that a timezone's streaks on a shard have been checked for a date. Meant to be issued in the same transaction
+# as the check, before its outcome is applied. When the date the bucket was last checked for is provided, the bucket is
+# only moved on if it's still at that date, so of two checks that both found the bucket due only the first one to get
+# here goes through; the other one has to roll its transaction back.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the update is issued on
+# timezone; Expected Type: str - the bucket's timezone
+# today; Expected Type: datetime.date - local date the check was run for
+# shards; Expected Type: sharding.ShardSet - the single shard that was checked, None when running unsharded
+# last_checked; Expected Type: datetime.date - the date the check found the bucket at, None to move it on regardless
+# @Returns:
+# whether the bucket was moved on, False if another check got to it first
+"""
+def mark_checked(session: Session, timezone: str, today: datetime.date, shards: ShardSet = None,
+                 last_checked: datetime.date = None) -> bool:
+    shardId = _bucket_shard(shards)
+    if last_checked is not None:
+        # compare and set in one statement, like the job leases in 'sharding.py'
+        return session.execute(
+            update(StreakCheckBucket)
+            .where(StreakCheckBucket.timezone == timezone, StreakCheckBucket.shard_id == shardId,
+                   StreakCheckBucket.last_check_date == last_checked)
+            .values(last_check_date=today)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+    bucket = session.get(StreakCheckBucket, (timezone, shardId))
+    if bucket is None:
+        session.add(StreakCheckBucket(timezone=timezone, shard_id=shardId, last_check_date=today))
+    else:
+        bucket.last_check_date = today
+    return True
+
+
+"""
+# Evaluates the active art streaks of a timezone for its nightly streak check in a single query and applies the outcome
+# with bulk updates. On sundays the freezes of the active streaks are renewed first. Afterwards every active streak whose
+# last submission is older than yesterday either loses a freeze or, if it has none left, gets terminated. Only the streak
+# rows themselves are read, the denormalized 'last_submission_date' counter means the submissions table isn't touched.
+# The caller is responsible for committing the session and for announcing the outcome.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the updates are issued on
+# today; Expected Type: datetime.date - the date the check is being run for
+# timezone; Expected Type: str - only evaluate the streaks of this timezone, None for every streak
+# shards; Expected Type: sharding.ShardSet - only evaluate the streaks of guilds on these shards, None for every guild
+# @Returns:
+# tuple of two lists of rows (id, guild_id, user_id, freezes, creation_date, art_channel_id); the first holds the
+# streaks that lost a freeze, the second the streaks that were terminated
+"""
+def evaluate_streaks(session: Session, today: datetime.date, timezone: str = None,
+                     shards: ShardSet = None) -> tuple[list, list]:
+    yesterday = today - datetime.timedelta(1)
+    inBucket = _in_bucket(timezone, shards)
+    # Renew freezes on sunday before anything is evaluated. Streaks that are already full are left alone to keep the
+    # number of rows written down.
+    if today.weekday() == 6:
+        session.execute(
+            update(ArtStreak)
+            .where(*inBucket, ArtStreak.freezes < 2)
+            .values(freezes=2)
+            .execution_options(synchronize_session=False)
+        )
+    # Pull every active streak that wasn't submitted to yesterday or today along with the art channel its
+    # announcements go to.
+    missed = session.execute(
+        select(ArtStreak.id, ArtStreak.guild_id, ArtStreak.user_id, ArtStreak.freezes, ArtStreak.creation_date,
+               Guild.art_channel_id)
+        .join(Guild, ArtStreak.guild_id == Guild.id)
+        .where(*inBucket,
+               or_(ArtStreak.last_submission_date.is_(None), ArtStreak.last_submission_date < yesterday))
+    ).all()
+    frozen = [streak for streak in missed if streak.freezes > 0]
+    terminated = [streak for streak in missed if streak.freezes == 0]
+    # Apply both outcomes as bulk executemany updates keyed on the primary key.
+    if frozen:
+        session.execute(
+            update(ArtStreak.__table__)
+            .where(ArtStreak.__table__.c.id == bindparam("streak_id"))
+            .values(freezes=ArtStreak.__table__.c.freezes - 1),
+            [{"streak_id": streak.id} for streak in frozen]
+        )
+    if terminated:
+        session.execute(
+            update(ArtStreak.__table__)
+            .where(ArtStreak.__table__.c.id == bindparam("streak_id"))
+            .values(active=False, end_date=today),
+            [{"streak_id": streak.id} for streak in terminated]
+        )
+    return frozen, terminated
+
+
+"""
+# Catches a timezone's active art streaks up on every nightly check that was missed, e.g. while the bot was offline. The
+# streaks and their submissions inside the missed window are read with one query each and every missed day is replayed
+# in memory with the same rules as 'evaluate_streaks': freezes are renewed on sundays, a day without a submission on it
+# or the day before costs a freeze, and a streak without freezes left is terminated on that day. The outcome is applied
+# with bulk updates; the caller is responsible for committing the session and for announcing the outcome.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the queries and updates are issued on
+# last_checked; Expected Type: datetime.date - the last date the streaks were checked for
+# today; Expected Type: datetime.date - the date the catch-up runs up to, inclusive
+# timezone; Expected Type: str - only catch up the streaks of this timezone, None for every streak
+# shards; Expected Type: sharding.ShardSet - only catch up the streaks of guilds on these shards, None for every guild
+# @Returns:
+# list of rows (id, guild_id, user_id, creation_date, art_channel_id, freezes_lost, end_date), one for every streak
+# that lost a freeze or was terminated; 'end_date' is None for the streaks that are still running
+"""
+def catch_up_streaks(session: Session, last_checked: datetime.date, today: datetime.date,
+                     timezone: str = None, shards: ShardSet = None) -> list:
+    days = [last_checked + datetime.timedelta(i) for i in range(1, (today - last_checked).days + 1)]
+    if not days:
+        return []
+    inBucket = _in_bucket(timezone, shards)
+    active = session.execute(
+        select(ArtStreak.id, ArtStreak.guild_id, ArtStreak.user_id, ArtStreak.freezes, ArtStreak.creation_date,
+               Guild.art_channel_id)
+        .join(Guild, ArtStreak.guild_id == Guild.id)
+        .where(*inBucket)
+    ).all()
+    # The day before the first missed day counts as well, a submission on it fulfills the first check.
+    # Unpacked into plain tuples, hashing result rows is several times slower.
+    submitted = {(streakId, creationDate) for streakId, creationDate in session.execute(
+        select(ArtStreakSubmission.art_streak_id, ArtStreakSubmission.creation_date)
+        .join(ArtStreak, ArtStreakSubmission.art_streak_id == ArtStreak.id)
+        .where(*inBucket, ArtStreakSubmission.creation_date >= days[0] - datetime.timedelta(1))
+        .distinct()
+    )}
+    outcomes = []
+    updates = []
+    for streak in active:
+        freezes = streak.freezes
+        lost = 0
+        endDate = None
+        for day in days:
+            # a streak is first checked the night after it was started
+            if day <= streak.creation_date:
+                continue
+            if day.weekday() == 6:
+                freezes = 2
+            if (streak.id, day) in submitted or (streak.id, day - datetime.timedelta(1)) in submitted:
+                continue
+            if freezes == 0:
+                endDate = day
+                break
+            freezes -= 1
+            lost += 1
+        if freezes != streak.freezes or endDate is not None:
+            updates.append({"streak_id": streak.id, "freezes": freezes, "active": endDate is None, "end_date": endDate})
+        if lost or endDate is not None:
+            outcomes.append(CatchUpOutcome(streak.id, streak.guild_id, streak.user_id, streak.creation_date,
+                                           streak.art_channel_id, lost, endDate))
+    # Apply every streak's final state as one bulk executemany update keyed on the primary key.
+    if updates:
+        session.execute(
+            update(ArtStreak.__table__)
+            .where(ArtStreak.__table__.c.id == bindparam("streak_id"))
+            .values(freezes=bindparam("freezes"), active=bindparam("active"), end_date=bindparam("end_date")),
+            updates
+        )
+    return outcomes
+
+
+"""
+# Pulls every active art streak that hasn't had a submission today in one query, grouped under the art channel of the
+# guild the streak belongs to so reminders can be sent as one message per channel.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the query is issued on
+# today; Expected Type: datetime.date - the date reminders are being sent for
+# timezone; Expected Type: str - only consider the streaks of this timezone, None for every streak
+# shards; Expected Type: sharding.ShardSet - only consider the streaks of guilds on these shards, None for every guild
+# @Returns:
+# dict mapping art channel ids to the list of user ids that still need to submit
+"""
+def find_unfulfilled(session: Session, today: datetime.date, timezone: str = None,
+                     shards: ShardSet = None) -> dict[int, list[int]]:
+    inBucket = _in_bucket(timezone, shards)
+    result = session.execute(
+        select(Guild.art_channel_id, ArtStreak.user_id)
+        .join(Guild, ArtStreak.guild_id == Guild.id)
+        .where(*inBucket, Guild.art_channel_id.is_not(None),
+               or_(ArtStreak.last_submission_date.is_(None), ArtStreak.last_submission_date < today))
+        .order_by(Guild.art_channel_id)
+    ).all()
+    channels = {}
+    for artChannelId, userId in result:
+        channels.setdefault(artChannelId, []).append(userId)
+    return channels
+
+
+"""
+# Recomputes the denormalized 'submission_count' and 'last_submission_date' counters of every art streak from the
+# submissions table and reports the streaks where the stored values have drifted. Optionally overwrites the drifted
+# counters with the recomputed values; the caller is responsible for committing the session.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - session the check is run on
+# fix; Expected Type: bool - whether drifted counters should be corrected
+# @Returns:
+# list of rows (id, submission_count, actual_count, last_submission_date, actual_last_submission_date) for every
+# streak whose counters don't match the submissions table
+"""
+def find_counter_drift(session: Session, fix: bool = False) -> list:
+    actual = select(ArtStreakSubmission.art_streak_id,
+                    func.count(ArtStreakSubmission.id).label("actual_count"),
+                    func.max(ArtStreakSubmission.creation_date).label("actual_last_submission_date"))\
+        .group_by(ArtStreakSubmission.art_streak_id)\
+        .subquery()
+    actualCount = func.coalesce(actual.c.actual_count, 0)
+    drifted = session.execute(
+        select(ArtStreak.id, ArtStreak.submission_count, actualCount.label("actual_count"),
+               ArtStreak.last_submission_date, actual.c.actual_last_submission_date)
+        .outerjoin(actual, actual.c.art_streak_id == ArtStreak.id)
+        .where(or_(ArtStreak.submission_count != actualCount,
+                   ArtStreak.last_submission_date.is_distinct_from(actual.c.actual_last_submission_date)))
+    ).all()
+    if fix and drifted:
+        session.execute(update(ArtStreak), [{"id": row.id,
+                                             "submission_count": row.actual_count,
+                                             "last_submission_date": row.actual_last_submission_date}
+                                            for row in drifted])
+    return drifted
+
+
+"""
+# Returns the conditions that select the active streaks of a timezone on a set of shards.
+# @Params:
+# timezone; Expected Type: str - the bucket's timezone, None for every timezone
+# shards; Expected Type: sharding.ShardSet - the shards, None for every guild
+"""
+def _in_bucket(timezone: str, shards: ShardSet) -> list:
+    conditions = [ArtStreak.active]
+    if timezone is not None:
+        conditions.append(ArtStreak.timezone == timezone)
+    if shards is not None:
+        conditions.append(shards.clause(ArtStreak.guild_id))
+    return conditions
+
+
+def _bucket_shard(shards: ShardSet) -> int:
+    if shards is None:
+        return 0
+    if len(shards.ids) != 1:
+        raise ValueError(f"Streak check buckets are kept per shard, got {shards!r}")
+    return shards.ids[0]
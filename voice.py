@@ -0,0 +1,79 @@
+# Incremental voice chat occupancy tracking for the vc notifications. Every guild's population across its voice channels
+# (excepting the afk channel, stage channels don't count either) is seeded once from the gateway cache and then maintained from the before/after deltas of
+# voice state updates, so handling an update doesn't depend on how many channels or members a guild has.
+import os
+import time
+
+import discord
+
+# Minimum number of seconds between two notification waves for the same guild. Keeps join/leave/rejoin bounces from
+# sending a fresh round of DMs every time the population flaps between zero and one.
+VC_NOTIF_COOLDOWN = float(os.getenv("VC_NOTIF_COOLDOWN", "300"))
+
+
+"""
+# Tracks how many members are connected to each guild's voice channels and decides when a notification wave is due.
+# @Params:
+# cooldown; Expected Type: float - minimum number of seconds between two notification waves for the same guild
+"""
+class VoiceOccupancy:
+    def __init__(self, cooldown: float = VC_NOTIF_COOLDOWN):
+        self.cooldown = cooldown
+        self._counts = {}
+        self._lastWave = {}
+        self.suppressed = 0
+
+    """
+    # Seeds the population counters from the current state of the provided guilds.
+    # @Params:
+    # guilds; Expected Type: [discord.Guild] - guilds to (re)count
+    """
+    def seed(self, guilds):
+        for guild in guilds:
+            self._counts[guild.id] = sum(len(channel.members) for channel in guild.voice_channels
+                                         if self._counted(guild, channel))
+
+    def forget(self, guild_id: int):
+        self._counts.pop(guild_id, None)
+        self._lastWave.pop(guild_id, None)
+
+    def count(self, guild_id: int) -> int:
+        return self._counts.get(guild_id, 0)
+
+    """
+    # Applies a single voice state update to the guild's counter.
+    # @Params:
+    # guild; Expected Type: discord.Guild - guild the update happened in
+    # before; Expected Type: discord.abc.Connectable or None - channel the member was connected to before the update
+    # after; Expected Type: discord.abc.Connectable or None - channel the member is connected to after the update
+    # now; Expected Type: float - current monotonic time, defaults to time.monotonic()
+    # @Returns:
+    # True if the update took the guild's voice chat from empty to occupied and no notification wave was sent for the
+    # guild within the cooldown window
+    """
+    def update(self, guild, before, after, now: float = None) -> bool:
+        delta = int(self._counted(guild, after)) - int(self._counted(guild, before))
+        if delta == 0:
+            return False
+        previous = self._counts.get(guild.id, 0)
+        # Never drop below zero, in case an update was missed while disconnected.
+        current = max(0, previous + delta)
+        self._counts[guild.id] = current
+        if previous != 0 or current == 0:
+            return False
+        now = time.monotonic() if now is None else now
+        lastWave = self._lastWave.get(guild.id)
+        if lastWave is not None and now - lastWave < self.cooldown:
+            self.suppressed += 1
+            return False
+        self._lastWave[guild.id] = now
+        return True
+
+    # Whether members connected to a channel count towards the guild's population. Used by both 'seed' and 'update' so
+    # the incremental count always matches a fresh one.
+    @staticmethod
+    def _counted(guild, channel) -> bool:
+        return channel is not None and channel.type == discord.ChannelType.voice and channel != guild.afk_channel
+
+
+occupancy = VoiceOccupancy()
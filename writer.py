@@ -0,0 +1,169 @@
+# Group commit writer. Commands don't open a session and commit their writes themselves anymore; they hand a write to
+# the single writer coroutine in here and wait for it. While one transaction is being committed, new writes pile up in
+# the queue, and the writer applies everything that piled up in the next transaction. Under a burst of commands the
+# database sees a handful of large commits instead of one commit (and one lock hand over) per command, and the writes
+# never compete with each other for sqlite's single write lock.
+#
+# Every write runs inside a SAVEPOINT of the shared transaction, so a write that fails is rolled back on its own and
+# only its caller sees the exception. The writes of one group become visible together once the group is committed,
+# which is also when their callers are woken up.
+#
+# Configuration (all optional, read from the environment or the .env file):
+#
+#  - WRITE_MAX_BATCH: most writes applied in one transaction. Defaults to 200.
+#  - WRITE_BATCH_WINDOW: milliseconds the writer waits for more writes before it starts a transaction. Defaults to 0;
+#    the time a commit takes is usually enough for the next group to gather.
+import asyncio
+import collections
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session as SyncSession
+
+from db import Session
+
+load_dotenv()
+log = logging.getLogger("pokebot.writer")
+
+WRITE_MAX_BATCH = int(os.getenv("WRITE_MAX_BATCH", "200"))
+WRITE_BATCH_WINDOW = float(os.getenv("WRITE_BATCH_WINDOW", "0")) / 1000
+
+
+"""
+# Single writer that applies queued writes in group commits.
+# @Params:
+# session_factory; Expected Type: sqlalchemy.ext.asyncio.async_sessionmaker - factory of the sessions groups run on
+# max_batch; Expected Type: int - most writes applied in one transaction
+# window; Expected Type: float - seconds to wait for more writes before starting a transaction
+"""
+class GroupCommitWriter:
+    def __init__(self, session_factory, max_batch: int = WRITE_MAX_BATCH, window: float = WRITE_BATCH_WINDOW):
+        self.sessionFactory = session_factory
+        self.maxBatch = max_batch
+        self.window = window
+        self._queue = None
+        self._task = None
+        self._groupSizes = collections.deque(maxlen=1000)
+        self.writes = 0
+        self.failed = 0
+        self.commits = 0
+
+    """
+    # Starts the writer coroutine. Called lazily on the first write so the queue is bound to the running event loop.
+    """
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    """
+    # Applies whatever is still queued and stops the writer.
+    """
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    """
+    # Queues a write and waits until the group it ended up in has been committed.
+    # @Params:
+    # write; Expected Type: function - synchronous function taking a sqlalchemy.orm.Session and the arguments. It must
+    #                                  not commit, and should return plain values rather than ORM objects since the
+    #                                  session it runs on isn't the caller's.
+    # args; Expected Type: any - arguments the write is called with
+    # @Returns:
+    # whatever the write returned. Exceptions raised by the write or by the commit are raised here.
+    """
+    async def submit(self, write, *args):
+        if self._task is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((write, args, future))
+        return await future
+
+    """
+    # Returns the number of writes waiting for the writer.
+    """
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    """
+    # Returns the average number of writes per commit over recent groups.
+    """
+    def average_group(self) -> float:
+        return sum(self._groupSizes) / len(self._groupSizes) if self._groupSizes else 0.0
+
+    def summary(self) -> str:
+        return f"Group commits: {self.commits} for {self.writes} writes ({self.failed} failed), " \
+               f"{self.average_group():.1f} writes per commit recently, {self.depth()} waiting"
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            if self.window:
+                await asyncio.sleep(self.window)
+            group = [item]
+            while len(group) < self.maxBatch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                group.append(item)
+            await self._commit(group)
+
+    async def _commit(self, group: list):
+        start = time.perf_counter()
+        try:
+            async with self.sessionFactory() as session:
+                outcomes = await session.run_sync(_apply, group)
+                await session.commit()
+        except Exception as e:
+            log.exception("Group commit of %d write(s) failed", len(group))
+            outcomes = [(False, e)] * len(group)
+        self.commits += 1
+        self._groupSizes.append(len(group))
+        for (write, args, future), (succeeded, result) in zip(group, outcomes):
+            self.writes += 1
+            if future.done():
+                # the caller gave up waiting
+                continue
+            if succeeded:
+                future.set_result(result)
+            else:
+                self.failed += 1
+                future.set_exception(result)
+        log.debug("Committed %d write(s) in %.1f ms", len(group), (time.perf_counter() - start) * 1000)
+
+
+"""
+# Applies a group of writes on the writer's session, each in its own SAVEPOINT.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# group; Expected Type: [(function, tuple, asyncio.Future)] - the queued writes
+# @Returns:
+# list of (succeeded, result or exception) tuples in the order of the group
+"""
+def _apply(session: SyncSession, group: list) -> list:
+    connection = session.connection()
+    if connection.dialect.name == "sqlite":
+        # pysqlite only opens a transaction right before the first write, and releasing a SAVEPOINT that was opened
+        # outside of a transaction commits it. Open it explicitly, taking the write lock right away so the group can't
+        # run into another connection's write half way through.
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    outcomes = []
+    for write, args, future in group:
+        try:
+            with session.begin_nested():
+                outcomes.append((True, write(session, *args)))
+        except Exception as e:
+            outcomes.append((False, e))
+    return outcomes
+
+
+group_writer = GroupCommitWriter(Session)
@@ -0,0 +1,191 @@
+# Write operations of the bot's commands. Each one is a synchronous function taking the session of the group commit
+# writer in 'writer.py' as its first argument and is queued with 'group_writer.submit(write, *args)'. None of them
+# commit; the writer commits them together with whatever else was queued at the same time.
+#
+# The upserts use sqlite's INSERT ... ON CONFLICT DO NOTHING, like the rest of the bot the writes only support sqlite (see
+# 'db.py').
+import datetime
+
+from sqlalchemy import update, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import User, Guild, ArtStreak, ArtStreakSubmission, ArchivedStreak, ArchivedSubmission, \
+    subscriber_association_table
+import queries
+import streaks
+
+# sqlite caps the number of parameters a statement can bind, so long lists of guild ids are deleted in chunks of this
+# size
+ID_CHUNK = 500
+
+
+"""
+# Adds a user's entry if the bot hasn't seen them before, as a single INSERT that does nothing if the entry exists.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# user_id; Expected Type: int - id of the user
+# @Returns:
+# whether the user already had an entry
+"""
+def ensure_user(session: Session, user_id: int) -> bool:
+    return session.execute(sqlite_insert(User).values(id=user_id).on_conflict_do_nothing()).rowcount == 0
+
+
+"""
+# Subscribes a user to a guild's vc notifs or unsubscribes them, creating the user's entry if needed. The subscription
+# row is inserted or deleted directly, without loading either side's subscription list.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# user_id; Expected Type: int - id of the user
+# guild_id; Expected Type: int - id of the guild
+# subscribed; Expected Type: bool - True to subscribe, False to unsubscribe
+# registered; Expected Type: bool - whether the user is known to have an entry already, which skips the upsert
+# @Returns:
+# whether anything changed, False if the user already was (or wasn't) subscribed
+"""
+def set_subscription(session: Session, user_id: int, guild_id: int, subscribed: bool, registered: bool = False) -> bool:
+    if not registered:
+        ensure_user(session, user_id)
+    if subscribed:
+        statement = sqlite_insert(subscriber_association_table).values(user_id=user_id, guild_id=guild_id)\
+            .on_conflict_do_nothing()
+    else:
+        statement = delete(subscriber_association_table)\
+            .where(subscriber_association_table.c.user_id == user_id,
+                   subscriber_association_table.c.guild_id == guild_id)
+    return session.execute(statement).rowcount == 1
+
+
+"""
+# Sets the timezone of a user and moves their running streaks over to it, creating the user's entry if needed.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# user_id; Expected Type: int - id of the user
+# timezone; Expected Type: str - IANA timezone name
+# registered; Expected Type: bool - whether the user is known to have an entry already, which skips the upsert
+"""
+def set_timezone(session: Session, user_id: int, timezone: str, registered: bool = False):
+    if not registered:
+        ensure_user(session, user_id)
+    session.execute(update(User).where(User.id == user_id).values(timezone=timezone))
+    session.execute(update(ArtStreak)
+                    .where(ArtStreak.user_id == user_id, ArtStreak.active)
+                    .values(timezone=timezone))
+
+
+"""
+# Designates a channel as a guild's art channel.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# guild_id; Expected Type: int - id of the guild
+# art_channel_id; Expected Type: int - id of the channel
+# @Returns:
+# whether the guild is registered, False if there was no entry to update
+"""
+def set_art_channel(session: Session, guild_id: int, art_channel_id: int) -> bool:
+    return session.execute(update(Guild).where(Guild.id == guild_id).values(art_channel_id=art_channel_id)
+                           .execution_options(synchronize_session=False)).rowcount == 1
+
+
+"""
+# Records an art submission on the user's active streak in a guild, starting a new streak if they don't have one, and
+# keeps the streak's denormalized counters in step.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# guild_id; Expected Type: int - id of the guild
+# user_id; Expected Type: int - id of the user
+# timezone; Expected Type: str - timezone a new streak follows
+# today; Expected Type: datetime.date - the date the submission counts for
+# message_link; Expected Type: str - link to the message that shows the submission
+# @Returns:
+# the id of the streak the submission was added to
+"""
+def record_submission(session: Session, guild_id: int, user_id: int, timezone: str, today: datetime.date,
+                      message_link: str) -> int:
+    streak = session.scalar(queries.active_streak(guild_id, user_id))
+    # initialize the new art streak and flush it so it is assigned an id
+    if streak is None:
+        streak = ArtStreak(guild_id=guild_id, user_id=user_id, creation_date=today, timezone=timezone)
+        session.add(streak)
+        session.flush()
+    session.add(ArtStreakSubmission(art_streak_id=streak.id, creation_date=today, user_id=user_id,
+                                    message_link=message_link))
+    streak.submission_count = ArtStreak.submission_count + 1
+    streak.last_submission_date = today
+    session.flush()
+    return streak.id
+
+
+"""
+# Corrects the denormalized counters of every art streak that has drifted from the submissions table, see
+# 'streaks.find_counter_drift'.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# @Returns:
+# list of rows describing the corrected streaks and their counters before the correction
+"""
+def fix_counter_drift(session: Session) -> list:
+    return streaks.find_counter_drift(session, True)
+
+
+"""
+# Registers guilds the bot has joined. Guilds that are already registered are left alone, so a guild joined while the
+# startup reconciliation runs can't make it fail.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# guild_ids; Expected Type: [int] - ids of the guilds
+"""
+def register_guilds(session: Session, guild_ids: list):
+    if guild_ids:
+        session.execute(sqlite_insert(Guild).on_conflict_do_nothing(), [{"id": i} for i in guild_ids])
+
+
+"""
+# Removes guilds the bot has left, along with their art streaks, the streaks' submissions, the archived streaks and
+# submissions and the vc notif subscriptions. sqlite doesn't enforce the foreign keys, so the dependent rows are deleted
+# explicitly, children first.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# guild_ids; Expected Type: [int] - ids of the guilds
+"""
+def unregister_guilds(session: Session, guild_ids: list):
+    guild_ids = list(guild_ids)
+    for i in range(0, len(guild_ids), ID_CHUNK):
+        chunk = guild_ids[i:i + ID_CHUNK]
+        streakIds = select(ArtStreak.id).where(ArtStreak.guild_id.in_(chunk))
+        session.execute(delete(ArtStreakSubmission).where(ArtStreakSubmission.art_streak_id.in_(streakIds))
+                        .execution_options(synchronize_session=False))
+        session.execute(delete(ArtStreak).where(ArtStreak.guild_id.in_(chunk))
+                        .execution_options(synchronize_session=False))
+        archivedIds = select(ArchivedStreak.id).where(ArchivedStreak.guild_id.in_(chunk))
+        session.execute(delete(ArchivedSubmission).where(ArchivedSubmission.art_streak_id.in_(archivedIds))
+                        .execution_options(synchronize_session=False))
+        session.execute(delete(ArchivedStreak).where(ArchivedStreak.guild_id.in_(chunk))
+                        .execution_options(synchronize_session=False))
+        session.execute(delete(subscriber_association_table).where(subscriber_association_table.c.guild_id.in_(chunk)))
+        session.execute(delete(Guild).where(Guild.id.in_(chunk)).execution_options(synchronize_session=False))
+
+
+"""
+# Brings the registered guilds in line with the guilds the bot is connected to, as one set difference between both id
+# sets: guilds only the gateway knows are registered and guilds only the database knows are removed.
+# @Params:
+# session; Expected Type: sqlalchemy.orm.Session - the writer's session
+# gateway_ids; Expected Type: {int} - ids of the guilds the bot is connected to
+# shards; Expected Type: sharding.ShardSet - the shards the gateway ids come from, registered guilds on other shards
+#                                            belong to other processes and are left alone
+# @Returns:
+# tuple of a dict mapping every remaining guild's id to its art channel id (or None), the number of guilds registered
+# and the number of guilds removed
+"""
+def reconcile_guilds(session: Session, gateway_ids: set, shards) -> tuple[dict, int, int]:
+    artChannels = dict(session.execute(select(Guild.id, Guild.art_channel_id).where(shards.clause(Guild.id))).all())
+    missing = gateway_ids - artChannels.keys()
+    stale = artChannels.keys() - gateway_ids
+    register_guilds(session, sorted(missing))
+    unregister_guilds(session, sorted(stale))
+    for guildId in stale:
+        del artChannels[guildId]
+    artChannels.update(dict.fromkeys(missing))
+    return artChannels, len(missing), len(stale)